@@ -0,0 +1,348 @@
+"""\
+Benchmarks of the utility against synthetic models.
+
+The models are generated with a configurable number of components per
+document and a tree of imports of configurable depth and fan-out.  Each
+benchmark is run in its own process so that the peak memory reported is
+that of the benchmark alone, and the results can be saved as a baseline
+for later runs to be compared against.
+"""
+
+import json
+import multiprocessing
+import optparse
+import os
+import sys
+import tempfile
+import time
+from urlparse import urljoin
+
+from cellml.api.pmr2 import worker
+from cellml.api.pmr2.urlopener import DefaultURLOpener
+from cellml.api.pmr2.urlopener import WrappingURLOpener
+
+model_template = """\
+<?xml version="1.0" encoding="utf-8"?>
+<model xmlns="http://www.cellml.org/cellml/1.1#"
+       xmlns:xlink="http://www.w3.org/1999/xlink" name="%(name)s">
+%(imports)s%(components)s</model>
+"""
+
+import_template = """\
+  <import xlink:href="%(href)s">
+    <component name="%(name)s" component_ref="c0"/>
+  </import>
+"""
+
+component_template = """\
+  <component name="c%(index)d">
+    <variable name="time" units="dimensionless"/>
+    <variable name="k" units="dimensionless" initial_value="0.%(k)d"/>
+    <variable name="x" units="dimensionless" initial_value="1"/>
+    <math xmlns="http://www.w3.org/1998/Math/MathML">
+      <apply><eq/>
+        <apply><diff/><bvar><ci>time</ci></bvar><ci>x</ci></apply>
+        <apply><times/><apply><minus/><ci>k</ci></apply><ci>x</ci></apply>
+      </apply>
+    </math>
+  </component>
+"""
+
+# the metrics that are compared against a baseline, where a larger
+# value is a regression.
+compared_metrics = ('p50', 'p90', 'peak_rss')
+
+
+def generateModels(path, components=10, depth=0, fanout=1):
+    """\
+    Write a synthetic model with its tree of imports into the directory
+    at path, returning the file URL of the root model.
+
+    components - the number of components in every document.
+    depth - the number of levels of imports below the root model.
+    fanout - the number of imports of every document above the last
+             level.
+    """
+
+    def write(name, level):
+        imports = []
+        if level < depth:
+            for i in xrange(fanout):
+                child = '%s_%d' % (name, i)
+                write(child, level + 1)
+                imports.append(import_template % {
+                    'href': '%s.xml' % child,
+                    'name': 'import_%d' % i,
+                })
+        source = model_template % {
+            'name': name,
+            'imports': ''.join(imports),
+            'components': ''.join(component_template % {
+                'index': i, 'k': i % 9 + 1} for i in xrange(components)),
+        }
+        fd = open(os.path.join(path, '%s.xml' % name), 'wb')
+        try:
+            fd.write(source)
+        finally:
+            fd.close()
+
+    write('model', 0)
+    return urljoin('file://', os.path.join(os.path.abspath(path),
+        'model.xml'))
+
+
+class LatencyURLOpener(WrappingURLOpener):
+    """\
+    Wraps another opener, delaying every load by the specified number of
+    seconds to approximate remote locations.
+    """
+
+    def __init__(self, opener, latency=0.05):
+        WrappingURLOpener.__init__(self, opener)
+        self.latency = latency
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        time.sleep(self.latency)
+        return WrappingURLOpener.loadURL(self, location, headers, max_size,
+            timeout)
+
+
+def fileOpener():
+    """\
+    Return a DefaultURLOpener that also accepts local files.
+    """
+
+    opener = DefaultURLOpener()
+    opener.approved_protocol.append('file')
+    return opener
+
+
+def percentile(values, p):
+    """\
+    Return the p-th percentile of the values by linear interpolation.
+    """
+
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarise(timings, peak_rss=None):
+    """\
+    Return the summary of the list of timings, in seconds.
+    """
+
+    total = sum(timings)
+    result = {
+        'count': len(timings),
+        'total': total,
+        'throughput': None,
+        'mean': None,
+        'p50': percentile(timings, 50),
+        'p90': percentile(timings, 90),
+        'p99': percentile(timings, 99),
+        'max': None,
+        'peak_rss': peak_rss,
+    }
+    if timings:
+        result['mean'] = total / len(timings)
+        result['max'] = max(timings)
+    if total:
+        result['throughput'] = len(timings) / total
+    return result
+
+
+def timeCalls(func, iterations):
+    timings = []
+    for i in xrange(iterations):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return timings
+
+
+def runCase(case):
+    """\
+    Run a single benchmark, returning its name and summary.
+
+    case - tuple of the name of the benchmark, the URL of the model,
+           the number of iterations and the options of the run.
+    """
+
+    name, url, iterations, options = case
+    utility = worker.getUtility()
+    opener = fileOpener()
+
+    if name == 'loadModel':
+        func = lambda: utility.loadModel(url, opener)
+    elif name == 'loadModel:latency':
+        opener = LatencyURLOpener(opener, options.get('latency', 0.05))
+        workers = options.get('workers')
+        func = lambda: utility.loadModel(url, opener, workers)
+    else:
+        model = utility.loadModel(url, opener)
+        if name == 'validateModel':
+            func = lambda: utility.validateModel(model)
+        elif name == 'extractMaths':
+            func = lambda: utility.extractMaths(model)
+        elif name.startswith('exportCeleds:'):
+            language = name.split(':', 1)[1]
+            func = lambda: utility.exportCeleds(model, [language],
+                processes=1)
+        else:
+            raise ValueError('unknown benchmark `%s`' % name)
+
+    return name, summarise(timeCalls(func, iterations), worker.rss())
+
+
+def run(url, iterations=10, languages=None, latency=0.05, workers=None,
+        isolate=True):
+    """\
+    Run the benchmarks against the model at url, returning a dictionary
+    of the summaries by the name of the benchmark.
+
+    languages - the CeLEDS languages to benchmark the export of,
+                defaulting to all available languages.
+    latency - seconds of delay added to every load by the latency
+              benchmark of loadModel.
+    workers - the number of threads the latency benchmark fetches the
+              imports with.
+    isolate - run every benchmark in its own process.
+    """
+
+    if languages is None:
+        languages = worker.getUtility().availableCeledsExporter()
+    names = ['loadModel', 'loadModel:latency', 'validateModel',
+        'extractMaths'] + ['exportCeleds:%s' % l for l in languages]
+    options = {'latency': latency, 'workers': workers}
+
+    results = {}
+    for name in names:
+        case = (name, url, iterations, options)
+        if not isolate:
+            results[name] = runCase(case)[1]
+            continue
+        # a fresh process for every benchmark, so the peak memory is
+        # not carried over from the previous one.
+        pool = multiprocessing.Pool(1)
+        try:
+            results[name] = pool.apply(runCase, (case,))[1]
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    return results
+
+
+def saveBaseline(results, path):
+    fd = open(path, 'w')
+    try:
+        json.dump(results, fd, indent=2, sort_keys=True)
+    finally:
+        fd.close()
+
+
+def loadBaseline(path):
+    fd = open(path)
+    try:
+        return json.load(fd)
+    finally:
+        fd.close()
+
+
+def compareBaseline(results, baseline, tolerance=0.2):
+    """\
+    Return the list of regressions of the results against the baseline.
+
+    Each is a tuple of the name of the benchmark, the metric, the
+    baseline value and the current value, for every metric that is
+    larger than its baseline value by more than the tolerance ratio.
+    """
+
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for metric in compared_metrics:
+            old = baseline[name].get(metric)
+            new = results[name].get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def formatResults(results):
+    lines = ['%-24s %6s %10s %10s %10s %10s %8s' % ('benchmark', 'count',
+        'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'rss MB')]
+    ms = lambda v: v is not None and '%.2f' % (v * 1000) or '-'
+    for name in sorted(results):
+        r = results[name]
+        lines.append('%-24s %6d %10s %10s %10s %10s %8s' % (name,
+            r['count'],
+            r['throughput'] and '%.2f' % r['throughput'] or '-',
+            ms(r['p50']), ms(r['p90']), ms(r['p99']),
+            r['peak_rss'] and '%.1f' % (r['peak_rss'] / 1048576.0) or '-'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options]',
+        description='Benchmark the CellML API utility on synthetic models.')
+    parser.add_option('-c', '--components', type='int', default=10,
+        help='number of components in every document')
+    parser.add_option('-d', '--depth', type='int', default=2,
+        help='levels of imports below the root model')
+    parser.add_option('-f', '--fanout', type='int', default=2,
+        help='number of imports of every document')
+    parser.add_option('-n', '--iterations', type='int', default=10,
+        help='number of iterations of every benchmark')
+    parser.add_option('-l', '--language', action='append', dest='languages',
+        help='CeLEDS language to benchmark, may be repeated')
+    parser.add_option('--latency', type='float', default=0.05,
+        help='seconds of delay added to every load')
+    parser.add_option('--workers', type='int', default=None,
+        help='threads to fetch the imports with for the latency run')
+    parser.add_option('--save', metavar='PATH',
+        help='save the results as a baseline')
+    parser.add_option('--compare', metavar='PATH',
+        help='compare the results against a baseline')
+    parser.add_option('--tolerance', type='float', default=0.2,
+        help='ratio above the baseline reported as a regression')
+    options, args = parser.parse_args(argv)
+
+    path = tempfile.mkdtemp()
+    try:
+        url = generateModels(path, options.components, options.depth,
+            options.fanout)
+        results = run(url, options.iterations, options.languages,
+            options.latency, options.workers)
+    finally:
+        for name in os.listdir(path):
+            os.unlink(os.path.join(path, name))
+        os.rmdir(path)
+
+    print formatResults(results)
+
+    if options.save:
+        saveBaseline(results, options.save)
+
+    if options.compare:
+        regressions = compareBaseline(results, loadBaseline(options.compare),
+            options.tolerance)
+        for name, metric, old, new in regressions:
+            print 'regression: %s %s %.6g -> %.6g' % (name, metric, old, new)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,503 @@
+"""\
+Caching primitives.
+
+These are shared by the various caches within this package, and all of
+them are safe to be shared between threads.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from os.path import exists
+from os.path import join
+from tempfile import mkstemp
+
+_marker = object()
+
+
+def sizeOne(value):
+    return 1
+
+
+class LockedState(object):
+    """\
+    Base of the objects whose state is guarded by their _lock.
+
+    The lock is left out when they are pickled, along with any other
+    state that only has a meaning within the process as returned by
+    localState, such that they can be passed to other processes.
+    """
+
+    def localState(self):
+        """\
+        Return the values of the attributes within the pickled state.
+        """
+
+        return {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock', None)
+        state.update(self.localState())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        self._lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + 1)
+        finally:
+            self._lock.release()
+
+
+class LRUCache(LockedState):
+    """\
+    A size-bounded, least recently used cache.
+
+    max_size - the maximum total size of all values within the cache.
+    sizeof - function to calculate the size of a value; the default
+             counts each value as 1, which bounds the cache by the
+             number of entries.
+    """
+
+    def __init__(self, max_size, sizeof=None):
+        self.max_size = max_size
+        self.sizeof = sizeof or sizeOne
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            value = self._data.pop(key, _marker)
+            if value is _marker:
+                self.misses += 1
+                return default
+            # reinsert to mark it as the most recently used.
+            self._data[key] = value
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        self._lock.acquire()
+        try:
+            self._remove(key)
+            if size > self.max_size:
+                # would not fit at all.
+                return
+            self._data[key] = value
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._data)))
+        finally:
+            self._lock.release()
+
+    def _remove(self, key):
+        value = self._data.pop(key, _marker)
+        if value is not _marker:
+            self.size -= self.sizeof(value)
+
+    def invalidate(self, key):
+        self._lock.acquire()
+        try:
+            self._remove(key)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+            self.size = 0
+        finally:
+            self._lock.release()
+
+    def keys(self):
+        self._lock.acquire()
+        try:
+            return list(self._data.keys())
+        finally:
+            self._lock.release()
+
+
+class DiskStore(object):
+    """\
+    A directory based store of values with their associated metadata.
+
+    Every entry is stored as a single file named by the hash of its
+    key, containing a line of JSON encoded metadata followed by the raw
+    value.  Files are written to a temporary location then renamed so
+    that readers will never see partially written entries.
+
+    If max_size is specified, the least recently used entries are
+    removed once the total size of the entries exceeds it.  The total
+    is tracked by this instance only, so it is approximate when the
+    directory is shared with other processes.
+    """
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+        if not exists(path):
+            os.makedirs(path)
+        self._lock = threading.Lock()
+        self.size = sum(size for path, size, mtime in self._entries())
+
+    def _path(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf8')
+        return join(self.path, sha1(key).hexdigest())
+
+    def _entries(self):
+        for name in os.listdir(self.path):
+            # skip the temporary files.
+            if len(name) != 40:
+                continue
+            path = join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+    def _size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def get(self, key):
+        """\
+        Return the tuple of value and metadata, or None if not stored.
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fd:
+                meta = json.loads(fd.readline())
+                value = fd.read()
+            if self.max_size is not None:
+                # mark as recently used.
+                os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return value, meta
+
+    def set(self, key, value, meta=None):
+        path = self._path(key)
+        fd, tmp = mkstemp(dir=self.path)
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(json.dumps(meta or {}) + '\n')
+            stream.write(value)
+        self._lock.acquire()
+        try:
+            self.size -= self._size(path)
+            os.rename(tmp, path)
+            self.size += self._size(path)
+            if self.max_size is not None and self.size > self.max_size:
+                self._evict()
+        finally:
+            self._lock.release()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self.size = sum(size for path, size, mtime in entries)
+        for path, size, mtime in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def invalidate(self, key):
+        path = self._path(key)
+        self._lock.acquire()
+        try:
+            size = self._size(path)
+            os.remove(path)
+            self.size -= size
+        except OSError:
+            pass
+        finally:
+            self._lock.release()
+
+
+class SnapshotStore(object):
+    """\
+    A content addressed directory of model snapshots, which may be
+    shared by any number of processes and hosts.
+
+    Every snapshot is stored under the hash of its content, so it is
+    never written twice and never changes once written, with the names
+    (such as the location of the model) tagged to the hash of the most
+    recent snapshot.  All files are written to a temporary location then
+    renamed like DiskStore.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for name in ('objects', 'refs'):
+            if not exists(join(path, name)):
+                try:
+                    os.makedirs(join(path, name))
+                except OSError:
+                    # created by another process in the meantime.
+                    if not exists(join(path, name)):
+                        raise
+
+    def _object(self, digest):
+        return join(self.path, 'objects', digest[:2], digest[2:])
+
+    def _ref(self, name):
+        if isinstance(name, unicode):
+            name = name.encode('utf8')
+        return join(self.path, 'refs', sha1(name).hexdigest())
+
+    def _write(self, path, data):
+        dirname = os.path.dirname(path)
+        if not exists(dirname):
+            try:
+                os.mkdir(dirname)
+            except OSError:
+                if not exists(dirname):
+                    raise
+        fd, tmp = mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(data)
+        os.rename(tmp, path)
+
+    def put(self, data):
+        """\
+        Store the snapshot, returning its digest.
+        """
+
+        if isinstance(data, unicode):
+            data = data.encode('utf8')
+        digest = sha1(data).hexdigest()
+        path = self._object(digest)
+        if not exists(path):
+            self._write(path, data)
+        return digest
+
+    def get(self, digest):
+        """\
+        Return the snapshot with the digest, or None if not stored or if
+        it is corrupted.
+        """
+
+        if len(digest) != 40:
+            return None
+        try:
+            with open(self._object(digest), 'rb') as fd:
+                data = fd.read()
+        except (IOError, OSError):
+            return None
+        if sha1(data).hexdigest() != digest:
+            return None
+        return data
+
+    def tag(self, name, digest):
+        """\
+        Tag the name to the snapshot with the digest.
+        """
+
+        self._write(self._ref(name), digest)
+
+    def lookup(self, name):
+        """\
+        Return the digest tagged to the name, or None.
+        """
+
+        try:
+            with open(self._ref(name), 'rb') as fd:
+                return fd.read().strip() or None
+        except (IOError, OSError):
+            return None
+
+
+class CodeCache(LockedState):
+    """\
+    Persistent cache of the code generated by the CeLEDS exporters.
+
+    Entries are keyed by the digest of the fully resolved model, the
+    language and the digest of its CeLEDS definition file.
+
+    path - directory to store the generated code in.
+    max_size - the maximum total size of the stored code in bytes.
+    """
+
+    def __init__(self, path, max_size=None):
+        self.store = DiskStore(path, max_size)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, model_digest, language, definition_digest):
+        return '\n'.join((model_digest, language, definition_digest))
+
+    def get(self, key):
+        """\
+        Return the cached code for the key, or None.
+        """
+
+        stored = self.store.get(key)
+        if stored is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        code, meta = stored
+        if meta.get('unicode'):
+            code = code.decode('utf8')
+        return code
+
+    def set(self, key, code):
+        if isinstance(code, unicode):
+            self.store.set(key, code.encode('utf8'), {'unicode': True})
+        else:
+            self.store.set(key, code)
+
+    def invalidate(self, key):
+        self.store.invalidate(key)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': self.store.size,
+        }
+
+
+class ModelCache(LockedState):
+    """\
+    Cache of loaded models.
+
+    Entries are keyed by the canonical URL of the root document, and
+    hold the manifest of the digests of every document that the model
+    was loaded from.  A cached model is only returned if the caller can
+    verify that the manifest still matches the current documents.
+
+    Cached models are shared by all callers; if a copy function is
+    provided, it will be applied to the model that is handed out.  As
+    models must not be used by multiple threads at once, a copy function
+    should be provided if the cache is used by multiple threads.
+
+    If incremental, a cached model whose manifest no longer matches is
+    refreshed in place rather than dropped, which is best combined with
+    a copy function as the models already handed out will change too.
+
+    max_entries - the maximum number of models held.
+    copy - function that returns a copy of the cached model.
+    incremental - refresh the stale models rather than dropping them.
+    """
+
+    def __init__(self, max_entries=32, copy=None, incremental=False):
+        self.entries = LRUCache(max_entries)
+        self.copy = copy
+        self.incremental = incremental
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.refreshed = 0
+        self._lock = threading.Lock()
+        # held while the cached models are refreshed or copied.
+        self._model_lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _result(self, model):
+        if self.copy is None:
+            return model
+        self._model_lock.acquire()
+        try:
+            return self.copy(model)
+        finally:
+            self._model_lock.release()
+
+    def lookup(self, key, validate, refresh=None):
+        """\
+        Return the model cached for the key, provided that the validate
+        function returns True for its manifest, or None.
+
+        refresh - if this cache is incremental, the function called with
+                  the manifest and the model that failed validation to
+                  update the model in place, returning the new manifest
+                  or None if the model could not be refreshed.  Should
+                  it raise, the model is no longer cached.
+        """
+
+        entry = self.entries.get(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        manifest, model = entry
+        if validate(manifest):
+            self._count('hits')
+            return self._result(model)
+
+        if self.incremental and refresh is not None:
+            self._model_lock.acquire()
+            try:
+                manifest = refresh(manifest, model)
+            except:
+                # the model may not be whole anymore.
+                self.entries.invalidate(key)
+                raise
+            finally:
+                self._model_lock.release()
+            if manifest is not None:
+                self._count('refreshed')
+                self.entries.set(key, (manifest, model))
+                return self._result(model)
+
+        self._count('stale')
+        self.entries.invalidate(key)
+        return None
+
+    def store(self, key, manifest, model):
+        """\
+        Cache the model with its manifest, and return the model that
+        should be handed out.
+        """
+
+        self.entries.set(key, (manifest, model))
+        return self._result(model)
+
+    def invalidate(self, key=None):
+        """\
+        Remove the model cached for the key, or all models if no key is
+        specified.
+        """
+
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.invalidate(key)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'refreshed': self.refreshed,
+            'entries': len(self.entries),
+        }
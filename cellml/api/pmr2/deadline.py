@@ -0,0 +1,63 @@
+"""\
+Deadlines of the calls to the utility.
+
+A deadline is a point in time rather than a duration, so a single one
+can be passed to a series of calls (such as the loading, validation and
+export of a model) to bound all of them together.
+"""
+
+import time
+
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+
+
+class Deadline(object):
+    """\
+    The point in time by which the calls it is passed to must complete.
+
+    timeout - the number of seconds from now.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires = time.time() + timeout
+
+    def __repr__(self):
+        return '<Deadline of %gs, %.3fs remaining>' % (self.timeout,
+            self.remaining())
+
+    def remaining(self):
+        """\
+        Return the number of seconds remaining, which is never negative.
+        """
+
+        return max(self.expires - time.time(), 0)
+
+    def expired(self):
+        return time.time() >= self.expires
+
+    def check(self, what, partial=None):
+        """\
+        Raise DeadlineExceededError for what was being done if this has
+        expired, with the partial result attached.
+        """
+
+        if self.expired():
+            raise self.error(what, partial)
+
+    def error(self, what, partial=None):
+        e = DeadlineExceededError('%s exceeded the deadline of %g seconds' % (
+            what, self.timeout))
+        e.partial = partial
+        return e
+
+
+def asDeadline(deadline):
+    """\
+    Return the deadline, which may be specified as the number of seconds
+    from now, or None if there is none.
+    """
+
+    if deadline is None or isinstance(deadline, Deadline):
+        return deadline
+    return Deadline(deadline)
@@ -0,0 +1,214 @@
+"""\
+A persistent index of the imports between the models of a corpus.
+
+The imports are read from the xlink:href attributes of the documents
+without loading them through the CellML API, and are resolved to the
+canonical locations like loadModel does, so the index can answer which
+documents a model depends on and which models depend on a document.
+"""
+
+import sqlite3
+import threading
+import time
+import urllib2
+
+from cellml.api.pmr2.interfaces import IURLOpener
+from cellml.api.pmr2.interfaces import ResourceLimitExceededError
+from cellml.api.pmr2.interfaces import UnapprovedProtocolError
+from cellml.api.pmr2.ingest import decodeSource
+from cellml.api.pmr2.pool import createPool
+from cellml.api.pmr2.resolver import baseURL
+from cellml.api.pmr2.resolver import extractImports
+from cellml.api.pmr2.resolver import sourceDigest
+
+schema = (
+    'CREATE TABLE IF NOT EXISTS documents ('
+        'url TEXT PRIMARY KEY, digest TEXT, indexed REAL)',
+    'CREATE TABLE IF NOT EXISTS edges ('
+        'source TEXT, target TEXT, PRIMARY KEY (source, target))',
+    'CREATE INDEX IF NOT EXISTS edges_target ON edges (target)',
+)
+
+forward_query = '''
+    WITH RECURSIVE deps(url) AS (
+        SELECT target FROM edges WHERE source = ?
+        UNION
+        SELECT edges.target FROM edges JOIN deps ON edges.source = deps.url
+    ) SELECT url FROM deps ORDER BY url
+'''
+
+reverse_query = '''
+    WITH RECURSIVE deps(url) AS (
+        SELECT source FROM edges WHERE target = ?
+        UNION
+        SELECT edges.source FROM edges JOIN deps ON edges.target = deps.url
+    ) SELECT url FROM deps ORDER BY url
+'''
+
+
+class DependencyIndex(object):
+    """\
+    Index of the imports between documents, stored in SQLite.
+
+    Every indexed document is recorded with the digest of its source,
+    such that updating the index only parses the documents that have
+    changed since.  Documents that failed to be fetched are recorded
+    without a digest.  All locations are canonicalised by the loader
+    they were indexed with, and the queries expect the same.
+
+    path - the path to the database, which is created if needed; the
+           default keeps the index in memory only.
+    workers - the number of threads to fetch the documents with.
+    """
+
+    def __init__(self, path=':memory:', workers=None):
+        self.path = path
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        for statement in schema:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def _execute(self, query, *a):
+        self._lock.acquire()
+        try:
+            return self._conn.execute(query, a).fetchall()
+        finally:
+            self._lock.release()
+
+    def _fetch(self, loader, url):
+        try:
+            return loader(url)
+        except (urllib2.URLError, UnapprovedProtocolError,
+                ResourceLimitExceededError):
+            return None
+
+    def _targets(self, loader, url, source):
+        base, hrefs = extractImports(source)
+        base_url = baseURL(loader, url, base)
+        return set(loader.canonicalURL(loader.urljoin(base_url, href))
+            for href in hrefs)
+
+    def _store(self, url, digest, targets):
+        self._lock.acquire()
+        try:
+            conn = self._conn
+            conn.execute('DELETE FROM edges WHERE source = ?', (url,))
+            conn.executemany('INSERT INTO edges VALUES (?, ?)',
+                [(url, target) for target in sorted(targets)])
+            conn.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?)',
+                (url, digest, time.time()))
+            conn.commit()
+        finally:
+            self._lock.release()
+
+    def update(self, url, loader, recursive=True):
+        """\
+        Index the document at url, and every document it imports if
+        recursive, returning the sorted list of the locations whose
+        imports were parsed again as they have changed.
+
+        loader - the IURLOpener to fetch the documents with.
+        """
+
+        assert IURLOpener.providedBy(loader)
+        pool = createPool(self.workers)
+        changed = []
+        try:
+            seen = set([loader.canonicalURL(url)])
+            frontier = list(seen)
+            while frontier:
+                pending = [(u, pool.submit(self._fetch, loader, u))
+                    for u in frontier]
+                frontier = []
+                for current, future in pending:
+                    raw = future.result()
+                    if raw is None:
+                        self._store(current, None, self.imports(current))
+                        continue
+                    source = decodeSource(raw, current)
+                    digest = sourceDigest(source)
+                    if digest != self.digest(current):
+                        self._store(current, digest,
+                            self._targets(loader, current, source))
+                        changed.append(current)
+                    if not recursive:
+                        continue
+                    for target in self.imports(current):
+                        if target not in seen:
+                            seen.add(target)
+                            frontier.append(target)
+        finally:
+            pool.shutdown()
+        return sorted(changed)
+
+    def remove(self, url):
+        """\
+        Remove the document at url and its imports from the index.
+        """
+
+        self._lock.acquire()
+        try:
+            self._conn.execute('DELETE FROM edges WHERE source = ?', (url,))
+            self._conn.execute('DELETE FROM documents WHERE url = ?', (url,))
+            self._conn.commit()
+        finally:
+            self._lock.release()
+
+    def digest(self, url):
+        """\
+        Return the digest of the indexed document at url, or None.
+        """
+
+        rows = self._execute('SELECT digest FROM documents WHERE url = ?',
+            url)
+        return rows and rows[0][0] or None
+
+    def documents(self):
+        """\
+        Return the sorted list of the indexed locations.
+        """
+
+        return [r[0] for r in self._execute(
+            'SELECT url FROM documents ORDER BY url')]
+
+    def imports(self, url):
+        """\
+        Return the sorted list of the locations imported by url.
+        """
+
+        return [r[0] for r in self._execute(
+            'SELECT target FROM edges WHERE source = ? ORDER BY target', url)]
+
+    def importers(self, url):
+        """\
+        Return the sorted list of the locations that import url.
+        """
+
+        return [r[0] for r in self._execute(
+            'SELECT source FROM edges WHERE target = ? ORDER BY source', url)]
+
+    def dependencies(self, url):
+        """\
+        Return the sorted list of the locations url depends on through
+        its imports, directly or indirectly.
+        """
+
+        return [r[0] for r in self._execute(forward_query, url)]
+
+    def dependents(self, url):
+        """\
+        Return the sorted list of the locations that depend on url
+        through their imports, directly or indirectly, such as the
+        models to validate again once url has changed.
+        """
+
+        return [r[0] for r in self._execute(reverse_query, url)]
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            self._conn.close()
+        finally:
+            self._lock.release()
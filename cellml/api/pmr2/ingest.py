@@ -0,0 +1,76 @@
+"""\
+Ingestion of the raw documents fetched by the URL openers.
+
+The encoding of a document is determined from its byte order mark and
+its XML declaration, without building a tree out of the document.
+"""
+
+import codecs
+import re
+
+from cellml.api.pmr2 import instrument
+
+boms = (
+    # the UTF-32 marks must be checked before the UTF-16 ones as they
+    # share the same prefix.
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# signatures of the start of the XML declaration without a BOM.
+signatures = (
+    ('<\x00?\x00', 'utf-16-le'),
+    ('\x00<\x00?', 'utf-16-be'),
+)
+
+re_xmldecl = re.compile(
+    r'^\s*<\?xml[^>]*?\sencoding\s*=\s*["\']([A-Za-z][\w.\-]*)["\']')
+
+default_encoding = 'utf-8'
+fallback_encoding = 'iso-8859-1'
+
+
+def detectEncoding(raw):
+    """\
+    Return the name of the encoding of the raw document.
+    """
+
+    for bom, encoding in boms:
+        if raw.startswith(bom):
+            return encoding
+
+    for signature, encoding in signatures:
+        if raw.startswith(signature):
+            return encoding
+
+    # the declaration can only be at the very start of the document.
+    match = re_xmldecl.match(raw[:1024])
+    if match:
+        return match.group(1).lower()
+
+    return default_encoding
+
+
+def decodeSource(raw, url=None):
+    """\
+    Decode the raw document into unicode.
+
+    Documents that cannot be decoded with the detected encoding are
+    decoded as ISO-8859-1, which covers the entire range of bytes.
+
+    url - the location of the document, for the instrumentation.
+    """
+
+    if isinstance(raw, unicode):
+        return raw
+
+    started = instrument.start()
+    try:
+        source = raw.decode(detectEncoding(raw))
+    except (UnicodeDecodeError, LookupError):
+        source = raw.decode(fallback_encoding)
+    instrument.record('decode', started, url, len(raw))
+    return source
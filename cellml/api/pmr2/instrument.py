@@ -0,0 +1,134 @@
+"""\
+Instrumentation of the phases of the work done by the utility and the
+openers.
+
+The phases are timed and notified as IPhaseEvent through zope.event,
+but only if there are any subscribers registered with zope.event, such
+that the overhead is limited to checking the list of the subscribers
+when nothing is listening.
+"""
+
+import bisect
+import threading
+import time
+
+import zope.event
+import zope.interface
+
+from cellml.api.pmr2.interfaces import IPhaseEvent
+
+# the upper bounds of the buckets of the histograms, in seconds.
+default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+class PhaseEvent(object):
+
+    zope.interface.implements(IPhaseEvent)
+
+    def __init__(self, phase, duration, url=None, size=None, language=None):
+        self.phase = phase
+        self.duration = duration
+        self.url = url
+        self.size = size
+        self.language = language
+
+    def __repr__(self):
+        return '<PhaseEvent %s %.6fs %r>' % (self.phase, self.duration,
+            self.url or self.language)
+
+
+def start():
+    """\
+    Return the start time of a phase, or None if there are no
+    subscribers to be notified of it.
+    """
+
+    if zope.event.subscribers:
+        return time.time()
+    return None
+
+
+def record(phase, started, url=None, size=None, language=None):
+    """\
+    Notify the completion of the phase started at the time returned by
+    start, doing nothing if it returned None.
+    """
+
+    if started is None:
+        return
+    if not isinstance(url, basestring):
+        # streams and other objects are not identified.
+        url = None
+    zope.event.notify(PhaseEvent(phase, time.time() - started, url, size,
+        language))
+
+
+class PhaseStatistics(object):
+    """\
+    Aggregates the phase events into counts, totals and histograms of
+    the durations for each phase.
+
+    Instances are zope.event subscribers; register them with subscribe
+    and read the aggregates with snapshot.
+
+    buckets - the sorted upper bounds of the buckets of the histograms
+              in seconds; an extra bucket holds the longer durations.
+    """
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __call__(self, event):
+        if not IPhaseEvent.providedBy(event):
+            return
+        index = bisect.bisect_left(self.buckets, event.duration)
+        self._lock.acquire()
+        try:
+            stats = self._phases.get(event.phase)
+            if stats is None:
+                stats = self._phases[event.phase] = {
+                    'count': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    'size': 0,
+                    'histogram': [0] * (len(self.buckets) + 1),
+                }
+            stats['count'] += 1
+            stats['total'] += event.duration
+            stats['max'] = max(stats['max'], event.duration)
+            stats['size'] += event.size or 0
+            stats['histogram'][index] += 1
+        finally:
+            self._lock.release()
+
+    def subscribe(self):
+        if self not in zope.event.subscribers:
+            zope.event.subscribers.append(self)
+
+    def unsubscribe(self):
+        if self in zope.event.subscribers:
+            zope.event.subscribers.remove(self)
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._phases = {}
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """\
+        Return a copy of the aggregates as a dictionary of the phases,
+        each with the count, the total and maximum durations, the total
+        size and the histogram as a list of the counts in each bucket.
+        """
+
+        self._lock.acquire()
+        try:
+            return dict((phase, dict(stats, histogram=list(
+                stats['histogram']))) for phase, stats in
+                self._phases.items())
+        finally:
+            self._lock.release()
@@ -1,3 +1,5 @@
+import urllib2
+
 import zope.interface
 import zope.schema
 
@@ -8,6 +10,47 @@ class UnapprovedProtocolError(ValueError):
     """
 
 
+class ResourceLimitExceededError(ValueError):
+    """\
+    resource limit of a load was exceeded.
+    """
+
+
+class CircuitOpenError(urllib2.URLError):
+    """\
+    host failed repeatedly and is not requested until it is probed.
+    """
+
+
+class DeadlineExceededError(ValueError):
+    """\
+    deadline of a call was exceeded.
+
+    The partial attribute holds whatever was completed by the call, if
+    anything.
+    """
+
+    partial = None
+
+
+class WorkerError(RuntimeError):
+    """\
+    worker process failed to complete a job.
+    """
+
+
+class WorkerTimeoutError(WorkerError):
+    """\
+    worker process did not complete a job in time.
+    """
+
+
+class WorkerCrashError(WorkerError):
+    """\
+    worker process terminated while processing a job.
+    """
+
+
 class ICellMLAPIUtility(zope.interface.Interface):
 
     celeds_exporter = zope.schema.Dict(
@@ -19,17 +62,131 @@ class ICellMLAPIUtility(zope.interface.Interface):
         required=False,
     )
 
+    load_workers = zope.schema.Int(
+        title=u'Load Workers',
+        description=u'The default number of threads used to fetch the '
+                     'imports of a model concurrently.  Values below 2 '
+                     'will fetch the imports serially.',
+        default=1,
+        min=0,
+        required=False,
+    )
+
+    export_processes = zope.schema.Int(
+        title=u'Export Processes',
+        description=u'The default number of worker processes used to '
+                     'export a model to multiple CeLEDS languages.  '
+                     'Values below 2 will export within this process.',
+        default=1,
+        min=0,
+        required=False,
+    )
+
+    max_document_size = zope.schema.Int(
+        title=u'Maximum Document Size',
+        description=u'The maximum size in bytes of any document fetched '
+                     'by loadModel.  No limit if unset.',
+        min=0,
+        required=False,
+    )
+
+    max_total_size = zope.schema.Int(
+        title=u'Maximum Total Size',
+        description=u'The maximum number of bytes of all the documents '
+                     'fetched by a single loadModel.  No limit if unset.',
+        min=0,
+        required=False,
+    )
+
+    max_imports = zope.schema.Int(
+        title=u'Maximum Imports',
+        description=u'The maximum number of imports followed by a single '
+                     'loadModel.  No limit if unset.',
+        min=0,
+        required=False,
+    )
+
+    max_import_depth = zope.schema.Int(
+        title=u'Maximum Import Depth',
+        description=u'The maximum depth of the imports followed by '
+                     'loadModel, where the imports of the model itself '
+                     'are at a depth of 1.  No limit if unset.',
+        min=0,
+        required=False,
+    )
+
+    model_cache = zope.interface.Attribute(
+        'The optional ModelCache used by loadModel.')
+
+    code_cache = zope.interface.Attribute(
+        'The optional CodeCache used by exportCeleds.')
+
+    celeds_definitions = zope.schema.Dict(
+        title=u'CeLEDS definitions',
+        description=u'Dictionary of the paths to the CeLEDS definition '
+                     'files of the available exporters',
+        key_type=zope.schema.ASCIILine(title=u'Language'),
+        required=False,
+    )
+
     def availableCeledsExporter():
         """\
         The list of available CeLEDS exporter.
         """
 
-    def loadModel(model_url, opener=None):
+    def getCeledsExporter(key):
+        """\
+        Return the CeLEDS exporter for the language, instantiated on
+        first use.
+        """
+
+    def registerCeledsDefinition(key, path):
+        """\
+        Register the CeLEDS definition file at path for the language.
+        """
+
+    def registerCeledsDefinitions(path):
+        """\
+        Register all CeLEDS definition files within a directory.
+        """
+
+    def loadModel(model_url, opener=None, workers=None, report=None,
+            deadline=None):
         """\
         Loads a model from the given url.
 
         model_url - URL of the model
         opener - callable function that can load the desired url.
+        workers - number of threads to fetch the imports with.
+        report - a LoadReport to record the skipped imports in.
+        deadline - a Deadline or the number of seconds the load must be
+                   completed within.
+        """
+
+    def loadModelAsync(model_url, opener=None, report=None,
+            deadline=None):
+        """\
+        Start loading a model from the given url with an asynchronous
+        opener, returning a future of the model.
+        """
+
+    def loadModelFromText(source, base_url=None, opener=None,
+            workers=None, report=None, deadline=None):
+        """\
+        Loads a model from its source, resolving its imports relative
+        to its xml:base or the base_url.
+        """
+
+    def reloadModel(model, model_url, changed, opener=None, workers=None,
+            report=None, deadline=None):
+        """\
+        Reload the imports of a model loaded from the given url that
+        reference any of the changed documents, returning the model.
+        """
+
+    def invalidateModel(model_url, opener=None):
+        """\
+        Remove the model loaded from the url from the model cache.
         """
 
     def serialiseNode(node):
@@ -37,18 +194,67 @@ class ICellMLAPIUtility(zope.interface.Interface):
         Serialise a node.
         """
 
-    def extractMaths(model):
+    def extractMaths(model, deadline=None):
         """\
         Extract and serialize the maths into a list of tuples for ease
         of presentation in the MathML viewer.
         """
 
-    def exportCeleds(model, language=None):
+    def dumpModelTree(model):
+        """\
+        Serialise the model and all its instantiated imports into a
+        list of tuples of import path and serialised model.
+        """
+
+    def loadModelTree(tree):
+        """\
+        Load a model from the output of dumpModelTree.
+        """
+
+    def snapshotModel(model, model_url=None, opener=None):
+        """\
+        Serialise a model with its imports into a single self-contained
+        snapshot document.
+        """
+
+    def loadSnapshot(snapshot):
+        """\
+        Load a model from a snapshot without any import resolution.
+        """
+
+    def iterExportCeleds(model, language=None, processes=None,
+            deadline=None):
+        """\
+        Generator version of exportCeleds, yielding tuples of language
+        and code as each language is completed.
+        """
+
+    def exportCeleds(model, language=None, processes=None,
+            deadline=None):
         """\
         Run the model through one or all of the available CeLEDS 
         Exporter.
         """
 
+    def iterValidateModel(model, max_errors=None, errors_only=False,
+            deadline=None):
+        """\
+        Validate the model, yielding the errors as they are processed.
+        """
+
+    def validateModel(model, max_errors=None, errors_only=False,
+            deadline=None):
+        """\
+        Validate the model, returning the list of error messages.
+        """
+
+    def validateModels(items, opener=None, processes=None,
+            deadline=None):
+        """\
+        Load and validate a batch of models from their urls or sources
+        in worker processes, yielding the results as they complete.
+        """
+
 
 class IURLOpener(zope.interface.Interface):
     """\
@@ -73,11 +279,61 @@ class IURLOpener(zope.interface.Interface):
         Validate the location to check if URL is allowed to be opened.
         """
 
-    def loadURL(location, headers=None):
+    def canonicalURL(location):
+        """\
+        Return the canonical form of the location, such that locations
+        referencing the same document compare equal.
+        """
+
+    def loadURL(location, headers=None, max_size=None, timeout=None):
         """\
         The method that opens the URL and return the contents as a 
         string.
 
         location - the location to open
         headers - a list of key/value pairs of the headers to add.
+        max_size - if specified, ResourceLimitExceededError is raised
+                   once more than this number of bytes is read.  Only
+                   passed by the callable when a limit applies.
+        timeout - if specified, the number of seconds to wait on the
+                  remote location at any one time.  Only passed by the
+                  callable when a deadline applies.
+        """
+
+
+class IAsyncURLOpener(IURLOpener):
+    """\
+    Interface for the URL Opener that can load URLs without blocking.
+    """
+
+    def loadURLAsync(location, max_size=None, timeout=None):
+        """\
+        Validate the protocol of the location and start loading it,
+        returning a future of the contents.  The future provides the
+        result and add_done_callback methods.
+
+        max_size, timeout - as for loadURL.
         """
+
+
+class IPhaseEvent(zope.interface.Interface):
+    """\
+    Event notified through zope.event once a phase of the work done by
+    the utility or the openers is completed.
+    """
+
+    phase = zope.interface.Attribute(
+        'The name of the phase, such as fetch, decode, parse, '
+        'instantiate, load, validate, maths or export.')
+
+    duration = zope.interface.Attribute(
+        'The time spent on the phase, in seconds.')
+
+    url = zope.interface.Attribute(
+        'The location the phase was done for, if any.')
+
+    size = zope.interface.Attribute(
+        'The size of the document processed by the phase, if known.')
+
+    language = zope.interface.Attribute(
+        'The CeLEDS language of the export phase.')
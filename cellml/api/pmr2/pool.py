@@ -0,0 +1,195 @@
+"""\
+Minimal future and thread pool primitives.
+
+The CellML API is not reentrant, so only the blocking I/O (fetching of
+the documents) is dispatched to the worker threads, while the results
+are collected by the calling thread through the futures.
+"""
+
+import sys
+import threading
+from Queue import Queue
+
+
+class Future(object):
+    """\
+    The pending result of a call submitted to a pool.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._event.is_set()
+
+    def _complete(self):
+        self._lock.acquire()
+        try:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._complete()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._complete()
+
+    def add_done_callback(self, callback):
+        """\
+        Call the callback with this future once it is done, within the
+        thread that completes it, or immediately if it is done already.
+        """
+
+        self._lock.acquire()
+        try:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+
+    def then(self, func):
+        """\
+        Return a future of the result of func applied to the result of
+        this future, computed by the thread that completes this future.
+        """
+
+        future = Future()
+
+        def callback(done):
+            future.run(lambda: func(done.result()), (), {})
+
+        self.add_done_callback(callback)
+        return future
+
+    def run(self, func, a, kw):
+        try:
+            result = func(*a, **kw)
+        except:
+            self.set_exc_info(sys.exc_info())
+        else:
+            self.set_result(result)
+
+    def wait(self, timeout=None):
+        """\
+        Wait up to timeout seconds for the call to be done, returning
+        whether it is done.
+        """
+
+        return self._event.wait(timeout)
+
+    def result(self):
+        """\
+        Wait for and return the result, or raise the exception that
+        was raised by the call.
+        """
+
+        self._event.wait()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class DeferredFuture(Future):
+    """\
+    A future that only runs its call when the result is requested,
+    within the thread that requested it.
+    """
+
+    def __init__(self, func, a, kw):
+        Future.__init__(self)
+        self._call = (func, a, kw)
+
+    def wait(self, timeout=None):
+        if not self.done():
+            self.run(*self._call)
+        return True
+
+    def result(self):
+        self.wait()
+        return Future.result(self)
+
+
+class InlinePool(object):
+    """\
+    Pool that does not use any threads; calls are deferred until their
+    results are requested.
+    """
+
+    def submit(self, func, *a, **kw):
+        return DeferredFuture(func, a, kw)
+
+    def shutdown(self):
+        pass
+
+
+class ThreadPool(object):
+    """\
+    A bounded pool of daemon worker threads.
+
+    Threads are started as needed, up to the specified size.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, func, a, kw = item
+            future.run(func, a, kw)
+
+    def submit(self, func, *a, **kw):
+        future = Future()
+        self._queue.put((future, func, a, kw))
+        self._lock.acquire()
+        try:
+            if len(self._threads) < self.size:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+        finally:
+            self._lock.release()
+        return future
+
+    def shutdown(self):
+        """\
+        Stop the worker threads once the submitted calls are done.
+        """
+
+        self._lock.acquire()
+        try:
+            for thread in self._threads:
+                self._queue.put(None)
+            self._threads = []
+        finally:
+            self._lock.release()
+
+
+def createPool(workers):
+    """\
+    Return a pool suitable for the number of workers; anything below
+    two will result in a pool that runs everything in the calling
+    thread.
+    """
+
+    if not workers or workers < 2:
+        return InlinePool()
+    return ThreadPool(workers)
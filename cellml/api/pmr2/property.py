@@ -1,10 +1,17 @@
 # perhaps we could inherit from property instead of object?
-# Obvious none of this is considered thread-safe.
+# The first results are computed under a lock held by the decorator
+# instance, with the cached results checked again once the lock is
+# acquired, so that the property method is only ever called once for
+# each cached result even if accessed by multiple threads.
+
+import threading
+
 
 class base_property(object):
 
     def __init__(self, method):
         self.method = method
+        self.lock = threading.RLock()
 
     @property
     def name(self):
@@ -28,8 +35,14 @@ class instance_property(base_property):
         name = self.name
         result = getattr(obj, name, None)
         if result is None:
-            result = self.method(obj)
-            setattr(obj, name, result)
+            self.lock.acquire()
+            try:
+                result = getattr(obj, name, None)
+                if result is None:
+                    result = self.method(obj)
+                    setattr(obj, name, result)
+            finally:
+                self.lock.release()
         return result
 
     def __delete__(self, obj):
@@ -38,10 +51,14 @@ class instance_property(base_property):
         """
         
         name = self.name
-        result = getattr(obj, name, None)
-        if result is None:
-            return
-        delattr(obj, name)
+        self.lock.acquire()
+        try:
+            result = getattr(obj, name, None)
+            if result is None:
+                return
+            delattr(obj, name)
+        finally:
+            self.lock.release()
 
 
 class singleton_property(base_property):
@@ -64,8 +81,14 @@ class singleton_property(base_property):
         name = self.name
         result = getattr(self, name, None)
         if result is None:
-            result = self.method(obj)
-            setattr(self, name, result)
+            self.lock.acquire()
+            try:
+                result = getattr(self, name, None)
+                if result is None:
+                    result = self.method(obj)
+                    setattr(self, name, result)
+            finally:
+                self.lock.release()
         return result
 
     def __delete__(self, obj):
@@ -74,7 +97,56 @@ class singleton_property(base_property):
         """
         
         name = self.name
-        result = getattr(self, name, None)
+        self.lock.acquire()
+        try:
+            result = getattr(self, name, None)
+            if result is None:
+                return
+            delattr(self, name)
+        finally:
+            self.lock.release()
+
+
+class threadlocal_property(base_property):
+    """\
+    Property decorator that automate caching of the first result within
+    each thread in this decorator instance.
+
+    This is similar to the singleton_property, except that every thread
+    will have its own instance of the property, which is shared across
+    all instances of the object within that thread.  This is for the
+    objects that must not be used by multiple threads at once.
+    """
+
+    def __init__(self, method):
+        base_property.__init__(self, method)
+        self.local = threading.local()
+
+    def __get__(self, obj, objtype):
+        """\
+        Return the result cached for the current thread.
+        """
+
+        name = self.name
+        result = getattr(self.local, name, None)
+        if result is None:
+            # only this thread may assign to its local, but the lock
+            # is held so the instances are created one at a time.
+            self.lock.acquire()
+            try:
+                result = self.method(obj)
+                setattr(self.local, name, result)
+            finally:
+                self.lock.release()
+        return result
+
+    def __delete__(self, obj):
+        """\
+        Delete the property for the current thread.
+        """
+
+        name = self.name
+        result = getattr(self.local, name, None)
         if result is None:
             return
-        delattr(self, name)
+        delattr(self.local, name)
@@ -0,0 +1,595 @@
+"""\
+Resolution of the imports of CellML models.
+"""
+
+from cStringIO import StringIO
+from hashlib import sha1
+
+import socket
+import threading
+import urllib2
+
+from lxml import etree
+
+from cellml.api.pmr2 import instrument
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import IAsyncURLOpener
+from cellml.api.pmr2.interfaces import ResourceLimitExceededError
+from cellml.api.pmr2.interfaces import UnapprovedProtocolError
+from cellml.api.pmr2.ingest import decodeSource
+from cellml.api.pmr2.pool import InlinePool
+from cellml.api.pmr2.pool import createPool
+from cellml.api.pmr2.urlopener import loadOptions
+
+cellml_namespaces = (
+    'http://www.cellml.org/cellml/1.1#',
+    'http://www.cellml.org/cellml/2.0#',
+)
+import_tags = set('{%s}import' % ns for ns in cellml_namespaces)
+xlink_href = '{http://www.w3.org/1999/xlink}href'
+xml_base = '{http://www.w3.org/XML/1998/namespace}base'
+
+
+def sourceDigest(source):
+    """\
+    Return the digest of a decoded document.
+    """
+
+    return sha1(source.encode('utf8')).hexdigest()
+
+
+def extractImports(source, leading=False):
+    """\
+    Return the xml:base of the model and the list of the xlink:href of
+    its imports, or None and an empty list if it cannot be parsed.
+
+    source - the decoded source of the model.
+    leading - only read the imports that come before any other element
+              of the model, leaving the rest of the document unparsed.
+    """
+
+    # the source is already decoded, so the declared encoding must
+    # not be applied again; entities are not resolved either.
+    events = etree.iterparse(StringIO(source.encode('utf-8')),
+        events=('start', 'end'), encoding='utf-8', resolve_entities=False)
+    base = None
+    hrefs = []
+    depth = 0
+    try:
+        for event, node in events:
+            if event == 'end':
+                depth -= 1
+                if depth == 1:
+                    # the elements of the model are no longer needed.
+                    node.clear()
+                continue
+            depth += 1
+            if depth == 1:
+                base = node.get(xml_base)
+            elif depth == 2:
+                if node.tag in import_tags:
+                    href = node.get(xlink_href)
+                    if href:
+                        hrefs.append(href)
+                elif leading:
+                    break
+    except etree.XMLSyntaxError:
+        return None, []
+    return base, hrefs
+
+
+def baseURL(loader, url, base):
+    """\
+    Return the url that the imports of the document at url are relative
+    to, given the xml:base of its model, if any.
+    """
+
+    return base and loader.urljoin(url, base) or url
+
+
+def checkSource(source, url):
+    """\
+    Raise ValueError if the decoded source of the document at url is
+    not well-formed.
+    """
+
+    parser = etree.XMLParser(encoding='utf-8', resolve_entities=False)
+    try:
+        etree.fromstring(source.encode('utf-8'), parser)
+    except etree.XMLSyntaxError, e:
+        raise ValueError('document at `%s` is not well-formed: %s' % (
+            url, e))
+
+
+class ResourceLimits(object):
+    """\
+    The limits on the resources used by a single load, along with the
+    resources used so far.
+
+    Every limit defaults to None, which is unlimited.
+
+    max_document_size - the maximum size of any document in bytes,
+                        enforced by the openers while reading.
+    max_total_size - the maximum number of bytes of all the documents
+                     fetched for the load.
+    max_imports - the maximum number of imports to follow.
+    max_depth - the maximum depth of the imports, with the imports of
+                the root model at a depth of 1.
+    deadline - the Deadline of the load, with the time remaining passed
+               as the timeout of every fetch.
+    """
+
+    def __init__(self, max_document_size=None, max_total_size=None,
+            max_imports=None, max_depth=None, deadline=None):
+        self.max_document_size = max_document_size
+        self.max_total_size = max_total_size
+        self.max_imports = max_imports
+        self.max_depth = max_depth
+        self.deadline = deadline
+        self.total_size = 0
+        self.imports = 0
+        self._lock = threading.Lock()
+
+    def maxSize(self):
+        """\
+        Return the number of bytes the next document may have, or None
+        if there is no limit.
+        """
+
+        max_size = self.max_document_size
+        if self.max_total_size is not None:
+            remaining = max(self.max_total_size - self.total_size, 0)
+            if max_size is None or remaining < max_size:
+                max_size = remaining
+        return max_size
+
+    def account(self, url, raw):
+        """\
+        Add the fetched document to the total, returning it.
+        """
+
+        if self.max_document_size is not None and \
+                len(raw) > self.max_document_size:
+            # for the openers that do not enforce the size themselves.
+            raise ResourceLimitExceededError(
+                'document at `%s` exceeds the limit of %d bytes' % (
+                    url, self.max_document_size))
+        self._lock.acquire()
+        try:
+            self.total_size += len(raw)
+            total_size = self.total_size
+        finally:
+            self._lock.release()
+        if self.max_total_size is not None and \
+                total_size > self.max_total_size:
+            raise ResourceLimitExceededError(
+                'documents fetched exceed the limit of %d bytes in total' %
+                    self.max_total_size)
+        return raw
+
+    def _options(self, url):
+        timeout = None
+        if self.deadline is not None:
+            self.deadline.check('load of `%s`' % url)
+            timeout = self.deadline.remaining()
+        return loadOptions(self.maxSize(), timeout)
+
+    def load(self, loader, url):
+        """\
+        Load the document at url through the loader within the limits.
+        """
+
+        try:
+            raw = loader(url, **self._options(url))
+        except (urllib2.URLError, socket.error):
+            # most likely timed out as the deadline was reached.
+            if self.deadline is not None and self.deadline.expired():
+                raise self.deadline.error('load of `%s`' % url)
+            raise
+        return self.account(url, raw)
+
+    def loadAsync(self, loader, url):
+        """\
+        Start loading the document at url through the IAsyncURLOpener
+        within the limits, returning the future of the document.
+        """
+
+        future = loader.loadURLAsync(url, **self._options(url))
+        return future.then(lambda raw: self.account(url, raw))
+
+    def checkImport(self, url, depth):
+        """\
+        Count an import of the document at url at the depth, raising
+        ResourceLimitExceededError should it exceed the limits.
+        """
+
+        if self.max_depth is not None and depth > self.max_depth:
+            raise ResourceLimitExceededError(
+                'import of `%s` exceeds the depth limit of %d' % (
+                    url, self.max_depth))
+        self.imports += 1
+        if self.max_imports is not None and self.imports > self.max_imports:
+            raise ResourceLimitExceededError(
+                'import of `%s` exceeds the limit of %d imports' % (
+                    url, self.max_imports))
+
+
+class LoadReport(object):
+    """\
+    The report of a single load.
+
+    skipped - the list of tuples of the canonical location and the
+              reason of every import that was skipped, such as one that
+              failed to be fetched or that forms an import cycle, in the
+              order they were found.
+    """
+
+    def __init__(self):
+        self.skipped = []
+        self._urls = set()
+
+    def skip(self, url, reason):
+        if url in self._urls:
+            return
+        self._urls.add(url)
+        self.skipped.append((url, reason))
+
+
+def failureReason(e):
+    reason = getattr(e, 'reason', None) or e
+    return str(reason)
+
+
+class ImportResolver(object):
+    """\
+    Fetches and instantiates the imports of models for a single load.
+
+    Import locations are canonicalised by the loader, and every distinct
+    document is only fetched and decoded once by this resolver, with all
+    imports referencing it instantiated from that one source.  The
+    documents are fetched by a pool of the specified number of worker
+    threads (or by the loader itself if it provides IAsyncURLOpener),
+    while the imports are instantiated in breadth-first order by the
+    calling thread as the CellML API is not reentrant.  As soon as a
+    document is fetched, its imports are read from its source and
+    fetched also, rather than once the document is instantiated.
+
+    loader - the IURLOpener to fetch the documents with.
+    workers - number of threads to fetch the documents with.
+    limits - the ResourceLimits of the load, which should not be shared
+             with other loads.
+    report - the LoadReport of the load.
+    """
+
+    def __init__(self, loader, workers=None, limits=None, report=None):
+        self.loader = loader
+        self.pool = createPool(workers)
+        if limits is None:
+            limits = ResourceLimits()
+        self.limits = limits
+        if report is None:
+            report = LoadReport()
+        self.report = report
+        self.model = None
+        self.documents = {}
+        # the documents reached by the imports of the model, in order.
+        self.imported = []
+        # nothing is gained by prefetching if every fetch is deferred
+        # until it is needed by the calling thread.
+        self.prefetching = (IAsyncURLOpener.providedBy(loader) or
+            not isinstance(self.pool, InlinePool))
+        self.closed = False
+        self._imported = set()
+        # the documents are also fetched by the workers.
+        self._lock = threading.RLock()
+
+    def load(self, url, depth=None):
+        """\
+        Fetch and decode the document at url, then prefetch its imports
+        if the depth of the document is specified.
+        """
+
+        # decoding is also done by the workers.
+        source = decodeSource(self.limits.load(self.loader, url), url)
+        self.prefetch(url, source, depth)
+        return source
+
+    def loadAsync(self, url, depth=None):
+        """\
+        Start fetching and decoding the document at url through the
+        IAsyncURLOpener, returning the future of the document.
+        """
+
+        def loaded(raw):
+            source = decodeSource(raw, url)
+            self.prefetch(url, source, depth)
+            return source
+
+        return self.limits.loadAsync(self.loader, url).then(loaded)
+
+    def _submit(self, url, depth):
+        if IAsyncURLOpener.providedBy(self.loader):
+            return self.loadAsync(url, depth)
+        return self.pool.submit(self.load, url, depth)
+
+    def fetch(self, url, depth=None):
+        """\
+        Return the pending result of the document at the canonical url.
+
+        depth - the depth of the import of the document, for its own
+                imports to be prefetched.
+        """
+
+        self._lock.acquire()
+        try:
+            pending = self.documents.get(url)
+            if pending is None:
+                pending = self.documents[url] = self._submit(url, depth)
+            return pending
+        finally:
+            self._lock.release()
+
+    def prefetch(self, url, source, depth):
+        """\
+        Start fetching the imports of the document at url at the depth,
+        if they are within the limits.
+
+        Prefetched documents are not counted as imports, nor are they
+        part of the manifest, until they are reached by the imports of
+        the model as they are queued for instantiation.
+        """
+
+        limits = self.limits
+        if depth is None or not self.prefetching or self.closed:
+            return
+        if limits.max_depth is not None and depth >= limits.max_depth:
+            return
+        if limits.deadline is not None and limits.deadline.expired():
+            return
+        loader = self.loader
+        # the imports after any other element are fetched as usual, once
+        # their model is instantiated.
+        base, hrefs = extractImports(source, leading=True)
+        base_url = baseURL(loader, url, base)
+        for href in hrefs:
+            nexturl = loader.canonicalURL(loader.urljoin(base_url, href))
+            self._lock.acquire()
+            try:
+                if self.closed:
+                    return
+                if nexturl in self.documents:
+                    continue
+                # every document fetched is imported at least once.
+                if limits.max_imports is not None and \
+                        len(self.documents) >= limits.max_imports:
+                    return
+                self.documents[nexturl] = self._submit(nexturl, depth + 1)
+            finally:
+                self._lock.release()
+
+    def digest(self, url):
+        """\
+        Return the digest of the fetched document at the canonical url,
+        or None if it failed to be fetched.
+        """
+
+        try:
+            return sourceDigest(self.fetch(url).result())
+        except (urllib2.URLError, UnapprovedProtocolError), e:
+            self.report.skip(url, failureReason(e))
+            return None
+
+    def manifest(self, root_source):
+        """\
+        Return the manifest of the digests of the root source and of
+        every document reached by the imports of the model, whether or
+        not it could be fetched.
+        """
+
+        return (sourceDigest(root_source),
+            tuple((url, self.digest(url)) for url in self.imported))
+
+    def changes(self, manifest, root_source):
+        """\
+        Return the set of the canonical urls of the documents of the
+        manifest that have changed, or None if the root has changed.
+        """
+
+        root_digest, imports = manifest
+        if root_digest != sourceDigest(root_source):
+            return None
+        # fetch everything at once before comparing, the results will
+        # be reused by the full load should this fail.
+        for url, value in imports:
+            self.fetch(url)
+        return set(url for url, value in imports if self.digest(url) != value)
+
+    def validate(self, manifest, root_source):
+        """\
+        Check whether the documents of the manifest are unchanged.
+        """
+
+        return self.changes(manifest, root_source) == set()
+
+    def _appendQueue(self, base, model, ancestors, depth=0):
+        loader = self.loader
+        # need to remember the source that this import was derived
+        # from; use the xml:base of the model if available.
+        base_url = baseURL(loader, base, model.xmlBase.asText)
+        ancestors = ancestors + (loader.canonicalURL(base_url),)
+        # start fetching all imports of this model right away so they
+        # will be available once the queue reaches them.
+        entries = []
+        for i in model.imports:
+            relurl = i.xlinkHref.asText
+            nexturl = loader.canonicalURL(loader.urljoin(base_url, relurl))
+            if nexturl in ancestors:
+                # the import is left uninstantiated.
+                self.report.skip(nexturl, 'import cycle')
+                continue
+            self.limits.checkImport(nexturl, depth + 1)
+            self._reach(nexturl)
+            entries.append((i, nexturl, self.fetch(nexturl, depth + 1)))
+        self.importq.append((ancestors, depth + 1, entries))
+
+    def _reach(self, url):
+        if url not in self._imported:
+            self._imported.add(url)
+            self.imported.append(url)
+
+    def begin(self, model, base):
+        """\
+        Start fetching the imports of the model.
+
+        base - the location the model was loaded from.
+        """
+
+        self.model = model
+        self.importq = []
+        self._appendQueue(base, model, (self.loader.canonicalURL(base),))
+
+    def step(self, block=True):
+        """\
+        Instantiate the queued imports in order, recursively.
+
+        Returns None once all imports are instantiated.  If block is
+        False, this returns the pending fetch of the next import to be
+        instantiated if it is not done yet instead of waiting for it.
+
+        Should the deadline of the limits be exceeded, the imports that
+        are not instantiated yet are abandoned, and the error is raised
+        with the partially resolved model.
+        """
+
+        deadline = self.limits.deadline
+        while self.importq:
+            ancestors, depth, entries = self.importq[0]
+            while entries:
+                i, nexturl, pending = entries[0]
+                if not block and not pending.done():
+                    return pending
+                if deadline is not None and (deadline.expired() or
+                        not pending.wait(deadline.remaining())):
+                    raise self.abandon()
+                entries.pop(0)
+                try:
+                    source = pending.result()
+                except DeadlineExceededError:
+                    raise self.abandon(nexturl)
+                except (urllib2.URLError, UnapprovedProtocolError), e:
+                    if deadline is not None and deadline.expired():
+                        raise self.abandon(nexturl)
+                    # the import is left uninstantiated.
+                    self.report.skip(nexturl, failureReason(e))
+                    continue
+                started = instrument.start()
+                i.instantiateFromText(source)
+                instrument.record('instantiate', started, nexturl,
+                    len(source))
+                self._appendQueue(nexturl, i.importedModel,
+                    ancestors + (nexturl,), depth)
+            self.importq.pop(0)
+        return None
+
+    def abandon(self, url=None):
+        """\
+        Skip all imports that are not instantiated yet, along with the
+        one at url, returning the DeadlineExceededError to be raised.
+        """
+
+        reason = 'deadline exceeded'
+        if url is not None:
+            self.report.skip(url, reason)
+        for ancestors, depth, entries in self.importq:
+            for i, nexturl, pending in entries:
+                self.report.skip(nexturl, reason)
+        self.importq = []
+        return self.limits.deadline.error('load of the imports', self.model)
+
+    def refresh(self, model, base, changed):
+        """\
+        Instantiate again the imports of the model that reference any of
+        the documents at the changed canonical urls, along with all of
+        their own imports, leaving every other import as it is.
+
+        base - the location the model was loaded from.
+
+        The documents that replace the instantiated imports are all
+        fetched and checked before any import is touched, such that the
+        model is left as it was should any of them fail to be fetched
+        or parsed, or the deadline be exceeded while fetching them.
+
+        Returns the number of imports that were instantiated again.
+        """
+
+        loader = self.loader
+        self.model = model
+        self.importq = []
+        count = 0
+        # only the imports are walked, nothing is fetched until an
+        # import of a changed document is found.
+        stack = [(base, model, (loader.canonicalURL(base),), 0)]
+        while stack:
+            base, current, ancestors, depth = stack.pop()
+            base_url = baseURL(loader, base, current.xmlBase.asText)
+            ancestors = ancestors + (loader.canonicalURL(base_url),)
+            entries = []
+            for i in current.imports:
+                relurl = i.xlinkHref.asText
+                nexturl = loader.canonicalURL(loader.urljoin(base_url, relurl))
+                if nexturl in ancestors:
+                    self.report.skip(nexturl, 'import cycle')
+                    continue
+                self._reach(nexturl)
+                if nexturl in changed:
+                    self.limits.checkImport(nexturl, depth + 1)
+                    entries.append((i, nexturl,
+                        self.fetch(nexturl, depth + 1)))
+                elif i.wasInstantiated:
+                    stack.append((nexturl, i.importedModel,
+                        ancestors + (nexturl,), depth + 1))
+            if entries:
+                self.importq.append((ancestors, depth + 1, entries))
+                count += len(entries)
+        queued = [entry for queue in self.importq for entry in queue[2]]
+        self._prepare(queued)
+        for i, nexturl, pending in queued:
+            if i.wasInstantiated:
+                i.uninstantiate()
+        self.step()
+        return count
+
+    def _prepare(self, entries):
+        # wait for the replacements of the imports, raising the error of
+        # any that cannot be instantiated.
+        deadline = self.limits.deadline
+        for i, nexturl, pending in entries:
+            if deadline is not None and (deadline.expired() or
+                    not pending.wait(deadline.remaining())):
+                raise deadline.error('refresh of the imports', self.model)
+            try:
+                source = pending.result()
+            except (urllib2.URLError, UnapprovedProtocolError):
+                if not i.wasInstantiated:
+                    # skipped like any other import that failed.
+                    continue
+                raise
+            checkSource(source, nexturl)
+
+    def resolve(self, model, base):
+        """\
+        Instantiate all imports of the model, recursively.
+
+        base - the location the model was loaded from.
+        """
+
+        self.begin(model, base)
+        self.step()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            self.closed = True
+        finally:
+            self._lock.release()
+        self.pool.shutdown()
@@ -0,0 +1,161 @@
+"""\
+A pool of pre-warmed worker processes that run jobs with the utility.
+
+As the CellML API is not reentrant and may bring down the process on
+malformed input, the jobs are run in separate processes so that they
+can be run in parallel, and so that a slow or crashing model will not
+affect the process that submitted it.
+"""
+
+import multiprocessing
+import threading
+from Queue import Queue
+
+from cellml.api.pmr2 import worker
+from cellml.api.pmr2.interfaces import WorkerCrashError
+from cellml.api.pmr2.interfaces import WorkerError
+from cellml.api.pmr2.interfaces import WorkerTimeoutError
+from cellml.api.pmr2.pool import Future
+
+
+class WorkerPool(object):
+    """\
+    Pool of worker processes, each holding a warm CellMLAPIUtility.
+
+    The jobs that can be submitted are loadModel (returning the output
+    of dumpModelTree), validateModel, extractMaths and exportCeleds;
+    each takes the URL or the source of the model as the first argument,
+    followed by the loader and the other arguments of the respective
+    method of the utility.
+
+    size - the number of worker processes, defaulting to the number of
+           processors.
+    max_jobs - the number of jobs after which a worker is replaced.
+    max_rss - the resident set size in bytes above which a worker is
+              replaced after its current job.
+    timeout - seconds a job may run before its worker is terminated
+              and the job fails with WorkerTimeoutError.
+    max_pending - the maximum number of jobs that are submitted but
+                  not yet completed; submit blocks while this is
+                  reached.  Defaults to twice the size.
+    settings - dictionary of the attributes to assign to the utility of
+               every worker, such as max_document_size.
+    """
+
+    def __init__(self, size=None, max_jobs=None, max_rss=None, timeout=None,
+            max_pending=None, settings=None):
+        self.size = size or multiprocessing.cpu_count()
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.timeout = timeout
+        self.max_pending = max_pending or self.size * 2
+        self.settings = settings
+        self.recycled = 0
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+        self._queue = Queue()
+        self._threads = []
+        for i in xrange(self.size):
+            thread = threading.Thread(target=self._dispatch)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _spawn(self):
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker.serve,
+            args=(child_conn, self.max_jobs, self.max_rss, self.settings))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        return process, conn
+
+    def _stop(self, process, conn, terminate=False):
+        if terminate:
+            process.terminate()
+        else:
+            try:
+                conn.send(None)
+            except (IOError, EOFError):
+                pass
+        conn.close()
+        process.join()
+
+    def _run(self, process, conn, job):
+        """\
+        Run the job with the worker, returning the tuple of the status,
+        the value and whether the worker should be replaced.
+        """
+
+        try:
+            conn.send(job)
+            if not conn.poll(self.timeout):
+                return ('error', WorkerTimeoutError(
+                    'job did not complete within %s seconds' %
+                        self.timeout), True)
+            return conn.recv()
+        except (IOError, EOFError):
+            return ('error', WorkerCrashError(
+                'worker process terminated with exit code %s' %
+                    process.exitcode), True)
+        except Exception, e:
+            # the reply could not be unpickled, so the state of the
+            # connection is unknown.
+            return ('error', WorkerError(
+                'reply of the worker could not be received: %s: %s' % (
+                    type(e).__name__, e)), True)
+
+    def _dispatch(self):
+        # one thread per worker process, so that the process can be
+        # replaced without affecting the others.
+        process, conn = self._spawn()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._stop(process, conn)
+                return
+
+            future, job = item
+            status, value, replace = self._run(process, conn, job)
+            if replace:
+                # the worker may be in any state, make sure it is gone.
+                self._stop(process, conn, terminate=process.is_alive())
+                process, conn = self._spawn()
+                self.recycled += 1
+
+            if status == 'ok':
+                future.set_result(value)
+            else:
+                future.set_exc_info((type(value), value, None))
+            self._pending.release()
+
+    def submit(self, name, *a, **kw):
+        """\
+        Submit a job, returning the Future of its result.
+
+        Blocks while the maximum number of pending jobs is reached.
+        """
+
+        if name not in worker.jobs:
+            raise ValueError('unknown job `%s`' % name)
+        self._pending.acquire()
+        future = Future()
+        self._queue.put((future, (name, a, kw)))
+        return future
+
+    def call(self, name, *a, **kw):
+        """\
+        Run a job and return its result.
+        """
+
+        return self.submit(name, *a, **kw).result()
+
+    def close(self):
+        """\
+        Stop the workers once all submitted jobs are completed.
+        """
+
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -0,0 +1,98 @@
+import unittest
+import os
+import shutil
+import tempfile
+from lxml import etree
+
+from cellml.api.pmr2.benchmark import LatencyURLOpener
+from cellml.api.pmr2.benchmark import compareBaseline
+from cellml.api.pmr2.benchmark import fileOpener
+from cellml.api.pmr2.benchmark import generateModels
+from cellml.api.pmr2.benchmark import loadBaseline
+from cellml.api.pmr2.benchmark import percentile
+from cellml.api.pmr2.benchmark import saveBaseline
+from cellml.api.pmr2.benchmark import summarise
+
+cellml_ns = 'http://www.cellml.org/cellml/1.1#'
+xlink_ns = 'http://www.w3.org/1999/xlink'
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_0000_generate(self):
+        url = generateModels(self.path, components=3, depth=2, fanout=2)
+        self.assertTrue(url.startswith('file://'))
+        self.assertTrue(url.endswith('/model.xml'))
+        # 1 + 2 + 4 documents.
+        self.assertEqual(len(os.listdir(self.path)), 7)
+
+        opener = fileOpener()
+        root = etree.fromstring(opener(url))
+        hrefs = [i.get('{%s}href' % xlink_ns)
+            for i in root.findall('{%s}import' % cellml_ns)]
+        self.assertEqual(hrefs, ['model_0.xml', 'model_1.xml'])
+        self.assertEqual(len(root.findall('{%s}component' % cellml_ns)), 3)
+
+        leaf = etree.fromstring(opener(opener.urljoin(url, 'model_1_0.xml')))
+        self.assertEqual(leaf.findall('{%s}import' % cellml_ns), [])
+
+    def test_0001_latency(self):
+        url = generateModels(self.path, components=1)
+        opener = LatencyURLOpener(fileOpener(), 0)
+        self.assertTrue(opener(url).startswith('<?xml'))
+
+    def test_0100_summarise(self):
+        self.assertEqual(percentile([], 50), None)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3, 4], 100), 4)
+
+        result = summarise([0.5, 0.25, 0.25], 1024)
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(result['total'], 1.0)
+        self.assertEqual(result['throughput'], 3.0)
+        self.assertEqual(result['p50'], 0.25)
+        self.assertEqual(result['max'], 0.5)
+        self.assertEqual(result['peak_rss'], 1024)
+
+        result = summarise([])
+        self.assertEqual(result['count'], 0)
+        self.assertEqual(result['throughput'], None)
+        self.assertEqual(result['p50'], None)
+
+    def test_0200_baseline(self):
+        baseline = {
+            'loadModel': summarise([1.0, 1.0], 100),
+            'extractMaths': summarise([1.0], 100),
+        }
+        path = os.path.join(self.path, 'baseline.json')
+        saveBaseline(baseline, path)
+        self.assertEqual(loadBaseline(path), baseline)
+
+        results = {
+            'loadModel': summarise([1.1, 1.1], 300),
+            'extractMaths': summarise([2.0], 100),
+            'validateModel': summarise([5.0], 100),
+        }
+        self.assertEqual(compareBaseline(results, baseline), [
+            ('extractMaths', 'p50', 1.0, 2.0),
+            ('extractMaths', 'p90', 1.0, 2.0),
+            ('loadModel', 'peak_rss', 100, 300),
+        ])
+        self.assertEqual(compareBaseline(results, baseline, 5), [])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(BenchmarkTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
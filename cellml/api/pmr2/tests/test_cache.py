@@ -0,0 +1,259 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from cellml.api.pmr2.cache import CodeCache
+from cellml.api.pmr2.cache import DiskStore
+from cellml.api.pmr2.cache import LRUCache
+from cellml.api.pmr2.cache import ModelCache
+from cellml.api.pmr2.cache import SnapshotStore
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_0000_basic(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), None)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_0001_evict_least_recent(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.keys(), ['a', 'c'])
+
+    def test_0002_sizeof(self):
+        cache = LRUCache(10, sizeof=len)
+        cache.set('a', 'xxxxxx')
+        cache.set('b', 'xxxx')
+        self.assertEqual(cache.size, 10)
+        cache.set('c', 'x')
+        self.assertEqual(cache.keys(), ['b', 'c'])
+        self.assertEqual(cache.size, 5)
+        # too big to ever fit.
+        cache.set('d', 'x' * 11)
+        self.assertFalse('d' in cache)
+
+    def test_0003_invalidate(self):
+        cache = LRUCache(10, sizeof=len)
+        cache.set('a', 'xxxxxx')
+        cache.invalidate('a')
+        cache.invalidate('b')
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+
+class DiskStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_0000_basic(self):
+        store = DiskStore(self.tmpdir)
+        self.assertEqual(store.get('a'), None)
+        store.set('a', 'value\nwith newline', {'etag': 'x'})
+        self.assertEqual(store.get('a'), ('value\nwith newline',
+            {'etag': 'x'}))
+        store = DiskStore(self.tmpdir)
+        self.assertEqual(store.get(u'a')[0], 'value\nwith newline')
+        store.invalidate('a')
+        self.assertEqual(store.get('a'), None)
+
+    def test_0001_evict(self):
+        store = DiskStore(self.tmpdir, max_size=30)
+        store.set('a', 'x' * 10)
+        store.set('b', 'x' * 10)
+        self.assertEqual(store.size, 26)
+        # make b the least recently used.
+        os.utime(store._path('b'), (0, 0))
+        store.get('a')
+        store.set('c', 'x' * 10)
+        self.assertEqual(store.get('b'), None)
+        self.assertEqual(store.get('a')[0], 'x' * 10)
+        self.assertEqual(store.get('c')[0], 'x' * 10)
+        self.assertEqual(store.size, 26)
+
+    def test_0002_size_persisted(self):
+        store = DiskStore(self.tmpdir, max_size=30)
+        store.set('a', 'x' * 10)
+        store = DiskStore(self.tmpdir, max_size=30)
+        self.assertEqual(store.size, 13)
+        store.set('a', 'x' * 5)
+        self.assertEqual(store.size, 8)
+        store.invalidate('a')
+        self.assertEqual(store.size, 0)
+
+
+class SnapshotStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_0000_basic(self):
+        store = SnapshotStore(self.tmpdir)
+        digest = store.put('snapshot')
+        self.assertEqual(len(digest), 40)
+        self.assertEqual(store.put(u'snapshot'), digest)
+        self.assertEqual(store.get(digest), 'snapshot')
+        self.assertEqual(store.get('0' * 40), None)
+        self.assertEqual(store.get('invalid'), None)
+        # shared with another instance on the same directory.
+        self.assertEqual(SnapshotStore(self.tmpdir).get(digest), 'snapshot')
+
+    def test_0001_tag(self):
+        store = SnapshotStore(self.tmpdir)
+        self.assertEqual(store.lookup('http://example.com/model'), None)
+        first = store.put('first')
+        store.tag('http://example.com/model', first)
+        self.assertEqual(store.lookup(u'http://example.com/model'), first)
+        second = store.put('second')
+        store.tag('http://example.com/model', second)
+        self.assertEqual(store.lookup('http://example.com/model'), second)
+        self.assertEqual(store.get(first), 'first')
+
+    def test_0002_corrupted(self):
+        store = SnapshotStore(self.tmpdir)
+        digest = store.put('snapshot')
+        with open(store._object(digest), 'wb') as fd:
+            fd.write('garbage')
+        self.assertEqual(store.get(digest), None)
+
+
+class CodeCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_0000_basic(self):
+        cache = CodeCache(self.tmpdir)
+        key = cache.key('model', 'Python', 'definition')
+        self.assertEqual(cache.get(key), None)
+        cache.set(key, u'# code \xe9')
+        self.assertEqual(cache.get(key), u'# code \xe9')
+        self.assertEqual(cache.get(cache.key('model', 'C', 'definition')),
+            None)
+        cache.set(cache.key('model', 'C', 'definition'), '/* code */')
+        self.assertEqual(cache.get(cache.key('model', 'C', 'definition')),
+            '/* code */')
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+
+class ModelCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_0000_lookup(self):
+        cache = ModelCache()
+        manifest = ('root', (('http://example.com/a', 'a'),))
+        model = object()
+        self.assertEqual(cache.lookup('key', lambda m: True), None)
+        self.assertTrue(cache.store('key', manifest, model) is model)
+        self.assertTrue(cache.lookup('key', lambda m: m == manifest)
+            is model)
+        self.assertEqual(cache.stats(),
+            {'hits': 1, 'misses': 1, 'stale': 0, 'refreshed': 0,
+                'entries': 1})
+
+    def test_0001_stale(self):
+        cache = ModelCache()
+        cache.store('key', ('root', ()), object())
+        self.assertEqual(cache.lookup('key', lambda m: False), None)
+        self.assertEqual(cache.stale, 1)
+        # stale entries are dropped.
+        self.assertEqual(len(cache), 0)
+
+    def test_0002_copy(self):
+        cache = ModelCache(copy=list)
+        model = [1, 2]
+        self.assertFalse(cache.store('key', ('root', ()), model) is model)
+        result = cache.lookup('key', lambda m: True)
+        self.assertEqual(result, model)
+        self.assertFalse(result is model)
+
+    def test_0003_bounded_invalidate(self):
+        cache = ModelCache(max_entries=2)
+        cache.store('a', ('root', ()), object())
+        cache.store('b', ('root', ()), object())
+        cache.store('c', ('root', ()), object())
+        self.assertEqual(len(cache), 2)
+        cache.invalidate('c')
+        self.assertEqual(len(cache), 1)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_0004_incremental(self):
+        cache = ModelCache()
+        model = [1]
+        refresh = lambda manifest, model: model.append(2) or ('new', ())
+        cache.store('key', ('root', ()), model)
+        # not incremental.
+        self.assertEqual(cache.lookup('key', lambda m: False, refresh), None)
+        self.assertEqual(model, [1])
+
+        cache = ModelCache(incremental=True)
+        cache.store('key', ('root', ()), model)
+        self.assertTrue(cache.lookup('key', lambda m: False, refresh)
+            is model)
+        self.assertEqual(model, [1, 2])
+        self.assertEqual(cache.refreshed, 1)
+        self.assertTrue(cache.lookup('key', lambda m: m == ('new', ()))
+            is model)
+        # the model cannot be refreshed.
+        self.assertEqual(cache.lookup('key', lambda m: False,
+            lambda manifest, model: None), None)
+        self.assertEqual(cache.stale, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_0005_incremental_error(self):
+        cache = ModelCache(incremental=True)
+        cache.store('key', ('root', ()), [1])
+
+        def refresh(manifest, model):
+            raise ValueError('broken')
+
+        self.assertRaises(ValueError, cache.lookup, 'key', lambda m: False,
+            refresh)
+        # the model that failed to be refreshed is not handed out again.
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.lookup('key', lambda m: True), None)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(LRUCacheTestCase))
+    suite.addTest(makeSuite(DiskStoreTestCase))
+    suite.addTest(makeSuite(SnapshotStoreTestCase))
+    suite.addTest(makeSuite(CodeCacheTestCase))
+    suite.addTest(makeSuite(ModelCacheTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
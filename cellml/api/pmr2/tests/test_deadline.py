@@ -0,0 +1,66 @@
+import unittest
+import pickle
+import time
+
+from cellml.api.pmr2.deadline import Deadline
+from cellml.api.pmr2.deadline import asDeadline
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import ResourceLimitExceededError
+
+
+class DeadlineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_0000_remaining(self):
+        deadline = Deadline(60)
+        self.assertFalse(deadline.expired())
+        self.assertTrue(59 < deadline.remaining() <= 60)
+        deadline.check('load')
+
+    def test_0001_expired(self):
+        deadline = Deadline(0.01)
+        time.sleep(0.02)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(deadline.remaining(), 0)
+        try:
+            deadline.check('load', ['partial'])
+        except DeadlineExceededError, e:
+            self.assertEqual(e.partial, ['partial'])
+            self.assertTrue(str(e).startswith('load exceeded'))
+        else:
+            self.fail('DeadlineExceededError not raised')
+        # not a limit of the resources of a load.
+        try:
+            deadline.check('load')
+        except ResourceLimitExceededError:
+            self.fail('DeadlineExceededError is a ResourceLimitExceededError')
+        except DeadlineExceededError:
+            pass
+
+    def test_0100_asDeadline(self):
+        deadline = Deadline(60)
+        self.assertTrue(asDeadline(deadline) is deadline)
+        self.assertEqual(asDeadline(None), None)
+        self.assertEqual(asDeadline(30).timeout, 30)
+
+    def test_0200_pickle(self):
+        deadline = Deadline(60)
+        copy = pickle.loads(pickle.dumps(deadline))
+        self.assertEqual(copy.expires, deadline.expires)
+        e = pickle.loads(pickle.dumps(deadline.error('load', [1])))
+        self.assertEqual(e.partial, [1])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(DeadlineTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+import shutil
+import tempfile
+from os.path import abspath, dirname, join
+
+from cellml.api.pmr2.index import DependencyIndex
+from cellml.api.pmr2.index import extractImports
+from cellml.api.pmr2.urlopener import LocalURLOpener
+
+input_dir = join(dirname(abspath(__file__)), 'input')
+
+
+class DependencyIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ('multiimport.xml', 'level2.xml', 'cycle_a.xml',
+                'cycle_b.xml'):
+            shutil.copy(join(input_dir, name), join(self.tmpdir, name))
+        os.makedirs(join(self.tmpdir, 'subdir1', 'subdir2'))
+        for name in ('level1.xml', 'subdir2/toplevel.xml'):
+            shutil.copy(join(input_dir, 'subdir1', name),
+                join(self.tmpdir, 'subdir1', name))
+        self.opener = LocalURLOpener(self.tmpdir)
+        self.url = self.opener.url
+        self.index = DependencyIndex(join(self.tmpdir, 'index.db'))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_0000_extract(self):
+        source = (u'<?xml version="1.0" encoding="iso-8859-1"?>'
+            u'<model xmlns="http://www.cellml.org/cellml/1.1#" '
+            u'xmlns:xlink="http://www.w3.org/1999/xlink" xml:base="sub/">'
+            u'<import xlink:href="a.xml"/><import xlink:href="b.xml"/>'
+            u'<import/></model>')
+        self.assertEqual(extractImports(source), ('sub/', ['a.xml', 'b.xml']))
+        self.assertEqual(extractImports(u'<model'), (None, []))
+        source = (u'<model xmlns="http://www.cellml.org/cellml/1.1#" '
+            u'xmlns:xlink="http://www.w3.org/1999/xlink">'
+            u'<import xlink:href="a.xml"><component/></import>'
+            u'<units name="u"/><import xlink:href="b.xml"/><broken></model>')
+        self.assertEqual(extractImports(source), (None, []))
+        self.assertEqual(extractImports(source, leading=True),
+            (None, ['a.xml']))
+
+    def test_0100_update(self):
+        index = self.index
+        top = self.url('subdir1', 'subdir2', 'toplevel.xml')
+        level1 = self.url('subdir1', 'level1.xml')
+        level2 = self.url('level2.xml')
+        multi = self.url('multiimport.xml')
+
+        self.assertEqual(index.update(top, self.opener),
+            sorted([top, level1, level2]))
+        self.assertEqual(index.update(multi, self.opener), [multi])
+        self.assertEqual(index.documents(),
+            sorted([top, level1, level2, multi]))
+
+        self.assertEqual(index.imports(top), [level1])
+        self.assertEqual(index.imports(multi), sorted([level1, level2]))
+        self.assertEqual(index.importers(level2), sorted([level1, multi]))
+        self.assertEqual(index.dependencies(top), sorted([level1, level2]))
+        self.assertEqual(index.dependents(level2),
+            sorted([level1, multi, top]))
+        self.assertEqual(index.dependents(top), [])
+
+        # nothing changed.
+        self.assertEqual(index.update(multi, self.opener), [])
+
+    def test_0101_incremental(self):
+        index = self.index
+        multi = self.url('multiimport.xml')
+        level1 = self.url('subdir1', 'level1.xml')
+        level2 = self.url('level2.xml')
+        index.update(multi, self.opener)
+
+        fd = open(join(self.tmpdir, 'subdir1', 'level1.xml'), 'wb')
+        fd.write('<model xmlns="http://www.cellml.org/cellml/1.1#"/>')
+        fd.close()
+        self.assertEqual(index.update(multi, self.opener), [level1])
+        self.assertEqual(index.importers(level2), [multi])
+
+        os.unlink(join(self.tmpdir, 'level2.xml'))
+        self.assertEqual(index.update(multi, self.opener), [])
+        self.assertEqual(index.digest(level2), None)
+        self.assertTrue(level2 in index.documents())
+
+        index.remove(multi)
+        self.assertEqual(index.importers(level1), [])
+        self.assertFalse(multi in index.documents())
+
+    def test_0102_cycle(self):
+        a = self.url('cycle_a.xml')
+        b = self.url('cycle_b.xml')
+        self.assertEqual(self.index.update(a, self.opener), [a, b])
+        self.assertEqual(self.index.dependencies(a), [a, b])
+        self.assertEqual(self.index.dependents(a), [a, b])
+
+    def test_0103_persistent(self):
+        multi = self.url('multiimport.xml')
+        self.index.update(multi, self.opener)
+        self.index.close()
+        self.index = DependencyIndex(join(self.tmpdir, 'index.db'), 2)
+        self.assertEqual(len(self.index.importers(self.url('level2.xml'))),
+            2)
+        self.assertEqual(self.index.update(multi, self.opener), [])
+
+    def test_0104_nonrecursive(self):
+        multi = self.url('multiimport.xml')
+        self.assertEqual(self.index.update(multi, self.opener, False),
+            [multi])
+        self.assertEqual(self.index.documents(), [multi])
+        self.assertEqual(len(self.index.imports(multi)), 2)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(DependencyIndexTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import unittest
+import codecs
+from os.path import dirname, join
+
+from cellml.api.pmr2.ingest import decodeSource
+from cellml.api.pmr2.ingest import detectEncoding
+
+base = dirname(__file__)
+input_p = 'input'
+get_file = lambda *p: open(join(base, input_p, *p), 'rb').read()
+
+
+class IngestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_0000_declaration(self):
+        self.assertEqual(detectEncoding(
+            '<?xml version="1.0" encoding="iso-8859-1"?>\n<model/>'),
+            'iso-8859-1')
+        self.assertEqual(detectEncoding(
+            "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>"),
+            'utf-8')
+
+    def test_0001_default(self):
+        self.assertEqual(detectEncoding('<model/>'), 'utf-8')
+        self.assertEqual(detectEncoding('<?xml version="1.0"?><model/>'),
+            'utf-8')
+        # declarations elsewhere are ignored.
+        self.assertEqual(detectEncoding(
+            '<model/><?xml version="1.0" encoding="iso-8859-1"?>'),
+            'utf-8')
+
+    def test_0002_bom(self):
+        self.assertEqual(detectEncoding(codecs.BOM_UTF8 + '<model/>'),
+            'utf-8-sig')
+        self.assertEqual(detectEncoding(
+            u'<model/>'.encode('utf-16')), 'utf-16')
+        self.assertEqual(detectEncoding(
+            u'<?xml version="1.0"?>'.encode('utf-16-le')), 'utf-16-le')
+
+    def test_0100_decode(self):
+        self.assertEqual(decodeSource(codecs.BOM_UTF8 + '<model/>'),
+            u'<model/>')
+        self.assertEqual(decodeSource(
+            u'<model name="é"/>'.encode('utf-16')),
+            u'<model name="é"/>')
+        self.assertEqual(decodeSource(
+            '<?xml version="1.0" encoding="iso-8859-1"?><model n="\xe9"/>'),
+            u'<?xml version="1.0" encoding="iso-8859-1"?><model n="\xe9"/>')
+        source = u'<model/>'
+        self.assertTrue(decodeSource(source) is source)
+
+    def test_0101_decode_fallback(self):
+        # invalid utf-8 falls back to latin1
+        self.assertEqual(decodeSource('<model n="\xe9"/>'),
+            u'<model n="\xe9"/>')
+        # as do unknown encodings.
+        self.assertEqual(decodeSource(
+            '<?xml version="1.0" encoding="x-unknown"?><model/>'),
+            u'<?xml version="1.0" encoding="x-unknown"?><model/>')
+
+    def test_0200_files(self):
+        self.assertEqual(detectEncoding(get_file('unicode_valid.cellml')),
+            'utf-8')
+        self.assertTrue(isinstance(
+            decodeSource(get_file('unicode_invalid.cellml')), unicode))
+        self.assertEqual(detectEncoding(get_file('multiimport.xml')),
+            'iso-8859-1')
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(IngestTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
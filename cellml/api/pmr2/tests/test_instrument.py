@@ -0,0 +1,99 @@
+import unittest
+from os.path import abspath, dirname, join
+from urlparse import urljoin
+
+import zope.event
+
+from cellml.api.pmr2 import instrument
+from cellml.api.pmr2.ingest import decodeSource
+from cellml.api.pmr2.instrument import PhaseEvent
+from cellml.api.pmr2.instrument import PhaseStatistics
+from cellml.api.pmr2.urlopener import DefaultURLOpener
+
+base = dirname(abspath(__file__))
+get_path = lambda *p: urljoin('file://', join(base, 'input', *p))
+
+
+class InstrumentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.subscribers = zope.event.subscribers[:]
+        self.stats = PhaseStatistics(buckets=(0.1, 1))
+
+    def tearDown(self):
+        zope.event.subscribers[:] = self.subscribers
+
+    def test_0000_disabled(self):
+        zope.event.subscribers[:] = []
+        started = instrument.start()
+        self.assertEqual(started, None)
+        # nothing to notify.
+        instrument.record('fetch', started, 'http://example.com/')
+
+    def test_0001_record(self):
+        events = []
+        zope.event.subscribers.append(events.append)
+        started = instrument.start()
+        self.assertNotEqual(started, None)
+        instrument.record('fetch', started, 'http://example.com/', 10)
+        instrument.record('parse', started, object())
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0].phase, 'fetch')
+        self.assertEqual(events[0].url, 'http://example.com/')
+        self.assertEqual(events[0].size, 10)
+        self.assertTrue(events[0].duration >= 0)
+        self.assertEqual(events[1].url, None)
+
+    def test_0100_statistics(self):
+        stats = self.stats
+        stats(PhaseEvent('fetch', 0.05, 'http://example.com/a', 10))
+        stats(PhaseEvent('fetch', 0.5, 'http://example.com/b', 20))
+        stats(PhaseEvent('fetch', 2, 'http://example.com/c'))
+        stats(PhaseEvent('export', 0.1, language='python'))
+        stats(object())
+        result = stats.snapshot()
+        self.assertEqual(sorted(result.keys()), ['export', 'fetch'])
+        self.assertEqual(result['fetch']['count'], 3)
+        self.assertEqual(result['fetch']['total'], 2.55)
+        self.assertEqual(result['fetch']['max'], 2)
+        self.assertEqual(result['fetch']['size'], 30)
+        self.assertEqual(result['fetch']['histogram'], [1, 1, 1])
+        self.assertEqual(result['export']['histogram'], [1, 0, 0])
+
+        # snapshots are copies.
+        result['fetch']['histogram'][0] = 5
+        self.assertEqual(stats.snapshot()['fetch']['histogram'], [1, 1, 1])
+
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+
+    def test_0101_subscribe(self):
+        stats = self.stats
+        stats.subscribe()
+        stats.subscribe()
+        self.assertEqual(zope.event.subscribers.count(stats), 1)
+
+        opener = DefaultURLOpener()
+        opener.approved_protocol.append('file')
+        url = get_path('multiimport.xml')
+        raw = opener(url)
+        decodeSource(raw, url)
+        result = stats.snapshot()
+        self.assertEqual(result['fetch']['count'], 1)
+        self.assertEqual(result['fetch']['size'], len(raw))
+        self.assertEqual(result['decode']['count'], 1)
+
+        stats.unsubscribe()
+        self.assertFalse(stats in zope.event.subscribers)
+        opener(url)
+        self.assertEqual(stats.snapshot()['fetch']['count'], 1)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(InstrumentTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
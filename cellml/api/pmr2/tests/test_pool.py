@@ -0,0 +1,125 @@
+import unittest
+import threading
+
+from cellml.api.pmr2.pool import InlinePool
+from cellml.api.pmr2.pool import ThreadPool
+from cellml.api.pmr2.pool import createPool
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def tearDown(self):
+        pass
+
+    def record(self, value):
+        self.calls.append(value)
+        return value
+
+    def raiseError(self, value):
+        raise ValueError(value)
+
+    def test_0000_create(self):
+        self.assertTrue(isinstance(createPool(None), InlinePool))
+        self.assertTrue(isinstance(createPool(1), InlinePool))
+        self.assertTrue(isinstance(createPool(2), ThreadPool))
+
+    def test_0100_inline_deferred(self):
+        pool = InlinePool()
+        f1 = pool.submit(self.record, 1)
+        f2 = pool.submit(self.record, 2)
+        # nothing is called until results are requested.
+        self.assertEqual(self.calls, [])
+        self.assertEqual(f2.result(), 2)
+        self.assertEqual(f1.result(), 1)
+        self.assertEqual(f1.result(), 1)
+        self.assertEqual(self.calls, [2, 1])
+
+    def test_0101_inline_exception(self):
+        pool = InlinePool()
+        f = pool.submit(self.raiseError, 'bad')
+        self.assertRaises(ValueError, f.result)
+
+    def test_0200_threaded(self):
+        pool = ThreadPool(4)
+        futures = [pool.submit(self.record, i) for i in range(20)]
+        self.assertEqual([f.result() for f in futures], range(20))
+        self.assertEqual(sorted(self.calls), range(20))
+        self.assertTrue(len(pool._threads) <= 4)
+        pool.shutdown()
+
+    def test_0201_threaded_exception(self):
+        pool = ThreadPool(2)
+        f = pool.submit(self.raiseError, 'bad')
+        self.assertRaises(ValueError, f.result)
+        pool.shutdown()
+
+    def test_0202_threaded_concurrent(self):
+        # calls that block must be running at the same time.
+        barrier = threading.Event()
+        started = []
+
+        def wait(i):
+            started.append(i)
+            if len(started) == 3:
+                barrier.set()
+            return barrier.wait(5)
+
+        pool = ThreadPool(3)
+        futures = [pool.submit(wait, i) for i in range(3)]
+        self.assertEqual([f.result() for f in futures], [True] * 3)
+        pool.shutdown()
+
+    def test_0203_wait(self):
+        pool = ThreadPool(2)
+        event = threading.Event()
+        f = pool.submit(event.wait)
+        self.assertFalse(f.wait(0.01))
+        event.set()
+        self.assertTrue(f.wait(5))
+        pool.shutdown()
+        # deferred calls are run by the waiting thread.
+        f = InlinePool().submit(self.record, 1)
+        self.assertTrue(f.wait(0))
+        self.assertEqual(self.calls, [1])
+
+    def test_0300_callback(self):
+        pool = ThreadPool(2)
+        done = threading.Event()
+        results = []
+
+        def callback(future):
+            results.append(future.result())
+            done.set()
+
+        release = threading.Event()
+        f = pool.submit(lambda: release.wait(5) and 'value')
+        f.add_done_callback(callback)
+        self.assertEqual(results, [])
+        release.set()
+        done.wait(5)
+        self.assertEqual(results, ['value'])
+        # called immediately once done.
+        f.add_done_callback(callback)
+        self.assertEqual(results, ['value', 'value'])
+        pool.shutdown()
+
+    def test_0301_then(self):
+        pool = ThreadPool(2)
+        f = pool.submit(self.record, 2).then(lambda value: value * 3)
+        self.assertEqual(f.result(), 6)
+        f = pool.submit(self.raiseError, 'bad').then(lambda value: value)
+        self.assertRaises(ValueError, f.result)
+        pool.shutdown()
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(PoolTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
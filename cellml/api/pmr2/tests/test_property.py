@@ -1,4 +1,6 @@
 import unittest
+import threading
+import time
 
 from cellml.api.pmr2.property import *
 
@@ -47,6 +49,42 @@ class SingletonTestClass(object):
         return self.test_prop * 1
 
 
+class SlowSingletonTestClass(object):
+    calls = []
+
+    @singleton_property
+    def test_prop(self):
+        self.calls.append(1)
+        # give the other threads the chance to race.
+        time.sleep(0.05)
+        return object()
+
+
+class ThreadLocalTestClass(object):
+
+    @threadlocal_property
+    def test_items(self):
+        return []
+
+
+def run_threads(target, count):
+    results = []
+    lock = threading.Lock()
+
+    def run():
+        value = target()
+        lock.acquire()
+        results.append(value)
+        lock.release()
+
+    threads = [threading.Thread(target=run) for i in xrange(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
 class InstancePropertyTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -192,12 +230,47 @@ class SingletonPropertyTestCase(unittest.TestCase):
 
         self.assertEqual(tester.test_items, [7, 8])
 
+    def test_0005_threads_call_once(self):
+        results = run_threads(lambda: SlowSingletonTestClass().test_prop, 8)
+        self.assertEqual(len(SlowSingletonTestClass.calls), 1)
+        self.assertEqual(len(set(id(r) for r in results)), 1)
+
+
+class ThreadLocalPropertyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        del ThreadLocalTestClass().test_items
+
+    def test_0000_same_thread(self):
+        tester1 = ThreadLocalTestClass()
+        tester2 = ThreadLocalTestClass()
+        self.assertEqual(id(tester1.test_items), id(tester2.test_items))
+
+    def test_0001_other_threads(self):
+        items = ThreadLocalTestClass().test_items
+        items.append(1)
+        results = run_threads(lambda: ThreadLocalTestClass().test_items, 4)
+        self.assertEqual(len(set(id(r) for r in results)), 4)
+        self.assertFalse(id(items) in set(id(r) for r in results))
+        self.assertEqual(results[0], [])
+        self.assertEqual(ThreadLocalTestClass().test_items, [1])
+
+    def test_0002_delete(self):
+        tester = ThreadLocalTestClass()
+        tester.test_items.append(1)
+        del tester.test_items
+        self.assertEqual(tester.test_items, [])
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
     suite.addTest(makeSuite(SingletonPropertyTestCase))
     suite.addTest(makeSuite(InstancePropertyTestCase))
+    suite.addTest(makeSuite(ThreadLocalPropertyTestCase))
     return suite
 
 if __name__ == '__main__':
@@ -0,0 +1,303 @@
+import unittest
+import time
+import urllib2
+from urlparse import urljoin
+
+from cellml.api.pmr2.deadline import Deadline
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import ResourceLimitExceededError
+from cellml.api.pmr2.resolver import ImportResolver
+from cellml.api.pmr2.resolver import LoadReport
+from cellml.api.pmr2.resolver import extractImports
+from cellml.api.pmr2.resolver import ResourceLimits
+
+
+class RecordingLoader(object):
+    """
+    Returns the documents of a dictionary, recording the limits passed.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.max_sizes = []
+        self.timeouts = []
+
+    def __call__(self, location, max_size=None, timeout=None):
+        self.max_sizes.append(max_size)
+        self.timeouts.append(timeout)
+        if location not in self.documents:
+            raise urllib2.URLError('`%s` not found' % location)
+        return self.documents[location]
+
+    def urljoin(self, base, url):
+        return urljoin(base, url)
+
+    def canonicalURL(self, location):
+        return location
+
+
+def model(*hrefs):
+    return (
+        '<model xmlns="http://www.cellml.org/cellml/1.1#" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink" name="m">%s</model>' %
+        ''.join('<import xlink:href="%s"/>' % href for href in hrefs))
+
+
+class Text(object):
+
+    def __init__(self, text):
+        self.asText = text
+
+
+class FakeImport(object):
+    """
+    An import of FakeModel, instantiated from the source of a model.
+    """
+
+    def __init__(self, href):
+        self.xlinkHref = Text(href)
+        self.importedModel = None
+
+    @property
+    def wasInstantiated(self):
+        return self.importedModel is not None
+
+    def instantiateFromText(self, source):
+        self.importedModel = FakeModel(source)
+
+    def uninstantiate(self):
+        self.importedModel = None
+
+
+class FakeModel(object):
+    """
+    Just enough of a CellML model for the resolver to walk its imports.
+    """
+
+    def __init__(self, source):
+        base, hrefs = extractImports(source)
+        self.xmlBase = Text(base or u'')
+        self.imports = [FakeImport(href) for href in hrefs]
+
+
+class ResourceLimitsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = RecordingLoader({
+            'a': 'a' * 10,
+            'b': 'b' * 20,
+        })
+
+    def tearDown(self):
+        pass
+
+    def test_0000_unlimited(self):
+        limits = ResourceLimits()
+        self.assertEqual(limits.load(self.loader, 'a'), 'a' * 10)
+        self.assertEqual(limits.load(self.loader, 'b'), 'b' * 20)
+        self.assertEqual(self.loader.max_sizes, [None, None])
+        self.assertEqual(limits.total_size, 30)
+        for i in xrange(100):
+            limits.checkImport('a', i)
+        self.assertEqual(limits.imports, 100)
+
+    def test_0100_document_size(self):
+        limits = ResourceLimits(max_document_size=15)
+        self.assertEqual(limits.load(self.loader, 'a'), 'a' * 10)
+        # the loader did not enforce it.
+        self.assertRaises(ResourceLimitExceededError,
+            limits.load, self.loader, 'b')
+        self.assertEqual(self.loader.max_sizes, [15, 15])
+
+    def test_0101_total_size(self):
+        limits = ResourceLimits(max_document_size=15, max_total_size=25)
+        self.assertEqual(limits.maxSize(), 15)
+        limits.load(self.loader, 'a')
+        self.assertEqual(limits.maxSize(), 15)
+        limits.load(self.loader, 'a')
+        self.assertEqual(limits.maxSize(), 5)
+        self.assertRaises(ResourceLimitExceededError,
+            limits.load, self.loader, 'a')
+        self.assertEqual(limits.maxSize(), 0)
+        self.assertEqual(self.loader.max_sizes, [15, 15, 5])
+
+    def test_0200_imports(self):
+        limits = ResourceLimits(max_imports=2, max_depth=3)
+        limits.checkImport('a', 1)
+        limits.checkImport('b', 3)
+        self.assertRaises(ResourceLimitExceededError,
+            limits.checkImport, 'c', 1)
+        limits = ResourceLimits(max_depth=3)
+        self.assertRaises(ResourceLimitExceededError,
+            limits.checkImport, 'a', 4)
+
+
+    def test_0300_deadline(self):
+        limits = ResourceLimits(deadline=Deadline(60))
+        self.assertEqual(limits.load(self.loader, 'a'), 'a' * 10)
+        self.assertTrue(0 < self.loader.timeouts[0] <= 60)
+        # failures past the deadline are reported as such.
+        limits = ResourceLimits(deadline=Deadline(0.01))
+        time.sleep(0.02)
+        self.assertRaises(DeadlineExceededError,
+            limits.load, self.loader, 'a')
+        self.assertEqual(len(self.loader.timeouts), 1)
+
+        def slow(location, timeout=None):
+            time.sleep(timeout)
+            raise urllib2.URLError('timed out')
+
+        limits = ResourceLimits(deadline=Deadline(0.01))
+        self.assertRaises(DeadlineExceededError, limits.load, slow, 'a')
+        limits = ResourceLimits(deadline=Deadline(60))
+        self.assertRaises(urllib2.URLError,
+            limits.load, self.loader, 'missing')
+
+
+class LoadReportTestCase(unittest.TestCase):
+
+    def test_0000_skip(self):
+        report = LoadReport()
+        report.skip('a', 'refused')
+        report.skip('b', 'not found')
+        report.skip('a', 'refused')
+        self.assertEqual(report.skipped, [('a', 'refused'),
+            ('b', 'not found')])
+
+    def test_0100_resolver(self):
+        report = LoadReport()
+        resolver = ImportResolver(RecordingLoader({'a': model()}),
+            report=report)
+        resolver.resolve(FakeModel(model('a', 'missing')), 'root')
+        manifest = resolver.manifest(u'root')
+        self.assertEqual([url for url, value in manifest[1]],
+            ['a', 'missing'])
+        self.assertEqual(manifest[1][1][1], None)
+        self.assertEqual(report.skipped, [('missing', '`missing` not found')])
+        resolver.close()
+
+
+class ImportResolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = RecordingLoader({
+            'http://e/a.xml': model('b.xml', 'sub/c.xml'),
+            'http://e/b.xml': model(),
+            'http://e/sub/c.xml': model('d.xml'),
+            'http://e/sub/d.xml': model(),
+        })
+
+    def tearDown(self):
+        pass
+
+    def test_0000_prefetch(self):
+        resolver = ImportResolver(self.loader, workers=2)
+        resolver.fetch('http://e/a.xml', 1).result()
+        resolver.documents['http://e/sub/c.xml'].result()
+        self.assertEqual(sorted(resolver.documents),
+            sorted(self.loader.documents))
+        resolver.documents['http://e/sub/d.xml'].result()
+        # prefetched documents are not imports until they are reached.
+        self.assertEqual(resolver.imported, [])
+        self.assertEqual(resolver.limits.imports, 0)
+        self.assertTrue(resolver.documents['http://e/b.xml'] is
+            resolver.fetch('http://e/b.xml', 2))
+        resolver.close()
+
+    def test_0001_prefetch_limits(self):
+        resolver = ImportResolver(self.loader, workers=2,
+            limits=ResourceLimits(max_depth=2))
+        resolver.fetch('http://e/a.xml', 1).result()
+        resolver.documents['http://e/sub/c.xml'].result()
+        self.assertEqual(sorted(resolver.documents),
+            ['http://e/a.xml', 'http://e/b.xml', 'http://e/sub/c.xml'])
+        resolver.close()
+
+        resolver = ImportResolver(self.loader, workers=2,
+            limits=ResourceLimits(max_imports=2))
+        resolver.fetch('http://e/a.xml', 1).result()
+        self.assertEqual(sorted(resolver.documents),
+            ['http://e/a.xml', 'http://e/b.xml'])
+        resolver.close()
+
+    def test_0002_prefetch_inline(self):
+        # without any workers the imports are fetched as needed.
+        resolver = ImportResolver(self.loader)
+        resolver.fetch('http://e/a.xml', 1).result()
+        self.assertEqual(resolver.documents.keys(), ['http://e/a.xml'])
+        resolver.close()
+
+
+    def test_0003_prefetch_xml_base(self):
+        source = model('c.xml').replace('name="m"', 'xml:base="sub/"')
+        self.loader.documents['http://e/y.xml'] = source
+        resolver = ImportResolver(self.loader, workers=2)
+        resolver.fetch('http://e/y.xml', 0).result()
+        resolver.resolve(FakeModel(source), 'http://e/y.xml')
+        # the imports prefetched are the ones instantiated.
+        self.assertEqual(resolver.imported,
+            ['http://e/sub/c.xml', 'http://e/sub/d.xml'])
+        self.assertEqual(sorted(resolver.documents), ['http://e/sub/c.xml',
+            'http://e/sub/d.xml', 'http://e/y.xml'])
+        resolver.close()
+
+    def test_0100_manifest(self):
+        root = self.loader.documents.pop('http://e/a.xml')
+        resolver = ImportResolver(self.loader)
+        tree = FakeModel(root)
+        resolver.resolve(tree, 'http://e/a.xml')
+        manifest = resolver.manifest(root)
+        self.assertEqual([url for url, value in manifest[1]],
+            ['http://e/b.xml', 'http://e/sub/c.xml', 'http://e/sub/d.xml'])
+        resolver.close()
+
+        # the document that is no longer imported is left out, even as
+        # it was fetched to validate the previous manifest.
+        self.loader.documents['http://e/sub/c.xml'] = model()
+        resolver = ImportResolver(self.loader)
+        changed = resolver.changes(manifest, root)
+        self.assertEqual(changed, set(['http://e/sub/c.xml']))
+        self.assertEqual(resolver.refresh(tree, 'http://e/a.xml', changed), 1)
+        self.assertEqual(tree.imports[1].importedModel.imports, [])
+        manifest = resolver.manifest(root)
+        self.assertEqual(sorted(url for url, value in manifest[1]),
+            ['http://e/b.xml', 'http://e/sub/c.xml'])
+        self.assertEqual(resolver.changes(manifest, root), set())
+        resolver.close()
+
+
+    def test_0101_refresh_failure(self):
+        root = self.loader.documents.pop('http://e/a.xml')
+        resolver = ImportResolver(self.loader)
+        tree = FakeModel(root)
+        resolver.resolve(tree, 'http://e/a.xml')
+        resolver.close()
+        c = tree.imports[1].importedModel
+
+        # the model is left as it was if a replacement cannot be used.
+        del self.loader.documents['http://e/sub/c.xml']
+        resolver = ImportResolver(self.loader)
+        self.assertRaises(urllib2.URLError, resolver.refresh, tree,
+            'http://e/a.xml', set(['http://e/b.xml', 'http://e/sub/c.xml']))
+        resolver.close()
+        self.assertTrue(tree.imports[1].importedModel is c)
+        self.assertTrue(tree.imports[0].wasInstantiated)
+
+        self.loader.documents['http://e/sub/c.xml'] = '<model'
+        resolver = ImportResolver(self.loader)
+        self.assertRaises(ValueError, resolver.refresh, tree,
+            'http://e/a.xml', set(['http://e/sub/c.xml']))
+        resolver.close()
+        self.assertTrue(tree.imports[1].importedModel is c)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(ResourceLimitsTestCase))
+    suite.addTest(makeSuite(LoadReportTestCase))
+    suite.addTest(makeSuite(ImportResolverTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
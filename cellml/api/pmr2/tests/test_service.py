@@ -0,0 +1,160 @@
+import unittest
+import os
+import time
+import urllib2
+
+from cellml.api.pmr2 import worker
+from cellml.api.pmr2.interfaces import WorkerCrashError
+from cellml.api.pmr2.interfaces import WorkerError
+from cellml.api.pmr2.interfaces import WorkerTimeoutError
+from cellml.api.pmr2.service import WorkerPool
+
+
+class DummyUtility(object):
+    """
+    Stands in for the utility in the worker processes, as these tests
+    are about the pool itself.
+    """
+
+    model_loader = None
+    vacs_service = None
+
+
+def echoJob(utility, value):
+    return value
+
+
+def pidJob(utility):
+    return os.getpid()
+
+
+def sleepJob(utility, duration):
+    time.sleep(duration)
+    return duration
+
+
+def failJob(utility, message):
+    raise ValueError(message)
+
+
+def notFoundJob(utility, url):
+    # cannot be unpickled by the pool.
+    raise urllib2.HTTPError(url, 404, 'Not Found', {}, None)
+
+
+def notFoundResultJob(utility, url):
+    return urllib2.HTTPError(url, 404, 'Not Found', {}, None)
+
+
+def crashJob(utility):
+    os._exit(1)
+
+
+def settingJob(utility, name):
+    return getattr(utility, name)
+
+
+test_jobs = {
+    'echo': echoJob,
+    'pid': pidJob,
+    'sleep': sleepJob,
+    'fail': failJob,
+    'notfound': notFoundJob,
+    'notfoundresult': notFoundResultJob,
+    'crash': crashJob,
+    'setting': settingJob,
+}
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # the worker processes are forked, so they inherit these.
+        self.utility = worker._utility
+        worker._utility = DummyUtility()
+        worker.jobs.update(test_jobs)
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.close()
+        worker._utility = self.utility
+        for name in test_jobs:
+            del worker.jobs[name]
+
+    def test_0000_call(self):
+        self.pool = WorkerPool(size=2)
+        self.assertEqual(self.pool.call('echo', 'value'), 'value')
+        futures = [self.pool.submit('echo', i) for i in range(10)]
+        self.assertEqual([f.result() for f in futures], range(10))
+
+    def test_0001_unknown(self):
+        self.pool = WorkerPool(size=1)
+        self.assertRaises(ValueError, self.pool.submit, 'unknown')
+
+    def test_0002_error(self):
+        self.pool = WorkerPool(size=1)
+        self.assertRaises(ValueError, self.pool.call, 'fail', 'message')
+        # worker is still usable.
+        self.assertEqual(self.pool.call('echo', 1), 1)
+
+    def test_0003_error_unpicklable(self):
+        self.pool = WorkerPool(size=1)
+        try:
+            self.pool.call('notfound', 'http://example.com/a.cellml')
+        except WorkerError, e:
+            self.assertTrue(str(e).startswith('HTTPError: '))
+        else:
+            self.fail('WorkerError not raised')
+        self.assertEqual(self.pool.call('echo', 1), 1)
+        # the worker is replaced, and the pool is still usable.
+        self.assertRaises(WorkerError, self.pool.call, 'notfoundresult',
+            'http://example.com/a.cellml')
+        self.assertEqual(self.pool.recycled, 1)
+        self.assertEqual(self.pool.call('echo', 2), 2)
+
+    def test_0100_recycle_max_jobs(self):
+        self.pool = WorkerPool(size=1, max_jobs=2)
+        pids = [self.pool.call('pid') for i in range(4)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertEqual(self.pool.recycled, 2)
+
+    def test_0101_recycle_max_rss(self):
+        self.pool = WorkerPool(size=1, max_rss=1)
+        pids = [self.pool.call('pid') for i in range(2)]
+        self.assertNotEqual(pids[0], pids[1])
+
+    def test_0200_timeout(self):
+        self.pool = WorkerPool(size=1, timeout=0.2)
+        self.assertRaises(WorkerTimeoutError, self.pool.call, 'sleep', 5)
+        self.assertEqual(self.pool.call('sleep', 0), 0)
+
+    def test_0201_crash(self):
+        self.pool = WorkerPool(size=1)
+        self.assertRaises(WorkerCrashError, self.pool.call, 'crash')
+        self.assertEqual(self.pool.call('echo', 1), 1)
+
+    def test_0300_backpressure(self):
+        self.pool = WorkerPool(size=1, max_pending=1)
+        self.pool.submit('sleep', 0.3)
+        start = time.time()
+        future = self.pool.submit('echo', 1)
+        # had to wait for the first job to complete.
+        self.assertTrue(time.time() - start >= 0.2)
+        self.assertEqual(future.result(), 1)
+
+    def test_0400_settings(self):
+        self.pool = WorkerPool(size=1, settings={'max_imports': 3})
+        self.assertEqual(self.pool.call('setting', 'max_imports'), 3)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(WorkerPoolTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
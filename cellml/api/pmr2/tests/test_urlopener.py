@@ -1,13 +1,88 @@
 import unittest
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+import BaseHTTPServer
 from lxml import etree
 from cStringIO import StringIO
-from os.path import basename, dirname, join
+from os.path import abspath, basename, dirname, join
 import urllib2
 from urlparse import urljoin
 
+from cellml.api.pmr2.interfaces import CircuitOpenError
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import ResourceLimitExceededError
 from cellml.api.pmr2.interfaces import UnapprovedProtocolError
 from cellml.api.pmr2.urlopener import BaseURLOpener
 from cellml.api.pmr2.urlopener import DefaultURLOpener
+from cellml.api.pmr2.interfaces import IAsyncURLOpener
+from cellml.api.pmr2.urlopener import ArchiveURLOpener
+from cellml.api.pmr2.urlopener import AsyncURLOpener
+from cellml.api.pmr2.urlopener import CachingURLOpener
+from cellml.api.pmr2.urlopener import GitURLOpener
+from cellml.api.pmr2.urlopener import GuardedURLOpener
+from cellml.api.pmr2.urlopener import HTTPConnectionPool
+from cellml.api.pmr2.urlopener import LocalURLOpener
+from cellml.api.pmr2.urlopener import PooledURLOpener
+from cellml.api.pmr2.urlopener import checkSize
+from cellml.api.pmr2.urlopener import read_chunk_size
+from cellml.api.pmr2.urlopener import readResponse
+
+
+def gzipped(data):
+    obj = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return obj.compress(data) + obj.flush()
+
+input_dir = join(dirname(abspath(__file__)), 'input')
+
+
+class DummyURLOpener(DefaultURLOpener):
+    """
+    Serves documents from a dictionary, honoring If-None-Match.
+    """
+
+    def __init__(self, documents):
+        DefaultURLOpener.__init__(self)
+        self.documents = documents
+        self.requests = []
+
+    def openURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        headers = dict(headers or [])
+        self.requests.append((location, headers))
+        data, etag = self.documents[location]
+        if headers.get('If-None-Match') == etag:
+            raise urllib2.HTTPError(location, 304, 'Not Modified', {}, None)
+        checkSize(len(data), location, max_size)
+        return data, {'etag': etag}
+
+
+class FailingURLOpener(DefaultURLOpener):
+    """
+    Serves documents from a dictionary, raising the errors within.
+    """
+
+    def __init__(self, documents):
+        DefaultURLOpener.__init__(self)
+        self.documents = documents
+        self.requests = []
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        self.requests.append(location)
+        result = self.documents[location]
+        if isinstance(result, Exception):
+            raise result
+        checkSize(len(result), location, max_size)
+        return result
 
 
 class URLOpenerTestCase(unittest.TestCase):
@@ -27,14 +102,764 @@ class URLOpenerTestCase(unittest.TestCase):
         fileurl = 'file:///'
         self.assertRaises(UnapprovedProtocolError, self.opener, fileurl)
 
+    def test_0150_readResponse(self):
+        data = 'x' * 100000
+        self.assertEqual(readResponse(StringIO(data), 'loc'), data)
+        self.assertEqual(readResponse(StringIO(data), 'loc', 100000), data)
+        self.assertRaises(ResourceLimitExceededError, readResponse,
+            StringIO(data), 'loc', 99999)
+        self.assertRaises(ResourceLimitExceededError, readResponse,
+            StringIO(data), 'loc', 0)
+        self.assertEqual(readResponse(StringIO(''), 'loc', 0), '')
+
+    def test_0151_readResponse_length(self):
+        data = 'x' * 100000
+        counted = []
+        counter = lambda *a: counted.append(a)
+        self.assertEqual(readResponse(StringIO(data), 'loc', 100000,
+            length=100000, counter=counter), data)
+        # shorter than declared.
+        self.assertEqual(readResponse(StringIO(data), 'loc', 200000,
+            length=150000, counter=counter), data)
+        self.assertEqual(counted, [(100000, 100000), (100000, 100000)])
+        # declared length alone is enough to exceed the limit.
+        self.assertRaises(ResourceLimitExceededError, readResponse,
+            StringIO(''), 'loc', 99999, length=100000)
+
+    def test_0152_readResponse_encoding(self):
+        data = '<model name="x"/>' * 10000
+        counted = []
+        counter = lambda *a: counted.append(a)
+        compressed = gzipped(data)
+        self.assertEqual(readResponse(StringIO(compressed), 'loc',
+            encoding='gzip', length=len(compressed), counter=counter), data)
+        self.assertEqual(counted, [(len(compressed), len(data))])
+        self.assertEqual(readResponse(StringIO(zlib.compress(data)), 'loc',
+            encoding='deflate'), data)
+        # raw deflate stream without the zlib header.
+        self.assertEqual(readResponse(StringIO(zlib.compress(data)[2:-4]),
+            'loc', encoding='deflate'), data)
+        self.assertEqual(readResponse(StringIO(data), 'loc',
+            encoding='identity'), data)
+        self.assertRaises(urllib2.URLError, readResponse, StringIO(data),
+            'loc', encoding='gzip')
+        self.assertRaises(urllib2.URLError, readResponse, StringIO(data),
+            'loc', encoding='br')
+
+    def test_0153_readResponse_encoding_max_size(self):
+        data = '\0' * 10000000
+        compressed = gzipped(data)
+        self.assertTrue(len(compressed) < read_chunk_size)
+        self.assertRaises(ResourceLimitExceededError, readResponse,
+            StringIO(compressed), 'loc', 100000, encoding='gzip')
+        self.assertEqual(readResponse(StringIO(compressed), 'loc',
+            len(data), encoding='gzip'), data)
+
+    def test_0200_canonical(self):
+        c = self.opener.canonicalURL
+        self.assertEqual(c('HTTP://Example.COM:80/a/./b/../c.xml#frag'),
+            'http://example.com/a/c.xml')
+        self.assertEqual(c('https://example.com:443/a/'),
+            'https://example.com/a/')
+        self.assertEqual(c('http://example.com:8080/a?b=c'),
+            'http://example.com:8080/a?b=c')
+        self.assertEqual(c('file:///tmp/a/../b.xml'), 'file:///tmp/b.xml')
+        stream = StringIO()
+        self.assertEqual(c(stream), stream)
+
     # testcases for successful invocations will be left for the ones
     # that integrate this class.
 
 
+class CachingURLOpenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = {
+            'http://example.com/a.cellml': ('<model name="a"/>', '"a1"'),
+            'http://example.com/b.cellml': ('<model name="b"/>', '"b1"'),
+        }
+        self.backend = DummyURLOpener(self.documents)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_0000_badprotocol(self):
+        opener = CachingURLOpener(self.backend, max_age=None)
+        self.assertRaises(UnapprovedProtocolError, opener, 'file:///')
+        self.assertEqual(opener.approved_protocol, ['http', 'https'])
+
+    def test_0001_badprotocol_cached(self):
+        # approval is still checked for documents already cached.
+        opener = CachingURLOpener(self.backend, max_age=None)
+        url = 'http://example.com/a.cellml'
+        opener(url)
+        self.backend.approved_protocol.remove('http')
+        self.assertRaises(UnapprovedProtocolError, opener, url)
+
+    def test_0100_hit(self):
+        opener = CachingURLOpener(self.backend, max_age=None)
+        url = 'http://example.com/a.cellml'
+        self.assertEqual(opener(url), '<model name="a"/>')
+        self.assertEqual(opener(url), '<model name="a"/>')
+        self.assertEqual(len(self.backend.requests), 1)
+        self.assertEqual(opener.stats()['hits'], 1)
+        self.assertEqual(opener.stats()['misses'], 1)
+
+    def test_0104_max_size(self):
+        opener = CachingURLOpener(self.backend, max_age=None)
+        url = 'http://example.com/a.cellml'
+        self.assertRaises(ResourceLimitExceededError, opener, url, 5)
+        self.assertEqual(opener(url), '<model name="a"/>')
+        # also enforced for the cached documents.
+        self.assertRaises(ResourceLimitExceededError, opener, url, 5)
+        self.assertEqual(opener(url, 100), '<model name="a"/>')
+
+    def test_0101_revalidate(self):
+        opener = CachingURLOpener(self.backend, max_age=0)
+        url = 'http://example.com/a.cellml'
+        self.assertEqual(opener(url), '<model name="a"/>')
+        self.assertEqual(opener(url), '<model name="a"/>')
+        self.assertEqual(self.backend.requests[1][1],
+            {'If-None-Match': '"a1"'})
+        self.assertEqual(opener.stats()['revalidated'], 1)
+
+        self.documents[url] = ('<model name="a2"/>', '"a2"')
+        self.assertEqual(opener(url), '<model name="a2"/>')
+        self.assertEqual(opener.stats()['misses'], 2)
+
+    def test_0102_evict(self):
+        opener = CachingURLOpener(self.backend, max_size=20, max_age=None)
+        opener('http://example.com/a.cellml')
+        opener('http://example.com/b.cellml')
+        self.assertEqual(opener.stats()['memory_entries'], 1)
+        opener('http://example.com/a.cellml')
+        self.assertEqual(len(self.backend.requests), 3)
+
+    def test_0103_pickle(self):
+        opener = CachingURLOpener(self.backend, max_age=None)
+        url = 'http://example.com/a.cellml'
+        opener(url)
+        opener = pickle.loads(pickle.dumps(opener))
+        self.assertEqual(opener(url), '<model name="a"/>')
+        self.assertEqual(opener.stats()['hits'], 1)
+
+    def test_0200_store(self):
+        url = 'http://example.com/a.cellml'
+        opener = CachingURLOpener(self.backend, store_path=self.tmpdir,
+            max_age=None)
+        opener(url)
+        # a new opener sharing the same store.
+        opener = CachingURLOpener(self.backend, store_path=self.tmpdir,
+            max_age=0)
+        self.assertEqual(opener(url), '<model name="a"/>')
+        self.assertEqual(opener.stats()['revalidated'], 1)
+        self.assertEqual(len(self.backend.requests), 2)
+
+
+class GuardedURLOpenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = {
+            'http://a.example.com/model': 'model',
+            'http://a.example.com/missing': urllib2.HTTPError(
+                'http://a.example.com/missing', 404, 'Not Found', {}, None),
+            'http://b.example.com/1': urllib2.URLError('refused'),
+            'http://b.example.com/2': urllib2.URLError('refused'),
+            'http://b.example.com/3': socket.timeout('timed out'),
+        }
+        self.wrapped = FailingURLOpener(self.documents)
+        self.opener = GuardedURLOpener(self.wrapped, ttl=60, threshold=2,
+            reset_timeout=60)
+
+    def tearDown(self):
+        pass
+
+    def test_0000_basic(self):
+        self.assertEqual(self.opener('http://a.example.com/model'), 'model')
+        self.assertRaises(UnapprovedProtocolError, self.opener, 'file:///')
+        self.assertRaises(ResourceLimitExceededError, self.opener,
+            'http://a.example.com/model', 1)
+        self.assertEqual(self.opener.stats(), {
+            'failed_fast': 0,
+            'failed_entries': 0,
+            'open_hosts': [],
+        })
+
+    def test_0100_negative_cache(self):
+        missing = 'http://a.example.com/missing'
+        self.assertRaises(urllib2.HTTPError, self.opener, missing)
+        self.assertRaises(urllib2.HTTPError, self.opener, missing)
+        self.assertEqual(self.wrapped.requests, [missing])
+        self.assertEqual(self.opener.stats()['failed_fast'], 1)
+        # documents that are missing do not fail the host.
+        self.assertRaises(urllib2.HTTPError, self.opener, missing)
+        self.assertEqual(self.opener('http://a.example.com/model'), 'model')
+
+        self.opener.failed.set(missing, (0, None))
+        self.assertRaises(urllib2.HTTPError, self.opener, missing)
+        self.assertEqual(self.wrapped.requests.count(missing), 2)
+
+        self.opener.invalidate(missing)
+        self.documents[missing] = 'found'
+        self.assertEqual(self.opener(missing), 'found')
+
+    def test_0101_negative_cache_ttl(self):
+        opener = GuardedURLOpener(self.wrapped, ttl=0)
+        missing = 'http://a.example.com/missing'
+        self.assertRaises(urllib2.HTTPError, opener, missing)
+        self.assertRaises(urllib2.HTTPError, opener, missing)
+        self.assertEqual(self.wrapped.requests, [missing, missing])
+
+    def test_0200_circuit(self):
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/1')
+        # timeouts while reading are failures of the host also.
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/3')
+        self.assertEqual(self.opener.stats()['open_hosts'],
+            ['http://b.example.com'])
+        self.assertRaises(CircuitOpenError, self.opener,
+            'http://b.example.com/2')
+        self.assertEqual(self.wrapped.requests, ['http://b.example.com/1',
+            'http://b.example.com/3'])
+        # other hosts are unaffected.
+        self.assertEqual(self.opener('http://a.example.com/model'), 'model')
+
+    def test_0201_circuit_probe(self):
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/1')
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/2')
+        breaker = self.opener.hosts['http://b.example.com']
+        self.assertFalse(breaker.closed)
+
+        # the probe fails, opening the circuit again.
+        breaker.opened = 0
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/3')
+        self.assertRaises(CircuitOpenError, self.opener,
+            'http://b.example.com/4')
+        self.assertEqual(len(self.wrapped.requests), 3)
+
+        # the probe succeeds.
+        breaker.opened = 0
+        self.documents['http://b.example.com/4'] = 'model'
+        self.assertEqual(self.opener('http://b.example.com/4'), 'model')
+        self.assertTrue(breaker.closed)
+        self.assertEqual(breaker.failures, 0)
+
+    def test_0202_circuit_single_probe(self):
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/1')
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/2')
+        breaker = self.opener.hosts['http://b.example.com']
+        breaker.opened = 0
+        self.assertTrue(breaker.allow(60))
+        # only one probe at a time.
+        self.assertFalse(breaker.allow(60))
+
+    def test_0203_circuit_probe_unexpected_error(self):
+        opener = GuardedURLOpener(self.wrapped, threshold=2, reset_timeout=0)
+        self.assertRaises(urllib2.URLError, opener, 'http://b.example.com/1')
+        self.assertRaises(urllib2.URLError, opener, 'http://b.example.com/2')
+        # not within the documents.
+        self.assertRaises(KeyError, opener, 'http://b.example.com/4')
+        self.documents['http://b.example.com/4'] = 'model'
+        self.assertEqual(opener('http://b.example.com/4'), 'model')
+        self.assertTrue(opener.hosts['http://b.example.com'].closed)
+
+    def test_0204_circuit_caller_timeout(self):
+        opener = GuardedURLOpener(self.wrapped, threshold=1)
+        timedout = 'http://b.example.com/3'
+        self.documents['http://b.example.com/4'] = urllib2.URLError(
+            socket.timeout('timed out'))
+        self.assertRaises(urllib2.URLError, opener, timedout, timeout=0.01)
+        self.assertRaises(urllib2.URLError, opener,
+            'http://b.example.com/4', timeout=0.01)
+        self.documents[timedout] = 'model'
+        self.assertEqual(opener(timedout, timeout=30), 'model')
+        self.assertEqual(self.wrapped.requests, [timedout,
+            'http://b.example.com/4', timedout])
+        self.assertEqual(opener.stats()['failed_entries'], 0)
+        # without the timeout of a caller the host is failing.
+        self.documents[timedout] = socket.timeout('timed out')
+        self.assertRaises(urllib2.URLError, opener, timedout)
+        self.assertRaises(CircuitOpenError, opener, 'http://b.example.com/5')
+
+    def test_0205_circuit_probe_deadline(self):
+        opener = GuardedURLOpener(self.wrapped, threshold=2, reset_timeout=0)
+        self.assertRaises(urllib2.URLError, opener, 'http://b.example.com/1')
+        self.assertRaises(urllib2.URLError, opener, 'http://b.example.com/2')
+        self.documents['http://b.example.com/4'] = DeadlineExceededError(
+            'load exceeded the deadline')
+        self.assertRaises(DeadlineExceededError, opener,
+            'http://b.example.com/4')
+        self.assertFalse(opener.hosts['http://b.example.com'].probing)
+        self.documents['http://b.example.com/4'] = 'model'
+        self.assertEqual(opener('http://b.example.com/4'), 'model')
+
+    def test_0300_pickle(self):
+        # the HTTPError of the wrapped opener cannot be pickled.
+        del self.documents['http://a.example.com/missing']
+        self.assertRaises(urllib2.URLError, self.opener,
+            'http://b.example.com/1')
+        opener = pickle.loads(pickle.dumps(self.opener))
+        self.assertEqual(opener.hosts, {})
+        self.assertEqual(len(opener.failed), 0)
+        self.assertEqual(opener.threshold, 2)
+
+
+class AsyncURLOpenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = {
+            'http://example.com/a.cellml': ('<model name="a"/>', '"a1"'),
+        }
+        self.opener = AsyncURLOpener(DummyURLOpener(self.documents), 2)
+
+    def tearDown(self):
+        self.opener.pool.shutdown()
+
+    def test_0000_basic(self):
+        self.assertTrue(IAsyncURLOpener.providedBy(self.opener))
+        url = 'http://example.com/a.cellml'
+        self.assertEqual(self.opener.loadURLAsync(url).result(),
+            '<model name="a"/>')
+        self.assertEqual(self.opener(url), '<model name="a"/>')
+
+    def test_0001_badprotocol(self):
+        future = self.opener.loadURLAsync('file:///')
+        self.assertTrue(future.done())
+        self.assertRaises(UnapprovedProtocolError, future.result)
+        self.assertRaises(UnapprovedProtocolError, self.opener, 'file:///')
+
+    def test_0002_error(self):
+        future = self.opener.loadURLAsync('http://example.com/missing')
+        self.assertRaises(KeyError, future.result)
+
+    def test_0003_max_size(self):
+        url = 'http://example.com/a.cellml'
+        future = self.opener.loadURLAsync(url, 5)
+        self.assertRaises(ResourceLimitExceededError, future.result)
+        future = self.opener.loadURLAsync(url, 100)
+        self.assertEqual(future.result(), '<model name="a"/>')
+
+
+class LocalURLOpenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.opener = LocalURLOpener(input_dir)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_0000_load(self):
+        url = self.opener.url('multiimport.xml')
+        self.assertTrue(url.startswith('file:///'))
+        fd = open(join(input_dir, 'multiimport.xml'), 'rb')
+        try:
+            self.assertEqual(self.opener(url), fd.read())
+        finally:
+            fd.close()
+        url = self.opener.urljoin(url, 'subdir1/level1.xml')
+        self.assertTrue('level1_component' in self.opener(url))
+
+    def test_0001_missing(self):
+        self.assertRaises(urllib2.URLError, self.opener,
+            self.opener.url('missing.xml'))
+
+    def test_0002_empty(self):
+        open(join(self.tmpdir, 'empty.xml'), 'wb').close()
+        opener = LocalURLOpener(self.tmpdir)
+        self.assertEqual(opener(opener.url('empty.xml')), '')
+
+    def test_0003_max_size(self):
+        url = self.opener.url('multiimport.xml')
+        self.assertRaises(ResourceLimitExceededError, self.opener, url, 10)
+
+    def test_0100_confined(self):
+        url = self.opener.url('subdir1', 'level1.xml')
+        self.assertRaises(UnapprovedProtocolError, self.opener,
+            self.opener.urljoin(url, '../../test_urlopener.py'))
+        self.assertRaises(UnapprovedProtocolError, self.opener,
+            'http://example.com/model.cellml')
+        self.assertRaises(UnapprovedProtocolError, self.opener,
+            'file://example.com' + join(input_dir, 'level2.xml'))
+        # symbolic links out of the root are not followed.
+        os.symlink(join(input_dir, 'level2.xml'),
+            join(self.tmpdir, 'link.xml'))
+        opener = LocalURLOpener(self.tmpdir)
+        self.assertRaises(UnapprovedProtocolError, opener,
+            opener.url('link.xml'))
+
+
+class ArchiveURLOpenerTestCase(unittest.TestCase):
+
+    members = ['multiimport.xml', 'level2.xml', 'subdir1/level1.xml']
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.zip_path = join(self.tmpdir, 'models.zip')
+        archive = zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED)
+        for name in self.members:
+            archive.write(join(input_dir, name), 'workspace/' + name)
+        archive.close()
+        self.tar_path = join(self.tmpdir, 'models.tar.gz')
+        archive = tarfile.open(self.tar_path, 'w:gz')
+        for name in self.members:
+            archive.add(join(input_dir, name), 'workspace/' + name)
+        archive.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check(self, opener):
+        url = opener.url('multiimport.xml')
+        self.assertEqual(url, 'archive:///multiimport.xml')
+        self.assertTrue('level1.xml' in opener(url))
+        level1 = opener.urljoin(url, 'subdir1/level1.xml')
+        self.assertEqual(level1, 'archive:///subdir1/level1.xml')
+        self.assertTrue('level1_component' in opener(level1))
+        level2 = opener.urljoin(level1, '../level2.xml')
+        self.assertEqual(level2, 'archive:///level2.xml')
+        self.assertTrue('level2_component' in opener(level2))
+        # cannot escape the root.
+        self.assertEqual(opener.urljoin(level1, '../../../level2.xml'),
+            'archive:///level2.xml')
+        self.assertEqual(opener.canonicalURL('archive:///a/../level2.xml'),
+            'archive:///level2.xml')
+        self.assertRaises(urllib2.URLError, opener, opener.url('missing'))
+        self.assertRaises(urllib2.URLError, opener, opener.url('subdir1'))
+        self.assertRaises(ResourceLimitExceededError, opener, level2, 10)
+        self.assertRaises(UnapprovedProtocolError, opener,
+            'file://' + join(input_dir, 'level2.xml'))
+
+    def test_0000_zip(self):
+        opener = ArchiveURLOpener(self.zip_path, 'workspace')
+        self.check(opener)
+        opener.close()
+
+    def test_0001_tar(self):
+        opener = ArchiveURLOpener(self.tar_path, 'workspace/')
+        self.check(opener)
+        opener.close()
+
+    def test_0002_pickle(self):
+        opener = ArchiveURLOpener(self.zip_path, 'workspace')
+        opener(opener.url('level2.xml'))
+        copy = pickle.loads(pickle.dumps(opener))
+        self.assertTrue('level2_component' in copy(copy.url('level2.xml')))
+        opener.close()
+        copy.close()
+
+    def test_0003_threads(self):
+        opener = ArchiveURLOpener(self.tar_path, 'workspace')
+        results = []
+
+        def load():
+            for name in self.members * 5:
+                results.append(opener(opener.url(name)))
+
+        threads = [threading.Thread(target=load) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 60)
+        self.assertEqual(len(set(results)), 3)
+        opener.close()
+
+
+class GitURLOpenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.git('init', '-q')
+        os.mkdir(join(self.repo, 'workspace'))
+        os.mkdir(join(self.repo, 'workspace', 'subdir1'))
+        for name in ('multiimport.xml', 'level2.xml', 'subdir1/level1.xml'):
+            shutil.copy(join(input_dir, name),
+                join(self.repo, 'workspace', name))
+        self.first = self.commit('first')
+        fd = open(join(self.repo, 'workspace', 'level2.xml'), 'wb')
+        fd.write('<model name="changed"/>')
+        fd.close()
+        self.second = self.commit('second')
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def git(self, *args):
+        env = dict(os.environ, GIT_AUTHOR_NAME='test',
+            GIT_AUTHOR_EMAIL='test@example.com', GIT_COMMITTER_NAME='test',
+            GIT_COMMITTER_EMAIL='test@example.com')
+        process = subprocess.Popen(('git',) + args, cwd=self.repo, env=env,
+            stdout=subprocess.PIPE)
+        return process.communicate()[0].strip()
+
+    def commit(self, message):
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', message)
+        return self.git('rev-parse', 'HEAD')
+
+    def test_0000_revisions(self):
+        first = GitURLOpener(self.repo, self.first, 'workspace')
+        head = GitURLOpener(self.repo, root='workspace')
+        url = first.url('subdir1/level1.xml')
+        self.assertEqual(url, 'git:///subdir1/level1.xml')
+        self.assertTrue('level1_component' in first(url))
+        level2 = first.urljoin(url, '../level2.xml')
+        self.assertTrue('level2_component' in first(level2))
+        self.assertEqual(head(level2), '<model name="changed"/>')
+        self.assertEqual(head.commit, self.second)
+        # the revision is resolved once.
+        self.git('reset', '-q', '--hard', self.first)
+        self.assertEqual(head(level2), '<model name="changed"/>')
+        first.close()
+        head.close()
+
+    def test_0001_errors(self):
+        opener = GitURLOpener(self.repo, self.first, 'workspace')
+        self.assertRaises(urllib2.URLError, opener, opener.url('missing'))
+        self.assertRaises(urllib2.URLError, opener, opener.url('subdir1'))
+        level2 = opener.url('level2.xml')
+        self.assertRaises(ResourceLimitExceededError, opener, level2, 10)
+        # still in sync after skipping the contents.
+        self.assertTrue('level2_component' in opener(level2, 1000))
+        self.assertRaises(UnapprovedProtocolError, opener,
+            'git://example.com/level2.xml')
+        opener.close()
+        bad = GitURLOpener(self.repo, 'missing')
+        self.assertRaises(urllib2.URLError, bad, bad.url('level2.xml'))
+        bad.close()
+
+    def test_0002_process(self):
+        opener = GitURLOpener(self.repo, self.first, 'workspace')
+        url = opener.url('level2.xml')
+        opener(url)
+        process = opener._process
+        opener(opener.url('multiimport.xml'))
+        self.assertTrue(opener._process is process)
+        # restarted if it went away.
+        process.kill()
+        process.wait()
+        self.assertTrue('level2_component' in opener(url))
+        self.assertFalse(opener._process is process)
+        copy = pickle.loads(pickle.dumps(opener))
+        self.assertTrue('level2_component' in copy(url))
+        opener.close()
+        copy.close()
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    documents = {
+        '/a.cellml': '<model name="a"/>',
+        '/b.cellml': '<model name="b"/>',
+    }
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        if self.path == '/slow':
+            time.sleep(0.5)
+            self.path = '/a.cellml'
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/b.cellml')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = self.documents.get(self.path)
+        if body is None:
+            self.send_response(404)
+            body = 'not found'
+        else:
+            self.send_response(200)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzipped(body)
+                self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a):
+        pass
+
+
+class PooledURLOpenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+            KeepAliveHandler)
+        self.server.clients = set()
+        # clients that timed out have gone by the time it responds.
+        self.server.handle_error = lambda request, client_address: None
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_port
+        self.opener = PooledURLOpener(size=2, timeout=5)
+
+    def tearDown(self):
+        self.opener.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_0000_badprotocol(self):
+        self.assertRaises(UnapprovedProtocolError, self.opener, 'file:///')
+
+    def test_0100_keepalive(self):
+        self.assertEqual(self.opener(self.base + '/a.cellml'),
+            '<model name="a"/>')
+        self.assertEqual(self.opener(self.base + '/b.cellml'),
+            '<model name="b"/>')
+        self.assertEqual(self.opener(self.base + '/a.cellml'),
+            '<model name="a"/>')
+        # all requests went through the same connection.
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_0101_redirect(self):
+        self.assertEqual(self.opener(self.base + '/redirect'),
+            '<model name="b"/>')
+
+    def test_0102_notfound(self):
+        self.assertRaises(urllib2.HTTPError,
+            self.opener, self.base + '/missing')
+        # connection is still usable.
+        self.assertEqual(self.opener(self.base + '/a.cellml'),
+            '<model name="a"/>')
+
+    def test_0103_refused(self):
+        self.assertRaises(urllib2.URLError,
+            self.opener, 'http://127.0.0.1:1/a.cellml')
+
+    def test_0105_max_size(self):
+        self.assertRaises(ResourceLimitExceededError, self.opener,
+            self.base + '/a.cellml', 5)
+        self.assertEqual(self.opener(self.base + '/a.cellml', 100),
+            '<model name="a"/>')
+
+    def test_0106_compressed(self):
+        model = '<model name="a"/>'
+        self.assertEqual(self.opener(self.base + '/a.cellml'), model)
+        self.assertEqual(self.opener.stats(), {
+            'received_bytes': len(gzipped(model)),
+            'decoded_bytes': len(model),
+        })
+        self.opener.pool.clear()
+
+        opener = DefaultURLOpener()
+        self.assertEqual(opener(self.base + '/a.cellml'), model)
+        self.assertEqual(opener.stats()['received_bytes'],
+            len(gzipped(model)))
+        self.assertEqual(opener.stats()['decoded_bytes'], len(model))
+        opener.accept_encoding = None
+        self.assertEqual(opener(self.base + '/a.cellml'), model)
+        self.assertEqual(opener.stats()['received_bytes'],
+            len(gzipped(model)) + len(model))
+
+    def test_0107_timeout(self):
+        self.assertRaises(urllib2.URLError, self.opener, self.base + '/slow',
+            timeout=0.1)
+        self.assertEqual(self.opener(self.base + '/a.cellml', timeout=5),
+            '<model name="a"/>')
+        conn, reused = self.opener.pool.acquire('http', self.base[7:])
+        self.assertTrue(reused)
+        # the timeout of the pool is restored.
+        self.assertEqual(conn.timeout, 5)
+        self.assertEqual(conn.sock.gettimeout(), 5)
+        self.opener.pool.release('http', self.base[7:], conn)
+        # the test server is still sleeping on the first request.
+        time.sleep(0.5)
+
+        opener = DefaultURLOpener()
+        self.assertRaises(urllib2.URLError, opener, self.base + '/slow',
+            timeout=0.1)
+        time.sleep(0.5)
+        self.assertEqual(opener(self.base + '/a.cellml', timeout=5),
+            '<model name="a"/>')
+
+    def test_0104_pickle(self):
+        self.opener(self.base + '/a.cellml')
+        opener = pickle.loads(pickle.dumps(self.opener))
+        self.assertEqual(opener.pool._hosts, {})
+        # the test server only serves a single connection at a time.
+        self.opener.pool.clear()
+        self.assertEqual(opener(self.base + '/b.cellml'),
+            '<model name="b"/>')
+        opener.pool.clear()
+
+    def test_0200_pool_size(self):
+        pool = HTTPConnectionPool(size=1)
+        conn, reused = pool.acquire('http', 'example.com')
+        self.assertFalse(reused)
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(
+            pool.acquire('http', 'example.com')))
+        thread.start()
+        thread.join(0.1)
+        # waiting for the connection to be released.
+        self.assertEqual(acquired, [])
+        pool.release('http', 'example.com', conn, True)
+        thread.join(5)
+        self.assertEqual(acquired, [(conn, True)])
+
+    def test_0201_idle_timeout(self):
+        pool = HTTPConnectionPool(size=1, idle_timeout=0)
+        conn, reused = pool.acquire('http', 'example.com')
+        pool.release('http', 'example.com', conn, True)
+        conn2, reused = pool.acquire('http', 'example.com')
+        self.assertFalse(reused)
+        self.assertFalse(conn is conn2)
+
+    def test_0202_pool_timeout(self):
+        pool = HTTPConnectionPool(size=1)
+        conn, reused = pool.acquire('http', 'example.com')
+        started = time.time()
+        self.assertRaises(DeadlineExceededError, pool.acquire, 'http',
+            'example.com', 0.1)
+        self.assertTrue(time.time() - started >= 0.1)
+        pool.release('http', 'example.com', conn, True)
+        self.assertEqual(pool.acquire('http', 'example.com', 0.1),
+            (conn, True))
+
+    def test_0203_idle_reaped(self):
+        pool = HTTPConnectionPool(size=3, idle_timeout=0.1)
+        host = pool._host(('http', 'example.com'))
+        a, reused = pool.acquire('http', 'example.com')
+        b, reused = pool.acquire('http', 'example.com')
+        c, reused = pool.acquire('http', 'example.com')
+        pool.release('http', 'example.com', a, True)
+        pool.release('http', 'example.com', b, True)
+        time.sleep(0.15)
+        # the connections expired are closed on release, not only the
+        # ones reused.
+        pool.release('http', 'example.com', c, True)
+        self.assertEqual(list(host['idle'])[0][0], c)
+        self.assertEqual(host['count'], 1)
+        self.assertEqual(pool.acquire('http', 'example.com'), (c, True))
+        pool.release('http', 'example.com', c, True)
+        time.sleep(0.15)
+        conn, reused = pool.acquire('http', 'example.com')
+        self.assertFalse(reused)
+        self.assertEqual(host['count'], 1)
+        self.assertEqual(len(host['idle']), 0)
+
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
     suite.addTest(makeSuite(URLOpenerTestCase))
+    suite.addTest(makeSuite(CachingURLOpenerTestCase))
+    suite.addTest(makeSuite(GuardedURLOpenerTestCase))
+    suite.addTest(makeSuite(AsyncURLOpenerTestCase))
+    suite.addTest(makeSuite(LocalURLOpenerTestCase))
+    suite.addTest(makeSuite(ArchiveURLOpenerTestCase))
+    suite.addTest(makeSuite(GitURLOpenerTestCase))
+    suite.addTest(makeSuite(PooledURLOpenerTestCase))
     return suite
 
 if __name__ == '__main__':
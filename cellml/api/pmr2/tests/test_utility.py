@@ -1,13 +1,28 @@
 import unittest
+import json
+import shutil
+import tempfile
+import time
+import zipfile
 from lxml import etree
 from cStringIO import StringIO
 from os.path import basename, dirname, join
 import urllib2
 from urlparse import urljoin
 
+from cellml.api.pmr2.cache import CodeCache
+from cellml.api.pmr2.cache import ModelCache
+from cellml.api.pmr2.deadline import Deadline
+from cellml.api.pmr2.instrument import PhaseStatistics
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import ResourceLimitExceededError
 from cellml.api.pmr2.interfaces import UnapprovedProtocolError
+from cellml.api.pmr2.resolver import LoadReport
 from cellml.api.pmr2.utility import CellMLAPIUtility
+from cellml.api.pmr2.utility import ValidityError
+from cellml.api.pmr2.urlopener import ArchiveURLOpener
 from cellml.api.pmr2.urlopener import DefaultURLOpener
+from cellml.api.pmr2.urlopener import LocalURLOpener
 
 
 base = dirname(__file__)
@@ -27,10 +42,49 @@ class StreamURLOpener(DefaultURLOpener):
             return True
         return DefaultURLOpener.validateProtocol(self, location)
 
-    def loadURL(self, location):
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
         if hasattr(location, 'read'):
             return location.read()
-        return DefaultURLOpener.loadURL(self, location)
+        return DefaultURLOpener.loadURL(self, location, headers, max_size,
+            timeout)
+
+
+class CountingURLOpener(StreamURLOpener):
+    """
+    Keep count of the locations loaded.
+    """
+
+    def __init__(self):
+        StreamURLOpener.__init__(self)
+        self.loaded = []
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        self.loaded.append(location)
+        return StreamURLOpener.loadURL(self, location, headers, max_size,
+            timeout)
+
+
+class SlowURLOpener(StreamURLOpener):
+    """
+    Delay the loading of the specified locations, honoring the timeout.
+    """
+
+    def __init__(self, slow, delay):
+        StreamURLOpener.__init__(self)
+        self.slow = slow
+        self.delay = delay
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        if location in self.slow:
+            if timeout is not None and timeout < self.delay:
+                time.sleep(timeout)
+                raise urllib2.URLError('timed out')
+            time.sleep(self.delay)
+        return StreamURLOpener.loadURL(self, location, headers, max_size,
+            timeout)
 
 
 class UtilityTestCase(unittest.TestCase):
@@ -39,14 +93,35 @@ class UtilityTestCase(unittest.TestCase):
         self.utility = CellMLAPIUtility()
         self.opener = StreamURLOpener()
         self.opener.approved_protocol.append('file')
+        self.tmpdir = None
 
     def tearDown(self):
-        pass
+        if self.tmpdir is not None:
+            shutil.rmtree(self.tmpdir)
 
     def assertComponentName(self, componentSet, name):
         comp = componentSet.getComponent(name)
         self.assertEqual(comp.name, name)
 
+    def copyModels(self):
+        """
+        Copy multiimport.xml and the documents it imports into a new
+        temporary directory, returning the URL of the copied model.
+        """
+
+        self.tmpdir = tempfile.mkdtemp()
+        shutil.copy(get_path('multiimport.xml')[7:], self.tmpdir)
+        shutil.copy(get_path('level2.xml')[7:], self.tmpdir)
+        shutil.copytree(get_path('subdir1')[7:], join(self.tmpdir, 'subdir1'))
+        return urljoin('file://', join(self.tmpdir, 'multiimport.xml'))
+
+    def replaceInCopy(self, name, old, new):
+        path = join(self.tmpdir, name)
+        with open(path) as fd:
+            source = fd.read()
+        with open(path, 'w') as fd:
+            fd.write(source.replace(old, new))
+
     def test_0000_basic(self):
         self.assert_(self.utility.cellml_bootstrap)
 
@@ -115,6 +190,296 @@ class UtilityTestCase(unittest.TestCase):
         self.assertComponentName(v1.modelComponents, 'level1_component')
         self.assertComponentName(v2.modelComponents, 'level2_component')
 
+    def test_0120_model_load_imported_workers(self):
+        model_path = get_path('subdir1', 'subdir2', 'toplevel.xml')
+        tl = self.utility.loadModel(model_path, self.opener, workers=4)
+        v1 = tl.imports.iterateImports().nextImport().importedModel
+        v2 = v1.imports.iterateImports().nextImport().importedModel
+        self.assertComponentName(tl.modelComponents, 'toplevel_component')
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+        self.assertComponentName(v2.modelComponents, 'level2_component')
+
+    def test_0121_model_load_multiple_import_workers(self):
+        model_path = get_path('multiimport.xml')
+        self.utility.load_workers = 2
+        tl = self.utility.loadModel(model_path, self.opener)
+        isi = tl.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        v2 = isi.nextImport().importedModel
+        # order of the imports is retained.
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+        self.assertComponentName(v2.modelComponents, 'level2_component')
+
+    def test_0130_model_load_diamond_fetch_once(self):
+        # level2.xml is imported by both multiimport.xml and level1.xml
+        opener = CountingURLOpener()
+        opener.approved_protocol.append('file')
+        model_path = get_path('multiimport.xml')
+        tl = self.utility.loadModel(model_path, opener)
+        self.assertEqual(len(opener.loaded), 3)
+        self.assertEqual(opener.loaded.count(get_path('level2.xml')), 1)
+
+        isi = tl.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        v2 = isi.nextImport().importedModel
+        v3 = v1.imports.iterateImports().nextImport().importedModel
+        self.assertComponentName(v2.modelComponents, 'level2_component')
+        self.assertComponentName(v3.modelComponents, 'level2_component')
+
+    def test_0131_model_load_cycle(self):
+        opener = CountingURLOpener()
+        opener.approved_protocol.append('file')
+        model_path = get_path('cycle_a.xml')
+        report = LoadReport()
+        tl = self.utility.loadModel(model_path, opener, report=report)
+        self.assertEqual(len(opener.loaded), 2)
+        self.assertEqual(report.skipped, [(model_path, 'import cycle')])
+        v1 = tl.imports.iterateImports().nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'b_component')
+        # the import back to the top level model is not instantiated.
+        v2 = v1.imports.iterateImports().nextImport()
+        self.assertFalse(v2.wasInstantiated)
+
+    def test_0140_model_cache(self):
+        model_path = self.copyModels()
+
+        self.utility.model_cache = ModelCache()
+        m1 = self.utility.loadModel(model_path, self.opener)
+        m2 = self.utility.loadModel(model_path, self.opener)
+        self.assertTrue(m1 is m2)
+
+        # a change in an imported document is detected.
+        with open(join(self.tmpdir, 'level2.xml'), 'a') as fd:
+            fd.write('\n')
+        m3 = self.utility.loadModel(model_path, self.opener)
+        self.assertFalse(m1 is m3)
+        self.assertEqual(self.utility.model_cache.stale, 1)
+
+        self.utility.invalidateModel(model_path, self.opener)
+        m4 = self.utility.loadModel(model_path, self.opener)
+        self.assertFalse(m3 is m4)
+
+    def test_0141_model_cache_incremental(self):
+        model_path = self.copyModels()
+        opener = CountingURLOpener()
+        opener.approved_protocol.append('file')
+
+        self.utility.model_cache = ModelCache(incremental=True)
+        m1 = self.utility.loadModel(model_path, opener)
+        self.replaceInCopy('level2.xml', 'level2_component', 'changed')
+        m2 = self.utility.loadModel(model_path, opener)
+        self.assertTrue(m1 is m2)
+        self.assertEqual(self.utility.model_cache.refreshed, 1)
+        isi = m2.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        v2 = isi.nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+        self.assertComponentName(v2.modelComponents, 'changed')
+        # level2.xml is also imported by level1.xml.
+        v3 = v1.imports.iterateImports().nextImport().importedModel
+        self.assertComponentName(v3.modelComponents, 'changed')
+
+    def test_0142_model_reload(self):
+        model_path = self.copyModels()
+        level1_path = urljoin('file://',
+            join(self.tmpdir, 'subdir1', 'level1.xml'))
+        opener = CountingURLOpener()
+        opener.approved_protocol.append('file')
+
+        model = self.utility.loadModel(model_path, opener)
+        self.assertEqual(len(opener.loaded), 3)
+        self.replaceInCopy(join('subdir1', 'level1.xml'), 'level1_component',
+            'changed')
+
+        reloaded = self.utility.reloadModel(model, model_path,
+            [level1_path], opener)
+        self.assertTrue(reloaded is model)
+        # only level1.xml and its import were fetched again.
+        self.assertEqual(len(opener.loaded), 5)
+        isi = model.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'changed')
+        v3 = v1.imports.iterateImports().nextImport().importedModel
+        self.assertComponentName(v3.modelComponents, 'level2_component')
+
+        # a change to the model itself loads it again.
+        reloaded = self.utility.reloadModel(model, model_path,
+            [model_path], opener)
+        self.assertFalse(reloaded is model)
+
+    def test_0150_model_load_async(self):
+        from cellml.api.pmr2.urlopener import AsyncURLOpener
+        opener = AsyncURLOpener(self.opener)
+        futures = [
+            self.utility.loadModelAsync(get_path('multiimport.xml'), opener),
+            self.utility.loadModelAsync(
+                get_path('subdir1', 'subdir2', 'toplevel.xml'), opener),
+            self.utility.loadModelAsync(get_path('broken_xml.cellml'),
+                opener),
+        ]
+        tl = futures[0].result()
+        isi = tl.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        v2 = isi.nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+        self.assertComponentName(v2.modelComponents, 'level2_component')
+        tl = futures[1].result()
+        self.assertComponentName(tl.modelComponents, 'toplevel_component')
+        self.assertRaises(ValueError, futures[2].result)
+
+    def test_0151_model_load_async_unapproved(self):
+        future = self.utility.loadModelAsync(get_path('multiimport.xml'))
+        self.assertRaises(UnapprovedProtocolError, future.result)
+
+    def test_0152_model_load_async_closed(self):
+        from cellml.api.pmr2 import utility
+        from cellml.api.pmr2.urlopener import AsyncURLOpener
+        closed = []
+
+        class ClosingResolver(utility.ImportResolver):
+            def close(self):
+                closed.append(self)
+                utility.ImportResolver.close(self)
+
+        opener = AsyncURLOpener(self.opener)
+        original = utility.ImportResolver
+        utility.ImportResolver = ClosingResolver
+        try:
+            futures = [
+                self.utility.loadModelAsync(get_path('multiimport.xml'),
+                    opener),
+                self.utility.loadModelAsync(get_path('broken_xml.cellml'),
+                    opener),
+            ]
+            futures[0].result()
+            self.assertRaises(ValueError, futures[1].result)
+        finally:
+            utility.ImportResolver = original
+        # nothing is fetched anymore once the loads are done.
+        self.assertEqual(len(closed), 2)
+        self.assertTrue(closed[0].closed and closed[1].closed)
+
+    def test_0160_model_load_instrumented(self):
+        stats = PhaseStatistics()
+        stats.subscribe()
+        try:
+            model = self.utility.loadModel(get_path('multiimport.xml'),
+                self.opener)
+            self.utility.validateModel(model)
+            self.utility.extractMaths(model)
+        finally:
+            stats.unsubscribe()
+        result = stats.snapshot()
+        # the root model and the two imports.
+        self.assertEqual(result['fetch']['count'], 3)
+        self.assertEqual(result['decode']['count'], 3)
+        self.assertEqual(result['parse']['count'], 1)
+        self.assertEqual(result['instantiate']['count'], 2)
+        self.assertEqual(result['load']['count'], 1)
+        self.assertEqual(result['validate']['count'], 1)
+        self.assertEqual(result['maths']['count'], 1)
+
+    def test_0170_model_load_limits(self):
+        model_path = get_path('subdir1', 'subdir2', 'toplevel.xml')
+        self.utility.max_import_depth = 2
+        self.utility.max_imports = 2
+        self.assert_(self.utility.loadModel(model_path, self.opener))
+
+        self.utility.max_import_depth = 1
+        self.assertRaises(ResourceLimitExceededError,
+            self.utility.loadModel, model_path, self.opener)
+
+        self.utility.max_import_depth = None
+        self.utility.max_imports = 1
+        self.assertRaises(ResourceLimitExceededError,
+            self.utility.loadModel, model_path, self.opener)
+
+    def test_0171_model_load_size_limits(self):
+        model_path = get_path('multiimport.xml')
+        self.utility.max_document_size = 10
+        self.assertRaises(ResourceLimitExceededError,
+            self.utility.loadModel, model_path, self.opener)
+
+        self.utility.max_document_size = None
+        self.utility.max_total_size = 100000
+        self.assert_(self.utility.loadModel(model_path, self.opener))
+        self.utility.max_total_size = 800
+        self.assertRaises(ResourceLimitExceededError,
+            self.utility.loadModel, model_path, self.opener)
+
+    def test_0180_model_load_local(self):
+        opener = LocalURLOpener(join(base, input_p))
+        model = self.utility.loadModel(opener.url('multiimport.xml'),
+            opener)
+        isi = model.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+
+    def test_0181_model_load_archive(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = join(tmpdir, 'models.zip')
+            archive = zipfile.ZipFile(path, 'w')
+            for name in ('multiimport.xml', 'level2.xml',
+                    'subdir1/level1.xml'):
+                archive.write(join(base, input_p, name), name)
+            archive.close()
+            opener = ArchiveURLOpener(path)
+            model = self.utility.loadModel(opener.url('multiimport.xml'),
+                opener)
+            opener.close()
+        finally:
+            shutil.rmtree(tmpdir)
+        isi = model.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        v2 = isi.nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+        self.assertComponentName(v2.modelComponents, 'level2_component')
+
+    def test_0190_model_load_report(self):
+        source = (
+            '<model xmlns="http://www.cellml.org/cellml/1.1#" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink" name="report">'
+            '<import xlink:href="missing.xml"/>'
+            '<import xlink:href="level2.xml"/>'
+            '<import xlink:href="http://example.com/unapproved.xml"/>'
+            '</model>'
+        )
+        self.opener.approved_protocol.remove('http')
+        report = LoadReport()
+        model = self.utility.loadModelFromText(source, get_path('report.xml'),
+            self.opener, report=report)
+        self.assertEqual([url for url, reason in report.skipped],
+            [get_path('missing.xml'), 'http://example.com/unapproved.xml'])
+        isi = model.imports.iterateImports()
+        self.assertFalse(isi.nextImport().wasInstantiated)
+        self.assertTrue(isi.nextImport().wasInstantiated)
+
+    def test_0191_model_load_deadline(self):
+        opener = SlowURLOpener([get_path('level2.xml')], 1)
+        opener.approved_protocol.append('file')
+        report = LoadReport()
+        try:
+            self.utility.loadModel(get_path('multiimport.xml'), opener,
+                report=report, deadline=0.2)
+        except DeadlineExceededError, e:
+            model = e.partial
+        else:
+            self.fail('DeadlineExceededError not raised')
+        self.assertEqual(report.skipped,
+            [(get_path('level2.xml'), 'deadline exceeded')])
+        isi = model.imports.iterateImports()
+        self.assertTrue(isi.nextImport().wasInstantiated)
+        self.assertFalse(isi.nextImport().wasInstantiated)
+
+        # the load is completed within a larger deadline.
+        opener.delay = 0.1
+        model = self.utility.loadModel(get_path('multiimport.xml'), opener,
+            deadline=Deadline(5))
+        isi = model.imports.iterateImports()
+        isi.nextImport()
+        self.assertTrue(isi.nextImport().wasInstantiated)
+
     def test_0200_model_load_broken(self):
         model_path = get_path('broken_xml.cellml')
         self.assertRaises(ValueError,
@@ -130,8 +495,8 @@ class UtilityTestCase(unittest.TestCase):
     def test_0301_ascii(self):
         model_path = get_path('unicode_invalid.cellml')
         model = self.utility.loadModel(model_path, self.opener)
-        # still loads because lxml will fail and then fallback to latin1
-        # which covers the entire range of bytes.
+        # still loads because decoding as utf-8 will fail and then
+        # fallback to latin1 which covers the entire range of bytes.
         self.assertEqual(model.cmetaId, 'unicode_invalid')
 
     def test_1000_extractMaths(self):
@@ -162,6 +527,124 @@ class UtilityTestCase(unittest.TestCase):
         self.assertTrue('-84.624'
                         in code['Python'])
 
+    def test_2001_celeds_lazy(self):
+        self.assertEqual(self.utility.availableCeledsExporter(),
+            ['C', 'C_IDA', 'F77', 'MATLAB', 'Python'])
+        # nothing instantiated until requested.
+        self.assertEqual(self.utility.celeds_exporter, {})
+        exporter = self.utility.getCeledsExporter('Python')
+        self.assertEqual(self.utility.celeds_exporter.keys(), ['Python'])
+        self.assertTrue(self.utility.getCeledsExporter('Python') is exporter)
+        self.assertRaises(KeyError, self.utility.getCeledsExporter, 'Nope')
+
+    def test_2002_celeds_register(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copy(join(dirname(base), 'resource', 'celeds', 'C.xml'),
+                join(tmpdir, 'Custom.xml'))
+            self.utility.registerCeledsDefinitions(tmpdir)
+            self.assertTrue('Custom' in
+                self.utility.availableCeledsExporter())
+            model_path = get_path('beeler_reuter_1977.cellml')
+            model = self.utility.loadModel(model_path, self.opener)
+            code = self.utility.exportCeleds(model)
+            self.assertEqual(code['Custom'], code['C'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_2010_exportCeleds_language(self):
+        model_path = get_path('beeler_reuter_1977.cellml')
+        model = self.utility.loadModel(model_path, self.opener)
+        code = self.utility.exportCeleds(model, ['Python', 'C'])
+        self.assertEqual(sorted(code.keys()), ['C', 'Python'])
+
+    def test_2011_exportCeleds_processes(self):
+        model_path = get_path('beeler_reuter_1977.cellml')
+        model = self.utility.loadModel(model_path, self.opener)
+        serial = self.utility.exportCeleds(model, ['Python', 'C', 'F77'])
+        parallel = self.utility.exportCeleds(model, ['Python', 'C', 'F77'],
+            processes=3)
+        self.assertEqual(serial, parallel)
+
+    def test_2012_iterExportCeleds(self):
+        model_path = get_path('beeler_reuter_1977.cellml')
+        model = self.utility.loadModel(model_path, self.opener)
+        results = list(self.utility.iterExportCeleds(model, processes=2))
+        self.assertEqual(sorted(k for k, v in results),
+            self.utility.availableCeledsExporter())
+
+    def test_2014_exportCeleds_deadline(self):
+        model_path = get_path('beeler_reuter_1977.cellml')
+        model = self.utility.loadModel(model_path, self.opener)
+        for processes in (1, 2):
+            try:
+                self.utility.exportCeleds(model, processes=processes,
+                    deadline=0)
+            except DeadlineExceededError, e:
+                self.assertEqual(e.partial, {})
+            else:
+                self.fail('DeadlineExceededError not raised')
+        code = self.utility.exportCeleds(model, ['Python'], deadline=60)
+        self.assertEqual(code.keys(), ['Python'])
+
+    def test_2013_exportCeleds_code_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            model_path = get_path('beeler_reuter_1977.cellml')
+            model = self.utility.loadModel(model_path, self.opener)
+            self.utility.code_cache = CodeCache(tmpdir)
+            code1 = self.utility.exportCeleds(model, ['Python', 'C'])
+            self.assertEqual(self.utility.code_cache.misses, 2)
+
+            # even a different instance of the same model is a hit.
+            model = self.utility.loadModel(model_path, self.opener)
+            code2 = self.utility.exportCeleds(model, ['Python', 'C'])
+            self.assertEqual(self.utility.code_cache.hits, 2)
+            self.assertEqual(code1, code2)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_2020_model_tree(self):
+        model_path = get_path('multiimport.xml')
+        model = self.utility.loadModel(model_path, self.opener)
+        tree = self.utility.dumpModelTree(model)
+        self.assertEqual([path for path, source in tree],
+            [(), (0,), (1,), (0, 0)])
+        tl = self.utility.loadModelTree(tree)
+        isi = tl.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        v2 = isi.nextImport().importedModel
+        v3 = v1.imports.iterateImports().nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+        self.assertComponentName(v2.modelComponents, 'level2_component')
+        self.assertComponentName(v3.modelComponents, 'level2_component')
+
+    def test_2021_model_snapshot(self):
+        model_path = get_path('multiimport.xml')
+        model = self.utility.loadModel(model_path, self.opener)
+        snapshot = self.utility.snapshotModel(model, model_path, self.opener)
+        documents = json.loads(snapshot)['documents']
+        self.assertEqual([d['base'] for d in documents],
+            [model_path, get_path('subdir1', 'level1.xml'),
+                get_path('level2.xml'), get_path('level2.xml')])
+
+        sl = self.utility.loadSnapshot(snapshot)
+        isi = sl.imports.iterateImports()
+        v1 = isi.nextImport().importedModel
+        v2 = isi.nextImport().importedModel
+        v3 = v1.imports.iterateImports().nextImport().importedModel
+        self.assertComponentName(v1.modelComponents, 'level1_component')
+        self.assertComponentName(v2.modelComponents, 'level2_component')
+        self.assertComponentName(v3.modelComponents, 'level2_component')
+
+    def test_2022_model_snapshot_invalid(self):
+        model = self.utility.loadModel(get_path('level2.xml'), self.opener)
+        snapshot = json.loads(self.utility.snapshotModel(model))
+        snapshot['documents'][0]['source'] += ' '
+        self.assertRaises(ValueError, self.utility.loadSnapshot,
+            json.dumps(snapshot))
+        self.assertRaises(ValueError, self.utility.loadSnapshot, '{}')
+
     def test_3000_validateModel_clean(self):
         model_path = get_path('beeler_reuter_1977.cellml')
         model = self.utility.loadModel(model_path, self.opener)
@@ -178,6 +661,106 @@ class UtilityTestCase(unittest.TestCase):
         # such may change, so test just the first bits of our wording.
         self.assertEqual(results[0][:5], 'Line ')
 
+    def test_3010_iterValidateModel(self):
+        model_path = get_path('beeler_reuter_1977-api-test.cellml')
+        model = self.utility.loadModel(model_path, self.opener)
+        results = self.utility.validateModel(model)
+        errors = list(self.utility.iterValidateModel(model))
+        self.assertEqual(len(errors), len(results))
+        # position only computed when needed.
+        self.assertFalse(hasattr(errors[0], '_position'))
+        self.assertEqual(unicode(errors[0]), results[0])
+        self.assertEqual(errors[0].position, (errors[0].row, errors[0].col))
+        self.assertTrue(errors[0].severity in ('Error', 'Warning'))
+
+    def test_3011_validateModel_capped(self):
+        model_path = get_path('beeler_reuter_1977-api-test.cellml')
+        model = self.utility.loadModel(model_path, self.opener)
+        results = self.utility.validateModel(model)
+        self.assertEqual(self.utility.validateModel(model, max_errors=1),
+            results[:1])
+        errors = self.utility.validateModel(model, errors_only=True)
+        self.assertEqual(errors,
+            [r for r in results if ': Warning: ' not in r])
+
+    def test_3012_validateModel_deadline(self):
+        model_path = get_path('beeler_reuter_1977-api-test.cellml')
+        model = self.utility.loadModel(model_path, self.opener)
+        try:
+            self.utility.validateModel(model, deadline=0)
+        except DeadlineExceededError, e:
+            self.assertEqual(e.partial, [])
+        else:
+            self.fail('DeadlineExceededError not raised')
+        self.assertEqual(self.utility.validateModel(model, deadline=60),
+            self.utility.validateModel(model))
+        self.assertRaises(DeadlineExceededError, self.utility.extractMaths,
+            model, deadline=0)
+
+    def test_3013_validityError_unicode(self):
+        class VACSService(object):
+            def getPositionInXML(self, node, offset):
+                return 2, 4
+
+        class Error(object):
+            description = u'unit \xb5m not defined'
+            isWarningOnly = False
+            errorNode = None
+
+        error = ValidityError(VACSService(), Error())
+        self.assertEqual(unicode(error),
+            u'Line 2, Col 4: Error: unit \xb5m not defined')
+        self.assertEqual(str(error),
+            'Line 2, Col 4: Error: unit \xc2\xb5m not defined')
+
+    def test_3100_validateModels(self):
+        with open(get_path('beeler_reuter_1977.cellml')[7:]) as fd:
+            source = fd.read()
+        items = [
+            get_path('beeler_reuter_1977.cellml'),
+            get_path('beeler_reuter_1977-api-test.cellml'),
+            get_path('broken_xml.cellml'),
+            source,
+        ]
+        results = sorted(self.utility.validateModels(items, self.opener,
+            processes=2))
+        self.assertEqual([r[0] for r in results], [0, 1, 2, 3])
+        self.assertEqual(results[0][1], items[0])
+        self.assertEqual(results[0][2], [])
+        self.assertNotEqual(results[1][2], [])
+        self.assertTrue(results[2][2][0].startswith('Error: '))
+        self.assertEqual(results[3][1], None)
+        self.assertEqual(results[3][2], [])
+        self.assertTrue('validate' in results[0][3])
+        self.assertTrue('load' in results[0][3])
+
+    def test_3101_validateModels_serial(self):
+        items = [get_path('beeler_reuter_1977.cellml')]
+        results = list(self.utility.validateModels(items, self.opener,
+            processes=1))
+        self.assertEqual(results[0][:3], (0, items[0], []))
+
+    def test_4000_worker_pool(self):
+        from cellml.api.pmr2.service import WorkerPool
+        pool = WorkerPool(size=2, max_jobs=2)
+        try:
+            model_path = get_path('beeler_reuter_1977-api-test.cellml')
+            model = self.utility.loadModel(model_path, self.opener)
+            messages = pool.submit('validateModel', model_path, self.opener)
+            maths = pool.submit('extractMaths', model_path, self.opener)
+            code = pool.submit('exportCeleds', model_path, self.opener,
+                language=['Python'])
+            tree = pool.submit('loadModel', model_path, self.opener)
+            self.assertEqual(messages.result(),
+                self.utility.validateModel(model))
+            self.assertEqual(maths.result(),
+                self.utility.extractMaths(model))
+            self.assertEqual(code.result().keys(), ['Python'])
+            self.assertEqual(tree.result(),
+                self.utility.dumpModelTree(model))
+        finally:
+            pool.close()
+
 
 class LiveUtilityTestCase(unittest.TestCase):
     level = 9
@@ -0,0 +1,73 @@
+import unittest
+import codecs
+
+from cellml.api.pmr2.deadline import Deadline
+from cellml.api.pmr2.interfaces import UnapprovedProtocolError
+from cellml.api.pmr2.worker import isSource
+from cellml.api.pmr2.worker import validateModel
+
+
+class FailingUtility(object):
+    """
+    Fails to load or to validate the models in the ways specified.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+
+    def loadModel(self, url, loader=None, deadline=None):
+        error = self.errors.get(url)
+        if error is not None:
+            raise error
+        return url
+
+    def validateModel(self, model, deadline=None):
+        raise RuntimeError('validation of `%s` failed' % model)
+
+
+class WorkerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_0000_isSource(self):
+        self.assertTrue(isSource('<?xml version="1.0"?><model/>'))
+        self.assertTrue(isSource('\n  <model/>'))
+        self.assertTrue(isSource(codecs.BOM_UTF8 + '<model/>'))
+        self.assertTrue(isSource(u'<model/>'.encode('utf-16')))
+        self.assertFalse(isSource('http://example.com/model.cellml'))
+        self.assertFalse(isSource('file:///tmp/model.cellml'))
+
+    def test_0001_isSource_unicode(self):
+        self.assertTrue(isSource(u'<?xml version="1.0"?><model/>'))
+        self.assertTrue(isSource(u'\ufeff<model name="\xe9"/>'))
+        self.assertFalse(isSource(u'http://example.com/a.cellml'))
+        self.assertFalse(isSource(u'http://example.com/\xe9.cellml'))
+
+    def test_0100_validateModel_errors(self):
+        utility = FailingUtility({
+            'http://example.com/a': KeyError('a'),
+            'ftp://example.com/b': UnapprovedProtocolError('ftp'),
+        })
+        results = [validateModel((index, url, None, Deadline(60)), utility)
+            for index, url in enumerate(['http://example.com/a',
+                'ftp://example.com/b', 'http://example.com/c'])]
+        self.assertEqual([r[2] for r in results], [
+            ["Error: 'a'"],
+            ['Error: ftp'],
+            ['Error: validation of `http://example.com/c` failed'],
+        ])
+        self.assertEqual(sorted(results[2][3]), ['load', 'validate'])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(WorkerTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
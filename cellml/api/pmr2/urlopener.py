@@ -1,11 +1,182 @@
+import httplib
+import mmap
+import os
+import posixpath
+import socket
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import urllib
 import urllib2
 import urlparse
+import zipfile
+import zlib
+from collections import deque
 
 import zope.interface
 from zope.schema.fieldproperty import FieldProperty
 
+from cellml.api.pmr2 import instrument
+from cellml.api.pmr2.interfaces import CircuitOpenError
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import IAsyncURLOpener
 from cellml.api.pmr2.interfaces import IURLOpener
+from cellml.api.pmr2.interfaces import ResourceLimitExceededError
 from cellml.api.pmr2.interfaces import UnapprovedProtocolError
+from cellml.api.pmr2.cache import DiskStore
+from cellml.api.pmr2.cache import LRUCache
+from cellml.api.pmr2.cache import LockedState
+from cellml.api.pmr2.pool import Future
+from cellml.api.pmr2.pool import ThreadPool
+
+# XXX temporary user agent header
+USER_AGENT = 'cellml.api.pmr2/0.0 (http://models.cellml.org/;)'
+
+default_ports = set([
+    ('http', '80'),
+    ('https', '443'),
+])
+
+read_chunk_size = 65536
+
+# the content codings that can be decoded by readResponse.
+accepted_encodings = ('gzip', 'x-gzip', 'deflate')
+
+
+def checkSize(size, location, max_size):
+    """\
+    Raise ResourceLimitExceededError if the size of the document at the
+    location is larger than the max_size, if specified.
+    """
+
+    if max_size is not None and size > max_size:
+        raise ResourceLimitExceededError(
+            'document at `%s` exceeds the limit of %d bytes' % (
+                location, max_size))
+
+
+class Decompressor(object):
+    """\
+    Incremental decoder of a gzip or deflate content coding.
+
+    Deflate is meant to be zlib wrapped, but as some servers send the
+    raw stream instead, that is accepted also.
+    """
+
+    def __init__(self, encoding):
+        if encoding not in accepted_encodings:
+            raise urllib2.URLError(
+                'unsupported content encoding `%s`' % encoding)
+        self.raw = encoding == 'deflate'
+        if self.raw:
+            self._obj = zlib.decompressobj()
+        else:
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._started = False
+
+    def decompress(self, data, max_length=0):
+        """\
+        Return the decoded data, up to max_length bytes if specified.
+        """
+
+        try:
+            result = self._obj.decompress(data, max_length)
+        except zlib.error, e:
+            if not self.raw or self._started:
+                raise urllib2.URLError(e)
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            result = self._obj.decompress(data, max_length)
+        self._started = True
+        return result
+
+    def flush(self):
+        try:
+            return self._obj.flush()
+        except zlib.error, e:
+            raise urllib2.URLError(e)
+
+
+def readResponse(response, location, max_size=None, encoding=None,
+        length=None, counter=None):
+    """\
+    Read the body of the response, stopping as soon as more than
+    max_size bytes are read.
+
+    encoding - the content coding of the body, which is decoded while
+               it is read; max_size then applies to the decoded size.
+    length - the length of the body as sent, if known, for the buffer
+             to be allocated once.
+    counter - called with the number of bytes received and the number
+              of bytes decoded once the body is read.
+    """
+
+    if encoding in ('', 'identity'):
+        encoding = None
+
+    if encoding is None and max_size is None:
+        result = response.read()
+        if counter is not None:
+            counter(len(result), len(result))
+        return result
+
+    decoder = None
+    if encoding is None:
+        if length is not None:
+            # fail early rather than after reading everything.
+            checkSize(length, location, max_size)
+        buf = bytearray(length or 0)
+    else:
+        decoder = Decompressor(encoding)
+        buf = bytearray()
+
+    received = 0
+    size = 0
+    while True:
+        want = read_chunk_size
+        if decoder is None and max_size is not None:
+            # one byte past the limit is enough to know it is exceeded.
+            want = min(want, max_size + 1 - size)
+        chunk = response.read(want)
+        if not chunk:
+            break
+        received += len(chunk)
+        if decoder is not None:
+            # bound the output of a single chunk, as a small chunk may
+            # decode to a vast amount of data.
+            limit = max_size is not None and max_size + 1 - size or 0
+            chunk = decoder.decompress(chunk, limit)
+        buf[size:size + len(chunk)] = chunk
+        size += len(chunk)
+        checkSize(size, location, max_size)
+
+    if decoder is not None:
+        chunk = decoder.flush()
+        buf[size:size + len(chunk)] = chunk
+        size += len(chunk)
+        checkSize(size, location, max_size)
+
+    # the body may be shorter than its declared length.
+    del buf[size:]
+    if counter is not None:
+        counter(received, size)
+    return str(buf)
+
+
+def loadOptions(max_size=None, timeout=None):
+    """\
+    Return the keyword arguments of loadURL for the limits specified,
+    as they are only passed to the openers that may not accept them
+    when they are specified.
+    """
+
+    kw = {}
+    if max_size is not None:
+        kw['max_size'] = max_size
+    if timeout is not None:
+        kw['timeout'] = timeout
+    return kw
 
 
 class BaseURLOpener(object):
@@ -26,35 +197,1214 @@ class BaseURLOpener(object):
     def urljoin(self, *a, **kw):
         return urlparse.urljoin(*a, **kw)
 
-    def __call__(self, location):
+    def canonicalURL(self, location):
+        if not isinstance(location, basestring):
+            return location
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(location)
+        scheme = scheme.lower()
+        netloc = netloc.lower()
+        if (scheme, netloc.rpartition(':')[2]) in default_ports:
+            netloc = netloc.rpartition(':')[0]
+        if path:
+            trailing = path.endswith('/')
+            path = posixpath.normpath(path)
+            if trailing and not path.endswith('/'):
+                path += '/'
+        return urlparse.urlunsplit((scheme, netloc, path, query, ''))
+
+    def __call__(self, location, max_size=None, timeout=None):
         if not self.validateProtocol(location):
             raise UnapprovedProtocolError(
                 'protocol for the location is not approved')
-        return self.loadURL(location)
+        started = instrument.start()
+        result = self.loadURL(location, **loadOptions(max_size, timeout))
+        instrument.record('fetch', started, location, len(result))
+        return result
 
 
-class DefaultURLOpener(BaseURLOpener):
+class WrappingURLOpener(BaseURLOpener):
+    """\
+    The base of the URL openers that load the locations through another
+    opener, whose approved protocols, protocol validation and handling
+    of the URLs are used as they are.
+
+    opener - the opener to wrap.
+    """
+
+    def __init__(self, opener):
+        self.opener = opener
+
+    @property
+    def approved_protocol(self):
+        return self.opener.approved_protocol
+
+    def validateProtocol(self, location):
+        return self.opener.validateProtocol(location)
+
+    def urljoin(self, *a, **kw):
+        return self.opener.urljoin(*a, **kw)
+
+    def canonicalURL(self, location):
+        return self.opener.canonicalURL(location)
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        kw = loadOptions(max_size, timeout)
+        if headers:
+            return self.opener.loadURL(location, headers, **kw)
+        return self.opener.loadURL(location, **kw)
+
+
+class DefaultURLOpener(BaseURLOpener, LockedState):
     """\
     Default implementation of the URL opener.
+
+    Compressed transfer of the documents is requested through the
+    Accept-Encoding header, unless accept_encoding is set to None, and
+    the bodies are decoded while they are read.  The number of bytes
+    received and the number of bytes they decoded to are counted.
     """
 
+    accept_encoding = 'gzip, deflate'
+
     def __init__(self):
         self.approved_protocol = ['http', 'https',]
+        self.received_bytes = 0
+        self.decoded_bytes = 0
+        self._lock = threading.Lock()
 
     def validateProtocol(self, location):
         return urlparse.urlparse(location).scheme in self.approved_protocol
 
-    def loadURL(self, location, headers=None):
+    def _countTransfer(self, received, decoded):
+        self._lock.acquire()
+        try:
+            self.received_bytes += received
+            self.decoded_bytes += decoded
+        finally:
+            self._lock.release()
+
+    def _readResponse(self, response, info, location, max_size):
+        length = info.get('content-length')
+        try:
+            length = length and int(length) or None
+        except ValueError:
+            length = None
+        encoding = info.get('content-encoding', '').strip().lower()
+        return readResponse(response, location, max_size, encoding, length,
+            self._countTransfer)
+
+    def stats(self):
+        """\
+        Return a dictionary of the transfer counters of this opener.
+        """
+
+        return {
+            'received_bytes': self.received_bytes,
+            'decoded_bytes': self.decoded_bytes,
+        }
+
+    def openURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        """\
+        Open the location and return a tuple of its decoded contents
+        and a dictionary of the response headers, with lower case keys.
+
+        The contents are read in chunks so that reading stops once
+        max_size is exceeded, if specified.  The timeout is in seconds,
+        and applies to the connection and every read of the response;
+        should it expire, URLError is raised.
+        """
+
         request = urllib2.Request(location)
-        request.add_header('User-agent', 
-            # XXX temporary user agent header
-            'cellml.api.pmr2/0.0 (http://models.cellml.org/;)')
+        request.add_header('User-agent', USER_AGENT)
+        if self.accept_encoding:
+            request.add_header('Accept-encoding', self.accept_encoding)
 
         if headers:
             for k, v in headers:
                 request.add_header(k, v)
 
-        response = urllib2.urlopen(request)
-        result = response.read()
-        response.close()
+        try:
+            if timeout is None:
+                response = urllib2.urlopen(request)
+            else:
+                response = urllib2.urlopen(request, timeout=timeout)
+            try:
+                info = dict((k.lower(), v)
+                    for k, v in response.info().items())
+                result = self._readResponse(response, info, location,
+                    max_size)
+            finally:
+                response.close()
+        except (httplib.HTTPException, socket.error), e:
+            # such as a timeout while reading the response.
+            raise urllib2.URLError(e)
+        return result, info
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        return self.openURL(location, headers, max_size, timeout)[0]
+
+
+class CachedDocument(object):
+    """\
+    A document held by the CachingURLOpener.
+    """
+
+    def __init__(self, data, etag=None, last_modified=None, validated=None):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.validated = validated
+
+    def meta(self):
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'validated': self.validated,
+        }
+
+
+def documentSize(doc):
+    return len(doc.data)
+
+
+class CachingURLOpener(WrappingURLOpener, LockedState):
+    """\
+    URL opener that caches the documents loaded by another opener.
+
+    Documents are kept in a size-bounded in-memory LRU cache, and also
+    in an on-disk store if a store_path is provided.  A cached document
+    is returned directly if it was validated within the last max_age
+    seconds (None means cached documents never expire); otherwise it is
+    revalidated through a conditional request using its ETag and/or
+    Last-Modified values if the wrapped opener provides openURL, and
+    fetched again if the server does not respond with 304.
+
+    The approved protocols and the protocol validation are those of the
+    wrapped opener, and the validation is done before the cache is ever
+    consulted.  Locations that are not strings and requests with custom
+    headers are passed through without caching.
+
+    opener - the opener to wrap.
+    max_size - maximum number of bytes held in memory.
+    store_path - directory for the on-disk store.
+    max_age - seconds a cached document is used without revalidation.
+    """
+
+    def __init__(self, opener, max_size=16777216, store_path=None,
+            max_age=0):
+        WrappingURLOpener.__init__(self, opener)
+        self.max_age = max_age
+        self.memory = LRUCache(max_size, sizeof=documentSize)
+        self.store = store_path and DiskStore(store_path) or None
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """\
+        Return a dictionary of the counters of this cache.
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+            'memory_size': self.memory.size,
+            'memory_entries': len(self.memory),
+        }
+
+    def _lookup(self, location):
+        doc = self.memory.get(location)
+        if doc is None and self.store is not None:
+            stored = self.store.get(location)
+            if stored is not None:
+                data, meta = stored
+                doc = CachedDocument(data, **dict(
+                    (str(k), v) for k, v in meta.iteritems()))
+                self.memory.set(location, doc)
+        return doc
+
+    def _save(self, location, doc):
+        self.memory.set(location, doc)
+        if self.store is not None:
+            self.store.set(location, doc.data, doc.meta())
+
+    def _open(self, location, headers=None, max_size=None, timeout=None):
+        kw = loadOptions(max_size, timeout)
+        if hasattr(self.opener, 'openURL'):
+            return self.opener.openURL(location, headers, **kw)
+        if headers:
+            return self.opener.loadURL(location, headers, **kw), {}
+        return self.opener.loadURL(location, **kw), {}
+
+    def invalidate(self, location):
+        self.memory.invalidate(location)
+        if self.store is not None:
+            self.store.invalidate(location)
+
+    def openURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        if headers or not isinstance(location, basestring):
+            return self._open(location, headers, max_size, timeout)
+
+        now = time.time()
+        conditional = None
+        doc = self._lookup(location)
+        if doc is not None:
+            checkSize(len(doc.data), location, max_size)
+            if self.max_age is None or now - doc.validated < self.max_age:
+                self._count('hits')
+                return doc.data, {}
+            if (doc.etag or doc.last_modified) and hasattr(
+                    self.opener, 'openURL'):
+                conditional = []
+                if doc.etag:
+                    conditional.append(('If-None-Match', doc.etag))
+                if doc.last_modified:
+                    conditional.append(
+                        ('If-Modified-Since', doc.last_modified))
+
+        try:
+            data, info = self._open(location, conditional, max_size,
+                timeout)
+        except urllib2.HTTPError, e:
+            if conditional is None or e.code != 304:
+                raise
+            doc.validated = now
+            self._save(location, doc)
+            self._count('revalidated')
+            return doc.data, {}
+
+        self._count('misses')
+        self._save(location, CachedDocument(data,
+            info.get('etag'), info.get('last-modified'), now))
+        return data, info
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        return self.openURL(location, headers, max_size, timeout)[0]
+
+
+class CircuitBreaker(object):
+    """\
+    The state of the requests to a single host.
+
+    The circuit is opened once threshold consecutive requests have
+    failed, and no requests are allowed until reset_timeout seconds have
+    passed.  A single probe request is then allowed through, which
+    closes the circuit if it succeeds or opens it again if it fails.
+
+    Instances are not thread-safe on their own.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+    @property
+    def closed(self):
+        return self.opened is None
+
+    def allow(self, now):
+        """\
+        Return whether a request may be made.
+        """
+
+        if self.opened is None:
+            return True
+        if self.probing or now - self.opened < self.reset_timeout:
+            return False
+        self.probing = True
+        return True
+
+    def succeeded(self):
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+    def failed(self, now):
+        self.failures += 1
+        self.probing = False
+        if self.opened is not None or self.failures >= self.threshold:
+            self.opened = now
+
+    def release(self):
+        """\
+        Allow another probe without counting the request either way.
+        """
+
+        self.probing = False
+
+
+def isHostFailure(e):
+    """\
+    Return whether the error is a failure of the host rather than of
+    the document, such as a refused connection or a server error.
+    """
+
+    if isinstance(e, urllib2.HTTPError):
+        return e.code >= 500
+    return isinstance(e, urllib2.URLError)
+
+
+def isTimeout(e):
+    """\
+    Return whether the error is a timeout of the request.
+    """
+
+    reason = getattr(e, 'reason', e)
+    return (isinstance(reason, socket.timeout) or
+        'timed out' in str(reason))
+
+
+class GuardedURLOpener(WrappingURLOpener, LockedState):
+    """\
+    URL opener that stops requesting the locations and hosts that are
+    failing through another opener.
+
+    Every location that failed to be loaded is kept in a negative cache
+    for ttl seconds, during which its error is raised again without any
+    request.  Every host has a CircuitBreaker, such that once threshold
+    consecutive requests to a host have failed, requests to it fail
+    with CircuitOpenError right away until the host is probed again
+    after reset_timeout seconds.  Only errors of the host itself, and
+    not of the documents (such as 404), count towards the threshold.
+    Timeouts of requests made with a timeout of the caller are not
+    recorded at all, as that timeout may be too short for the host.
+
+    As the conditional requests of CachingURLOpener are not passed
+    through this opener, it should wrap the CachingURLOpener rather
+    than the other way around.  Instances are safe to be shared between
+    threads and loads.
+
+    opener - the opener to wrap.
+    ttl - seconds a failed location is not requested again.
+    threshold - the consecutive failures of a host to open its circuit.
+    reset_timeout - seconds until a host with an open circuit is probed.
+    max_entries - maximum number of locations in the negative cache.
+    """
+
+    def __init__(self, opener, ttl=60, threshold=5, reset_timeout=30,
+            max_entries=1024):
+        WrappingURLOpener.__init__(self, opener)
+        self.ttl = ttl
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failed = LRUCache(max_entries)
+        self.hosts = {}
+        self.failed_fast = 0
+        self._lock = threading.Lock()
+
+    def localState(self):
+        # the failures of other processes start afresh.
+        return {
+            'failed': LRUCache(self.failed.max_size),
+            'hosts': {},
+            'failed_fast': 0,
+        }
+
+    def stats(self):
+        """\
+        Return a dictionary of the counters of this opener.
+        """
+
+        self._lock.acquire()
+        try:
+            return {
+                'failed_fast': self.failed_fast,
+                'failed_entries': len(self.failed),
+                'open_hosts': sorted(host for host, breaker in
+                    self.hosts.iteritems() if not breaker.closed),
+            }
+        finally:
+            self._lock.release()
+
+    def _host(self, location):
+        parts = urlparse.urlsplit(location)
+        return '%s://%s' % (parts.scheme.lower(), parts.netloc.lower())
+
+    def _breaker(self, host):
+        breaker = self.hosts.get(host)
+        if breaker is None:
+            breaker = self.hosts[host] = CircuitBreaker(self.threshold,
+                self.reset_timeout)
+        return breaker
+
+    def _check(self, location, host, now):
+        # returns whether the request is the probe of an open circuit.
+        self._lock.acquire()
+        try:
+            failure = self.failed.get(location)
+            if failure is not None:
+                expires, error = failure
+                if now < expires:
+                    self.failed_fast += 1
+                    raise error
+                self.failed.invalidate(location)
+            breaker = self._breaker(host)
+            if not breaker.allow(now):
+                self.failed_fast += 1
+                raise CircuitOpenError(
+                    'host `%s` is failing, not requesting `%s`' % (
+                        host, location))
+            return not breaker.closed
+        finally:
+            self._lock.release()
+
+    def _failProbe(self, host):
+        self._lock.acquire()
+        try:
+            self._breaker(host).failed(time.time())
+        finally:
+            self._lock.release()
+
+    def _releaseProbe(self, host):
+        self._lock.acquire()
+        try:
+            self._breaker(host).release()
+        finally:
+            self._lock.release()
+
+    def _record(self, location, host, error=None, timeout=None):
+        now = time.time()
+        self._lock.acquire()
+        try:
+            breaker = self._breaker(host)
+            if error is None:
+                breaker.succeeded()
+                return
+            if timeout is not None and isTimeout(error):
+                # most likely the deadline of the caller was too short.
+                breaker.release()
+                return
+            self.failed.set(location, (now + self.ttl, error))
+            if isHostFailure(error):
+                breaker.failed(now)
+            else:
+                # the host did respond.
+                breaker.succeeded()
+        finally:
+            self._lock.release()
+
+    def invalidate(self, location=None):
+        """\
+        Forget the failure of the location, or all failures of every
+        location and host if not specified.
+        """
+
+        self._lock.acquire()
+        try:
+            if location is None:
+                self.failed.clear()
+                self.hosts.clear()
+            else:
+                self.failed.invalidate(location)
+        finally:
+            self._lock.release()
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        kw = loadOptions(max_size, timeout)
+        a = headers and (headers,) or ()
+        if not isinstance(location, basestring):
+            return self.opener.loadURL(location, *a, **kw)
+
+        host = self._host(location)
+        probe = self._check(location, host, time.time())
+        try:
+            result = self.opener.loadURL(location, *a, **kw)
+        except urllib2.URLError, e:
+            self._record(location, host, e, timeout)
+            raise
+        except (httplib.HTTPException, socket.error), e:
+            # such as a timeout while reading the response.
+            error = urllib2.URLError(e)
+            self._record(location, host, error, timeout)
+            raise error
+        except ResourceLimitExceededError:
+            # the host did respond.
+            self._record(location, host)
+            raise
+        except DeadlineExceededError:
+            # the deadline of the caller says nothing of the host.
+            if probe:
+                self._releaseProbe(host)
+            raise
+        except:
+            # the probe must not be left pending, or the circuit would
+            # never be closed again.
+            if probe:
+                self._failProbe(host)
+            raise
+        self._record(location, host)
         return result
+
+
+class HTTPConnectionPool(LockedState):
+    """\
+    Per-host pools of persistent HTTP and HTTPS connections.
+
+    At most size connections are opened to any given host; threads that
+    need a connection to a host with all of its connections in use will
+    wait for one to be released.  Idle connections that were not used
+    within idle_timeout seconds are closed as soon as a connection to
+    the same host is acquired or released, rather than reused.
+
+    Instances are safe to be shared between threads.
+    """
+
+    connection_classes = {
+        'http': httplib.HTTPConnection,
+        'https': httplib.HTTPSConnection,
+    }
+
+    def __init__(self, size=4, idle_timeout=60, timeout=None):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def localState(self):
+        return {'_hosts': {}}
+
+    def _host(self, key):
+        self._lock.acquire()
+        try:
+            host = self._hosts.get(key)
+            if host is None:
+                host = self._hosts[key] = {
+                    'condition': threading.Condition(threading.Lock()),
+                    # oldest first, in the order they were released.
+                    'idle': deque(),
+                    'count': 0,
+                }
+            return host
+        finally:
+            self._lock.release()
+
+    def _reap(self, host, now):
+        # must be called with the condition of the host acquired.
+        idle = host['idle']
+        reaped = 0
+        while idle and now - idle[0][1] >= self.idle_timeout:
+            conn, last_used = idle.popleft()
+            conn.close()
+            host['count'] -= 1
+            reaped += 1
+        return reaped
+
+    def acquire(self, scheme, netloc, timeout=None):
+        """\
+        Return a tuple of a connection to the host and whether it was
+        reused from an idle connection.
+
+        timeout - the number of seconds to wait for a connection should
+                  all of them be in use, after which DeadlineExceededError
+                  is raised.
+        """
+
+        host = self._host((scheme, netloc))
+        condition = host['condition']
+        expires = None
+        if timeout is not None:
+            expires = time.time() + timeout
+        condition.acquire()
+        try:
+            while True:
+                now = time.time()
+                self._reap(host, now)
+                if host['idle']:
+                    # the most recently used is the most likely to be
+                    # still open at the other end.
+                    conn, last_used = host['idle'].pop()
+                    return conn, True
+                if host['count'] < self.size:
+                    host['count'] += 1
+                    break
+                if expires is None:
+                    condition.wait()
+                    continue
+                if now >= expires:
+                    raise DeadlineExceededError(
+                        'no connection to `%s` was released within %g '
+                        'seconds' % (netloc, timeout))
+                condition.wait(expires - now)
+        finally:
+            condition.release()
+
+        try:
+            factory = self.connection_classes[scheme]
+            if self.timeout is None:
+                return factory(netloc), False
+            return factory(netloc, timeout=self.timeout), False
+        except:
+            self.release(scheme, netloc, None)
+            raise
+
+    def release(self, scheme, netloc, conn, reuse=False):
+        """\
+        Return the connection to the pool; it is closed instead unless
+        reuse is specified.
+        """
+
+        host = self._host((scheme, netloc))
+        condition = host['condition']
+        condition.acquire()
+        try:
+            now = time.time()
+            if conn is not None and reuse:
+                host['idle'].append((conn, now))
+            else:
+                if conn is not None:
+                    conn.close()
+                host['count'] -= 1
+            condition.notify(self._reap(host, now) + 1)
+        finally:
+            condition.release()
+
+    def clear(self):
+        """\
+        Close all idle connections.
+        """
+
+        self._lock.acquire()
+        try:
+            hosts = self._hosts.values()
+        finally:
+            self._lock.release()
+
+        for host in hosts:
+            condition = host['condition']
+            condition.acquire()
+            try:
+                for conn, last_used in host['idle']:
+                    conn.close()
+                    host['count'] -= 1
+                host['idle'] = deque()
+                condition.notify_all()
+            finally:
+                condition.release()
+
+
+def setConnectionTimeout(conn, timeout):
+    """\
+    Set the timeout of the HTTPConnection, along with its socket if it
+    is connected already.
+    """
+
+    conn.timeout = timeout
+    if conn.sock is not None:
+        if not isinstance(timeout, (int, long, float)):
+            # the default timeout of httplib.
+            timeout = socket.getdefaulttimeout()
+        conn.sock.settimeout(timeout)
+
+
+class PooledURLOpener(DefaultURLOpener):
+    """\
+    URL opener that reuses persistent connections.
+
+    HTTP and HTTPS locations are requested through connections from a
+    HTTPConnectionPool, which may be shared with other openers; other
+    approved protocols are handled by the DefaultURLOpener.  Redirects
+    are followed, and unsuccessful responses are raised as HTTPError
+    like urllib2 does.
+    """
+
+    max_redirects = 5
+
+    def __init__(self, pool=None, size=4, idle_timeout=60, timeout=None):
+        DefaultURLOpener.__init__(self)
+        if pool is None:
+            pool = HTTPConnectionPool(size, idle_timeout, timeout)
+        self.pool = pool
+
+    def _acquire(self, scheme, netloc, timeout=None):
+        conn, reused = self.pool.acquire(scheme, netloc, timeout)
+        if timeout is not None:
+            # the timeout of the pool is restored once released.
+            conn.pool_timeout = conn.timeout
+            setConnectionTimeout(conn, timeout)
+        return conn, reused
+
+    def _release(self, scheme, netloc, conn, keep=False):
+        if hasattr(conn, 'pool_timeout'):
+            setConnectionTimeout(conn, conn.pool_timeout)
+            del conn.pool_timeout
+        self.pool.release(scheme, netloc, conn, keep)
+
+    def _request(self, scheme, netloc, path, headers, location,
+            max_size=None, timeout=None):
+        conn, reused = self._acquire(scheme, netloc, timeout)
+        keep = False
+        try:
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                if not reused:
+                    raise
+                # the server may have dropped the idle connection, try
+                # again with a brand new one.
+                self._release(scheme, netloc, conn)
+                conn = None
+                conn, reused = self._acquire(scheme, netloc, timeout)
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+            info = dict(response.getheaders())
+            data = self._readResponse(response, info, location, max_size)
+            keep = not response.will_close
+            return response, data
+        finally:
+            if conn is not None:
+                self._release(scheme, netloc, conn, keep)
+
+    def openURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        parts = urlparse.urlsplit(location)
+        if parts.scheme not in self.pool.connection_classes:
+            return DefaultURLOpener.openURL(self, location, headers,
+                max_size, timeout)
+
+        request_headers = {'User-agent': USER_AGENT}
+        if self.accept_encoding:
+            request_headers['Accept-encoding'] = self.accept_encoding
+        if headers:
+            request_headers.update(headers)
+
+        for redirect in xrange(self.max_redirects + 1):
+            path = urlparse.urlunsplit(('', '') + parts[2:4] + ('',))
+            try:
+                response, data = self._request(parts.scheme, parts.netloc,
+                    path or '/', request_headers, location, max_size,
+                    timeout)
+            except (httplib.HTTPException, socket.error), e:
+                raise urllib2.URLError(e)
+            info = dict(response.getheaders())
+            if response.status in (301, 302, 303, 307, 308) and \
+                    'location' in info:
+                target = urlparse.urljoin(location, info['location'])
+                parts = urlparse.urlsplit(target)
+                if parts.scheme not in self.pool.connection_classes:
+                    raise urllib2.HTTPError(location, response.status,
+                        'redirect to unsupported protocol', info, None)
+                location = target
+                continue
+            if not 200 <= response.status < 300:
+                raise urllib2.HTTPError(location, response.status,
+                    response.reason, info, None)
+            return data, info
+
+        raise urllib2.HTTPError(location, response.status,
+            'too many redirects', info, None)
+
+
+class AsyncURLOpener(WrappingURLOpener, LockedState):
+    """\
+    URL opener that loads the locations through another opener within
+    a shared pool of threads.
+
+    The number of threads is bounded by workers no matter how many
+    locations are being loaded, so any number of model loads can be in
+    progress at once.
+
+    opener - the opener to wrap.
+    workers - the number of threads to load the locations with.
+    """
+
+    zope.interface.implements(IAsyncURLOpener)
+
+    def __init__(self, opener, workers=8):
+        WrappingURLOpener.__init__(self, opener)
+        self.pool = ThreadPool(workers)
+
+    def localState(self):
+        # only the size of the pool, the threads are started again.
+        return {'pool': self.pool.size}
+
+    def __setstate__(self, state):
+        LockedState.__setstate__(self, state)
+        self.pool = ThreadPool(self.pool)
+
+    def loadURLAsync(self, location, max_size=None, timeout=None):
+        if not self.validateProtocol(location):
+            future = Future()
+            try:
+                raise UnapprovedProtocolError(
+                    'protocol for the location is not approved')
+            except UnapprovedProtocolError:
+                future.set_exc_info(sys.exc_info())
+            return future
+        return self.pool.submit(self, location, max_size, timeout)
+
+
+def readMapped(path, location, max_size=None):
+    """\
+    Read the file at path through a memory map.
+
+    location - the location of the file, for the error messages.
+    max_size - the size above which ResourceLimitExceededError is
+               raised without reading the file.
+    """
+
+    fd = open(path, 'rb')
+    try:
+        size = os.fstat(fd.fileno()).st_size
+        checkSize(size, location, max_size)
+        if not size:
+            # empty files cannot be mapped.
+            return ''
+        mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return mapped[:]
+        finally:
+            mapped.close()
+    finally:
+        fd.close()
+
+
+class MappedFile(object):
+    """\
+    File object over a memory map, as the read method of the memory
+    map requires the size.
+    """
+
+    def __init__(self, mapped):
+        self.mapped = mapped
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.mapped) - self.mapped.tell()
+        return self.mapped.read(size)
+
+    def seek(self, *a):
+        return self.mapped.seek(*a)
+
+    def tell(self):
+        return self.mapped.tell()
+
+    def close(self):
+        self.mapped.close()
+
+
+class LocalURLOpener(BaseURLOpener):
+    """\
+    URL opener for the files within a local directory.
+
+    Only file locations that resolve to a path within the root, after
+    following any symbolic links, are approved.  The files are read
+    through memory maps rather than through urllib2.
+
+    root - the directory that the files must be within.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.approved_protocol = ['file']
+
+    def url(self, *p):
+        """\
+        Return the location of the path relative to the root.
+        """
+
+        return urlparse.urljoin('file:',
+            urllib.pathname2url(os.path.join(self.root, *p)))
+
+    def _path(self, location):
+        if not isinstance(location, basestring):
+            return None
+        scheme, netloc, path = urlparse.urlsplit(location)[:3]
+        if scheme not in self.approved_protocol or \
+                netloc not in ('', 'localhost'):
+            return None
+        path = os.path.realpath(urllib.url2pathname(path))
+        if path != self.root and \
+                not path.startswith(os.path.join(self.root, '')):
+            return None
+        return path
+
+    def validateProtocol(self, location):
+        return self._path(location) is not None
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        path = self._path(location)
+        if path is None:
+            raise UnapprovedProtocolError(
+                'location is not within the root directory')
+        try:
+            return readMapped(path, location, max_size)
+        except (IOError, OSError), e:
+            raise urllib2.URLError(e)
+
+
+class RootedURLOpener(BaseURLOpener):
+    """\
+    Base URL opener for the locations of the form scheme:///path, where
+    the path is relative to a root directory within the source of the
+    opener.  Relative locations are resolved such that they cannot
+    leave the root.
+
+    root - the directory within the source the paths are relative to.
+    """
+
+    scheme = None
+
+    def __init__(self, root=''):
+        self.root = root.strip('/')
+        self.approved_protocol = [self.scheme]
+
+    def url(self, path):
+        """\
+        Return the location of the path relative to the root.
+        """
+
+        return '%s:///%s' % (self.scheme, path.lstrip('/'))
+
+    def _name(self, location):
+        path = urlparse.urlsplit(location)[2]
+        # normalising from the top means the path cannot escape it.
+        path = posixpath.normpath('/' + path).lstrip('/')
+        if self.root:
+            path = posixpath.join(self.root, path)
+        return path
+
+    def validateProtocol(self, location):
+        if not isinstance(location, basestring):
+            return False
+        parts = urlparse.urlsplit(location)
+        return parts.scheme in self.approved_protocol and not parts.netloc
+
+    def urljoin(self, base, url, *a, **kw):
+        if urlparse.urlsplit(url).scheme or \
+                urlparse.urlsplit(base).scheme != self.scheme:
+            return urlparse.urljoin(base, url, *a, **kw)
+        path = posixpath.dirname(urlparse.urlsplit(base)[2])
+        return self.url(posixpath.normpath(posixpath.join('/', path, url)))
+
+    def canonicalURL(self, location):
+        if not self.validateProtocol(location):
+            return BaseURLOpener.canonicalURL(self, location)
+        return self.url(posixpath.normpath(
+            '/' + urlparse.urlsplit(location)[2]))
+
+
+class ArchiveURLOpener(RootedURLOpener, LockedState):
+    """\
+    URL opener for the members of a zip or tar archive, which are read
+    without extracting the archive.
+
+    The locations are of the form archive:///path/to/member, where the
+    path is relative to the root directory within the archive.  The
+    archive is memory mapped and opened when first needed, and the
+    members are read one at a time.
+
+    path - the path to the archive.
+    root - the directory within the archive the paths are relative to.
+    """
+
+    scheme = 'archive'
+
+    def __init__(self, path, root=''):
+        RootedURLOpener.__init__(self, root)
+        self.path = path
+        self._lock = threading.Lock()
+        self._mapped = None
+        self._archive = None
+
+    def localState(self):
+        # the archive is opened again by the other processes.
+        return {'_mapped': None, '_archive': None}
+
+    def _open(self):
+        if self._archive is None:
+            fd = open(self.path, 'rb')
+            try:
+                mapped = MappedFile(
+                    mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+            finally:
+                fd.close()
+            if zipfile.is_zipfile(mapped):
+                archive = zipfile.ZipFile(mapped)
+            else:
+                mapped.seek(0)
+                archive = tarfile.open(fileobj=mapped, mode='r:*')
+            self._mapped, self._archive = mapped, archive
+        return self._archive
+
+    def _read(self, name, location, max_size):
+        archive = self._open()
+        try:
+            if isinstance(archive, zipfile.ZipFile):
+                info = archive.getinfo(name)
+                checkSize(info.file_size, location, max_size)
+                return archive.read(info)
+            info = archive.getmember(name)
+        except KeyError:
+            raise urllib2.URLError('`%s` is not in the archive' % location)
+        if not info.isfile():
+            raise urllib2.URLError('`%s` is not a file' % location)
+        checkSize(info.size, location, max_size)
+        return archive.extractfile(info).read()
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        name = self._name(location)
+        # the archive is read through a single file position.
+        self._lock.acquire()
+        try:
+            return self._read(name, location, max_size)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """\
+        Close the archive, which is opened again if needed.
+        """
+
+        self._lock.acquire()
+        try:
+            if self._archive is not None:
+                self._archive.close()
+                self._mapped.close()
+            self._mapped = self._archive = None
+        finally:
+            self._lock.release()
+
+
+class GitURLOpener(RootedURLOpener, LockedState):
+    """\
+    URL opener for the files of a git repository at a given revision,
+    read from the object store without a checkout.
+
+    The locations are of the form git:///path/to/file, where the path is
+    relative to the root directory within the repository.  All objects
+    are read through a single long-lived `git cat-file --batch`
+    process, which is started when first needed.
+
+    path - the path to the repository (or its git directory).
+    rev - the revision to read the files from; it is resolved to its
+          commit once, so later changes to the references do not
+          affect this opener.
+    root - the directory within the repository the paths are relative
+           to.
+    git - the git executable.
+    """
+
+    scheme = 'git'
+
+    def __init__(self, path, rev='HEAD', root='', git='git'):
+        RootedURLOpener.__init__(self, root)
+        self.path = path
+        self.rev = rev
+        self.git = git
+        self.commit = None
+        self._lock = threading.Lock()
+        self._process = None
+
+    def localState(self):
+        # the other processes start their own git process.
+        return {'_process': None}
+
+    def _start(self):
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                [self.git, 'cat-file', '--batch'], cwd=self.path,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                close_fds=True)
+        return self._process
+
+    def _request(self, name, max_size=None):
+        """\
+        Return the name, the type, the size and the contents of the
+        object, where the contents are None if the size exceeds the
+        max_size, and everything is None if the object is missing.
+        """
+
+        process = self._start()
+        try:
+            process.stdin.write(name + '\n')
+            process.stdin.flush()
+            header = process.stdout.readline()
+            if not header:
+                raise IOError('git cat-file exited')
+            fields = header.split()
+            if len(fields) != 3:
+                # the object is missing or ambiguous.
+                return None, None, None, None
+            sha, kind, size = fields[0], fields[1], int(fields[2])
+            data = None
+            if max_size is not None and size > max_size:
+                # the contents must be consumed to keep the stream
+                # in sync; they are not kept.
+                remaining = size + 1
+                while remaining:
+                    chunk = process.stdout.read(
+                        min(read_chunk_size, remaining))
+                    if not chunk:
+                        raise IOError('git cat-file exited')
+                    remaining -= len(chunk)
+            else:
+                data = process.stdout.read(size + 1)[:-1]
+        except (IOError, OSError, ValueError), e:
+            # the process is in an unknown state, start over next time.
+            self._stop()
+            raise urllib2.URLError(e)
+        return sha, kind, size, data
+
+    def _stop(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+            except (IOError, OSError):
+                pass
+            if self._process.poll() is None:
+                self._process.terminate()
+            self._process.wait()
+            self._process = None
+
+    def _resolve(self):
+        if self.commit is None:
+            sha, kind, size, data = self._request('%s^{commit}' % self.rev)
+            if kind != 'commit':
+                raise urllib2.URLError(
+                    'revision `%s` is not a commit' % self.rev)
+            self.commit = sha
+        return self.commit
+
+    def loadURL(self, location, headers=None, max_size=None,
+            timeout=None):
+        name = self._name(location)
+        if '\n' in name:
+            raise urllib2.URLError('invalid path `%s`' % location)
+        self._lock.acquire()
+        try:
+            sha, kind, size, data = self._request('%s:%s' % (
+                self._resolve(), name), max_size)
+        finally:
+            self._lock.release()
+        if kind is None:
+            raise urllib2.URLError('`%s` is not in the repository' % location)
+        if kind != 'blob':
+            raise urllib2.URLError('`%s` is not a file' % location)
+        checkSize(size, location, max_size)
+        return data
+
+    def close(self):
+        """\
+        Stop the git process, which is started again if needed.
+        """
+
+        self._lock.acquire()
+        try:
+            self._stop()
+        finally:
+            self._lock.release()
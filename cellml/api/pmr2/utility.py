@@ -1,29 +1,98 @@
 from os import listdir
 
+from os.path import abspath
 from os.path import join
 from os.path import dirname
 from os.path import splitext
 
-from cStringIO import StringIO
+from hashlib import sha1
 
-from lxml import etree
-import urllib2
+import json
+import multiprocessing
+import sys
+import threading
 
 import zope.interface
 from zope.schema.fieldproperty import FieldProperty
 
 import cgrspy.bootstrap
 
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import IAsyncURLOpener
 from cellml.api.pmr2.interfaces import ICellMLAPIUtility
 from cellml.api.pmr2.interfaces import IURLOpener
-from cellml.api.pmr2.interfaces import UnapprovedProtocolError
 
+from cellml.api.pmr2 import instrument
+from cellml.api.pmr2 import worker
+from cellml.api.pmr2.deadline import asDeadline
+from cellml.api.pmr2.ingest import decodeSource
+from cellml.api.pmr2.property import instance_property
 from cellml.api.pmr2.property import singleton_property
+from cellml.api.pmr2.property import threadlocal_property
+from cellml.api.pmr2.resolver import ImportResolver
+from cellml.api.pmr2.resolver import ResourceLimits
+from cellml.api.pmr2.pool import Future
+from cellml.api.pmr2.pool import ThreadPool
+from cellml.api.pmr2.urlopener import AsyncURLOpener
 from cellml.api.pmr2.urlopener import DefaultURLOpener
 
 _root = dirname(__file__)
 resource_file = lambda *p: join(_root, 'resource', *p)
 
+snapshot_format = 'cellml.api.pmr2.snapshot/1'
+
+
+def treeDigest(tree):
+    """\
+    Return the digest of a model tree from dumpModelTree.
+    """
+
+    digest = sha1()
+    for path, source in tree:
+        if isinstance(source, unicode):
+            source = source.encode('utf8')
+        digest.update('%r\n' % (path,))
+        digest.update(source)
+        digest.update('\n')
+    return digest.hexdigest()
+
+
+class ValidityError(object):
+    """\
+    An error reported by the validation of a model.
+
+    The position of the error within the XML is only computed when it
+    is first accessed.
+    """
+
+    def __init__(self, vacs_service, error):
+        self.vacs_service = vacs_service
+        self.description = error.description
+        self.severity = error.isWarningOnly and 'Warning' or 'Error'
+        self.node = error.errorNode
+
+    @instance_property
+    def position(self):
+        # since offset appears to be specific to row and we don't
+        # calculate that, assume 1 to offset the xml header.
+        return self.vacs_service.getPositionInXML(self.node, 1)
+
+    @property
+    def row(self):
+        return self.position[0]
+
+    @property
+    def col(self):
+        return self.position[1]
+
+    def __unicode__(self):
+        # the description may not be ascii.
+        return u'Line %d, Col %d: %s: %s' % (
+            self.row, self.col, self.severity, self.description)
+
+    def __str__(self):
+        return unicode(self).encode('utf8')
+
 
 class CellMLAPIUtility(object):
     """\
@@ -40,23 +109,53 @@ class CellMLAPIUtility(object):
         from cellml.api.pmr2.interfaces import ICellMLAPIUtility
         import zope.component
         api_util = zope.component.getUtility(ICellMLAPIUtility)
+
+    As the CellML API is not reentrant, every thread uses its own
+    bootstrap, model loader and validation service, so that multiple
+    threads may load and validate models with this utility at the same
+    time.  Models must not be used by multiple threads at once however.
+    The CeLEDS exporters are shared by every thread, so the code of a
+    model is only generated by one thread at a time.
     """
 
     zope.interface.implements(ICellMLAPIUtility)
 
     celeds_exporter = FieldProperty(ICellMLAPIUtility['celeds_exporter'])
+    celeds_definitions = FieldProperty(
+        ICellMLAPIUtility['celeds_definitions'])
+    load_workers = FieldProperty(ICellMLAPIUtility['load_workers'])
+    export_processes = FieldProperty(ICellMLAPIUtility['export_processes'])
+    max_document_size = FieldProperty(ICellMLAPIUtility['max_document_size'])
+    max_total_size = FieldProperty(ICellMLAPIUtility['max_total_size'])
+    max_imports = FieldProperty(ICellMLAPIUtility['max_imports'])
+    max_import_depth = FieldProperty(ICellMLAPIUtility['max_import_depth'])
+    model_cache = None
+    code_cache = None
 
     def __init__(self):
         # set non-primative defaults
         self.celeds_exporter = {}
+        self.celeds_definitions = {}
+        self._celeds_lock = threading.Lock()
+        # held while the shared exporters are generating code.
+        self._export_lock = threading.Lock()
 
         # other initializations
-        self._initiateCeLEDS()
+        self.registerCeledsDefinitions(resource_file('celeds'))
 
     @singleton_property
     def url_opener(self):
         return DefaultURLOpener()
 
+    @singleton_property
+    def async_url_opener(self):
+        return AsyncURLOpener(self.url_opener)
+
+    @singleton_property
+    def api_executor(self):
+        # the single thread that asynchronous loads use the API from.
+        return ThreadPool(1)
+
     @singleton_property
     def celeds_bootstrap(self):
         cgrspy.bootstrap.loadGenericModule('cgrs_celeds')
@@ -71,47 +170,80 @@ class CellMLAPIUtility(object):
             'CreateCeLEDSExporterBootstrap')
         return celedsexporter_bootstrap
 
-    @singleton_property
+    @threadlocal_property
     def cellml_bootstrap(self):
         cgrspy.bootstrap.loadGenericModule('cgrs_cellml')
         cellml_bootstrap = cgrspy.bootstrap.fetch('CreateCellMLBootstrap')
         return cellml_bootstrap
 
-    @singleton_property
+    @threadlocal_property
     def model_loader(self):
         return self.cellml_bootstrap.modelLoader
 
-    @singleton_property
+    @threadlocal_property
     def vacs_service(self):
         cgrspy.bootstrap.loadGenericModule('cgrs_vacss')
         vacs_service = cgrspy.bootstrap.fetch('CreateVACSService')
         return vacs_service
 
-    def _initiateCeLEDS(self):
+    def registerCeledsDefinition(self, key, path):
+        """\
+        Register the CeLEDS definition file at path as the exporter for
+        the language identified by key, replacing the existing one.
+
+        The exporter is only instantiated when it is first requested.
+        """
+
+        self._celeds_lock.acquire()
+        try:
+            self.celeds_definitions[key] = abspath(path)
+            self.celeds_exporter.pop(key, None)
+        finally:
+            self._celeds_lock.release()
+
+    def registerCeledsDefinitions(self, path):
         """\
-        Instantiate all CeLEDS definition files within the resource
-        directory as exporters.
+        Register all CeLEDS definition files within the directory at
+        path, using the file names without the extension as the keys.
         """
 
-        for filename in listdir(resource_file('celeds')):
+        for filename in sorted(listdir(path)):
             if not filename.endswith('.xml'):
                 continue
-            fd = open(resource_file('celeds', filename))
-            raw = fd.read()
-            fd.close()
-
             key, ext = splitext(filename)
-            exporter = self.celedsexporter_bootstrap.createExporterFromText(raw)
+            self.registerCeledsDefinition(key, join(path, filename))
 
-            self.celeds_exporter[key] = exporter
+    def getCeledsExporter(self, key):
+        """\
+        Return the CeLEDS exporter for the language identified by key,
+        instantiating it from its definition file on first use.
+        """
+
+        self._celeds_lock.acquire()
+        try:
+            exporter = self.celeds_exporter.get(key)
+            if exporter is None:
+                # raises KeyError for unregistered languages.
+                fd = open(self.celeds_definitions[key])
+                raw = fd.read()
+                fd.close()
+
+                bootstrap = self.celedsexporter_bootstrap
+                exporter = bootstrap.createExporterFromText(raw)
+                self.celeds_exporter[key] = exporter
+            return exporter
+        finally:
+            self._celeds_lock.release()
 
     def availableCeledsExporter(self):
-        """
+        """\
+        see Interface.
         """
 
-        return self.celeds_exporter.key()
+        return sorted(self.celeds_definitions.keys())
 
-    def loadModel(self, model_url, loader=None):
+    def loadModel(self, model_url, loader=None, workers=None, report=None,
+            deadline=None):
         """\
         Loads the CellML Model at the specified URL.
 
@@ -122,46 +254,235 @@ class CellMLAPIUtility(object):
         The optional loader parameter allows the caller to replace with
         a specialized version (subclassed from BaseURLOpener) that will
         be used to load the model_url.
+
+        The optional workers parameter specifies the number of threads
+        used to fetch the imports concurrently, defaulting to the value
+        of load_workers.  Only the fetching is done by the threads; the
+        imports are still instantiated in the same order as the serial
+        loader within the calling thread.
+
+        Import locations are canonicalised by the loader, and every
+        distinct document is only fetched once within a load, with all
+        imports referencing it instantiated from that one source.  An
+        import of a document that is already one of its own ancestors
+        is skipped to avoid import cycles.
+
+        If a model_cache is assigned to this utility, the model that was
+        previously loaded from the same URL is returned instead if every
+        document it was loaded from is unchanged.  If the model cache is
+        incremental, only the imports of the changed documents are
+        instantiated again should the model itself be unchanged.
+
+        All documents are decoded from the encoding specified by their
+        byte order mark or XML declaration before they are passed to
+        the CellML API.
+
+        The load is aborted with ResourceLimitExceededError as soon as
+        it exceeds any of the limits set on this utility, which are
+        max_document_size, max_total_size, max_imports and
+        max_import_depth.
+
+        Imports that fail to be fetched are skipped, and are recorded in
+        the LoadReport passed as report, if any, along with the reason.
+
+        The deadline is either a Deadline or the number of seconds the
+        load must be completed within, and the time remaining is the
+        timeout of every fetch.  Once it is exceeded the imports not yet
+        instantiated are abandoned (and recorded in the report), and
+        DeadlineExceededError is raised with the partially loaded model
+        as its partial attribute.
         """
 
-        def appendQueue(base, model):
-            # need to remember the source that this import was derived 
-            # from; use the xml:base of the model if available.
-            base_url = model.xmlBase.asText or base
-            subimports = model.imports
-            importq.append((base_url, subimports,))
+        if loader is None:
+            loader = self.url_opener
+        assert IURLOpener.providedBy(loader)
+
+        if workers is None:
+            workers = self.load_workers
+
+        cache_key = None
+        if self.model_cache is not None and isinstance(
+                model_url, basestring):
+            cache_key = loader.canonicalURL(model_url)
+
+        started = instrument.start()
+        resolver = ImportResolver(loader, workers,
+            self._resourceLimits(deadline), report)
+        try:
+            model_source = resolver.load(model_url)
+            if cache_key is not None:
+                model = self.model_cache.lookup(cache_key,
+                    lambda manifest: resolver.validate(manifest, model_source),
+                    lambda manifest, model: self._refreshModel(resolver,
+                        model, model_url, manifest, model_source))
+                if model is not None:
+                    instrument.record('load', started, model_url)
+                    return model
+
+            model = self._createModel(model_source, model_url)
+            resolver.resolve(model, model_url)
+
+            if cache_key is not None:
+                model = self.model_cache.store(cache_key,
+                    resolver.manifest(model_source), model)
+        finally:
+            resolver.close()
+
+        instrument.record('load', started, model_url)
+        return model
+
+    def _refreshModel(self, resolver, model, model_url, manifest,
+            model_source):
+        changed = resolver.changes(manifest, model_source)
+        if changed is None:
+            return None
+        resolver.refresh(model, model_url, changed)
+        return resolver.manifest(model_source)
+
+    def reloadModel(self, model, model_url, changed, loader=None,
+            workers=None, report=None, deadline=None):
+        """\
+        Reload the imports of the model previously loaded from model_url
+        that reference any of the changed documents, in place.
+
+        Only the documents that have changed are fetched and
+        instantiated again, along with the imports within them; every
+        other import is kept as it is.  Should the model itself be one
+        of the changed documents, it is loaded again as a whole.  If any
+        of the changed documents fails to be fetched or parsed, the
+        error is raised with the model left as it was.
+
+        changed - the URLs of the documents that have changed.
+
+        Returns the model, which is a new model only if the model itself
+        has changed.  See loadModel for the other parameters.
+        """
 
         if loader is None:
             loader = self.url_opener
         assert IURLOpener.providedBy(loader)
 
-        importq = []
-        model_string = loader(model_url)
-        # workaround for lack of encoding detection regardless of input.
+        if workers is None:
+            workers = self.load_workers
+
+        changed = set(loader.canonicalURL(url) for url in changed)
+        if loader.canonicalURL(model_url) in changed:
+            return self.loadModel(model_url, loader, workers, report,
+                deadline)
+
+        started = instrument.start()
+        resolver = ImportResolver(loader, workers,
+            self._resourceLimits(deadline), report)
         try:
-            encoding = etree.parse(StringIO(model_string)).docinfo.encoding
-        except:
-            encoding = 'ISO-8859-1'
-        model = self.model_loader.createFromText(model_string.decode(encoding))
-        appendQueue(model_url, model)
-
-        while len(importq):
-            base, imports = importq.pop(0)
-            for i in imports:
-                relurl = i.xlinkHref.asText
-                nexturl = loader.urljoin(base, relurl)
-                try:
-                    source = loader(nexturl)
-                except urllib2.URLError:
-                    # XXX silently failing, should log somewhere
-                    continue
-                except UnapprovedProtocolError:
-                    continue
-                i.instantiateFromText(source)
-                appendQueue(nexturl, i.importedModel)
+            resolver.refresh(model, model_url, changed)
+        finally:
+            resolver.close()
+        instrument.record('reload', started, model_url)
+        return model
+
+    def _resourceLimits(self, deadline=None):
+        # every load accounts its own usage.
+        return ResourceLimits(self.max_document_size, self.max_total_size,
+            self.max_imports, self.max_import_depth, asDeadline(deadline))
+
+    def _createModel(self, source, url=None):
+        started = instrument.start()
+        model = self.model_loader.createFromText(source)
+        instrument.record('parse', started, url, len(source))
+        return model
+
+    def loadModelAsync(self, model_url, loader=None, report=None,
+            deadline=None):
+        """\
+        Start loading the CellML Model at the specified URL, returning
+        a Future of the model.
+
+        The loader must provide IAsyncURLOpener, and defaults to the
+        async_url_opener of this utility.  Imports are resolved like
+        loadModel, except that the calls to the CellML API are made by
+        the api_executor thread, which only instantiates the imports as
+        their fetches complete and never waits on any of them, so a
+        single thread serves any number of loads that are in progress.
+        """
+
+        if loader is None:
+            loader = self.async_url_opener
+        assert IAsyncURLOpener.providedBy(loader)
+
+        executor = self.api_executor
+        result = Future()
+        started = instrument.start()
+        resolver = ImportResolver(loader,
+            limits=self._resourceLimits(deadline), report=report)
+
+        def fail():
+            # nothing more is fetched for a load that is done.
+            resolver.close()
+            result.set_exc_info(sys.exc_info())
+
+        def advance(model):
+            try:
+                pending = resolver.step(block=False)
+            except:
+                fail()
+                return
+            if pending is None:
+                resolver.close()
+                instrument.record('load', started, model_url)
+                result.set_result(model)
+                return
+            pending.add_done_callback(
+                lambda done: executor.submit(advance, model))
+
+        def start(root):
+            try:
+                model = self._createModel(root.result(), model_url)
+                resolver.begin(model, model_url)
+            except:
+                fail()
+                return
+            advance(model)
+
+        resolver.loadAsync(model_url).add_done_callback(
+            lambda root: executor.submit(start, root))
+        return result
+
+    def loadModelFromText(self, source, base_url=None, loader=None,
+            workers=None, report=None, deadline=None):
+        """\
+        Loads a CellML Model from its source, resolving its imports
+        relative to its xml:base or the base_url.
 
+        See loadModel for the other parameters.
+        """
+
+        if loader is None:
+            loader = self.url_opener
+        assert IURLOpener.providedBy(loader)
+
+        if workers is None:
+            workers = self.load_workers
+
+        model = self._createModel(decodeSource(source, base_url), base_url)
+        resolver = ImportResolver(loader, workers,
+            self._resourceLimits(deadline), report)
+        try:
+            resolver.resolve(model, base_url)
+        finally:
+            resolver.close()
         return model
 
+    def invalidateModel(self, model_url, loader=None):
+        """\
+        Remove the model loaded from the URL from the model cache.
+        """
+
+        if self.model_cache is None:
+            return
+        if loader is None:
+            loader = self.url_opener
+        self.model_cache.invalidate(loader.canonicalURL(model_url))
+
     def serialiseNode(self, node):
         """\
         see Interface.
@@ -169,20 +490,235 @@ class CellMLAPIUtility(object):
 
         return self.cellml_bootstrap.serialiseNode(node)
 
-    def extractMaths(self, model):
+    def extractMaths(self, model, deadline=None):
         """\
         see Interface.
         """
 
+        deadline = asDeadline(deadline)
+        started = instrument.start()
         results = []
         for component in model.allComponents:
+            if deadline is not None:
+                deadline.check('extraction of the maths', results)
             results.append((
                 component.name,
                 [self.serialiseNode(i) for i in component.math],
             ))
+        instrument.record('maths', started)
         return results
 
-    def exportCeleds(self, model, language=None):
+    def dumpModelTree(self, model):
+        """\
+        Serialise the model along with all of its instantiated imports.
+
+        Returns a list of tuples of the path to each model and its
+        serialised form, in breadth-first order.  The path is a tuple
+        of the indices of the imports leading to the model from the
+        root model, which has the empty path.
+        """
+
+        return [(path, self.serialiseNode(current))
+            for path, current, i in self._iterModelTree(model)]
+
+    def _iterModelTree(self, model):
+        # yields the path, the model and the import it was instantiated
+        # by (None for the root model) in breadth-first order.
+        yield (), model, None
+        queue = [((), model)]
+        while queue:
+            path, current = queue.pop(0)
+            for n, i in enumerate(current.imports):
+                if not i.wasInstantiated:
+                    continue
+                imported = i.importedModel
+                yield path + (n,), imported, i
+                queue.append((path + (n,), imported))
+
+    def loadModelTree(self, tree):
+        """\
+        Load a model from the output of dumpModelTree, without any
+        import resolution.
+        """
+
+        (root_path, source), entries = tree[0], tree[1:]
+        model = self._createModel(source)
+        models = {root_path: model}
+        for path, source in entries:
+            parent = models[path[:-1]]
+            for n, i in enumerate(parent.imports):
+                if n == path[-1]:
+                    i.instantiateFromText(source)
+                    models[path] = i.importedModel
+                    break
+        return model
+
+    def snapshotModel(self, model, model_url=None, loader=None):
+        """\
+        Serialise the model with all of its instantiated imports into a
+        single self-contained snapshot, returned as a JSON document.
+
+        The snapshot holds the output of dumpModelTree along with the
+        canonical location every document was originally loaded from,
+        which is only known if model_url is the location of the model.
+        """
+
+        if loader is None:
+            loader = self.url_opener
+
+        # the locations the imports of every model are relative to.
+        bases = {}
+        documents = []
+        for path, current, i in self._iterModelTree(model):
+            if i is None:
+                base = model_url
+            elif bases[path[:-1]] is None:
+                base = None
+            else:
+                base = loader.canonicalURL(loader.urljoin(
+                    bases[path[:-1]], i.xlinkHref.asText))
+            bases[path] = current.xmlBase.asText or base
+            documents.append({
+                'path': list(path),
+                'base': base,
+                'source': self.serialiseNode(current),
+            })
+
+        tree = [(tuple(d['path']), d['source']) for d in documents]
+        return json.dumps({
+            'format': snapshot_format,
+            'url': model_url,
+            'digest': treeDigest(tree),
+            'documents': documents,
+        }, sort_keys=True)
+
+    def loadSnapshot(self, snapshot):
+        """\
+        Load a model from a snapshot produced by snapshotModel, without
+        any import resolution.
+
+        Raises ValueError if the snapshot is not valid.
+        """
+
+        data = json.loads(snapshot)
+        if not isinstance(data, dict) or \
+                data.get('format') != snapshot_format:
+            raise ValueError('not a model snapshot')
+        tree = [(tuple(d['path']), d['source']) for d in data['documents']]
+        if treeDigest(tree) != data.get('digest'):
+            raise ValueError('model snapshot is corrupted')
+        return self.loadModelTree(tree)
+
+    def celedsDefinitionDigest(self, key):
+        """\
+        Return the digest of the CeLEDS definition file of a language.
+        """
+
+        fd = open(self.celeds_definitions[key], 'rb')
+        try:
+            return sha1(fd.read()).hexdigest()
+        finally:
+            fd.close()
+
+    def _generateCode(self, model, keys, processes, tree=None,
+            deadline=None):
+        if not processes or processes < 2 or len(keys) < 2:
+            for key in keys:
+                if deadline is not None:
+                    deadline.check('export of `%s`' % key)
+                started = instrument.start()
+                exporter = self.getCeledsExporter(key)
+                self._export_lock.acquire()
+                try:
+                    code = exporter.generateCode(model)
+                finally:
+                    self._export_lock.release()
+                instrument.record('export', started, language=key)
+                yield key, code
+            return
+
+        if tree is None:
+            tree = self.dumpModelTree(model)
+        jobs = [(tree, key, self.celeds_definitions[key]) for key in keys]
+        # the languages are generated in other processes, so only the
+        # time until each one is received is known here.
+        started = instrument.start()
+        pool = multiprocessing.Pool(min(processes, len(keys)))
+        try:
+            results = pool.imap_unordered(worker.exportCeleds, jobs)
+            for job in jobs:
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline.remaining()
+                try:
+                    key, code = results.next(timeout)
+                except multiprocessing.TimeoutError:
+                    # the workers still generating code are terminated.
+                    raise deadline.error('export of the languages')
+                instrument.record('export', started, language=key)
+                yield key, code
+            pool.close()
+        finally:
+            # also stops the workers should the caller stop early.
+            pool.terminate()
+            pool.join()
+
+    def iterExportCeleds(self, model, language=None, processes=None,
+            deadline=None):
+        """\
+        Export model to the target language(s) through CeLEDS, yielding
+        a tuple of the language and the code as each one completes.
+
+        If the number of processes (defaulting to export_processes) is
+        at least 2, the languages are generated concurrently by a pool
+        of worker processes, each loading its own copy of the model
+        from the output of dumpModelTree.
+
+        If a code_cache is assigned to this utility, the code that was
+        previously generated for an identical model with an identical
+        CeLEDS definition is returned first, without any generation.
+
+        Once the deadline is exceeded, DeadlineExceededError is raised
+        and no further languages are generated; the worker processes
+        that are still generating are terminated.
+
+        See exportCeleds for the other parameters.
+        """
+
+        deadline = asDeadline(deadline)
+
+        keys = [key for key in self.availableCeledsExporter()
+                if not language or key in language]
+
+        if processes is None:
+            processes = self.export_processes
+
+        cache = self.code_cache
+        tree = None
+        cache_keys = {}
+        if cache is not None:
+            tree = self.dumpModelTree(model)
+            model_digest = treeDigest(tree)
+            remaining = []
+            for key in keys:
+                cache_key = cache.key(model_digest, key,
+                    self.celedsDefinitionDigest(key))
+                code = cache.get(cache_key)
+                if code is None:
+                    cache_keys[key] = cache_key
+                    remaining.append(key)
+                else:
+                    yield key, code
+            keys = remaining
+
+        for key, code in self._generateCode(model, keys, processes, tree,
+                deadline):
+            if cache is not None:
+                cache.set(cache_keys[key], code)
+            yield key, code
+
+    def exportCeleds(self, model, language=None, processes=None,
+            deadline=None):
         """\
         Export model to the target language(s) through CeLEDS.
 
@@ -193,41 +729,132 @@ class CellMLAPIUtility(object):
         language - a list of languages to generate output for.
                    if language is not available it will not be
                    used.
+        processes - the number of worker processes to generate the
+                    languages with.
+        deadline - a Deadline or the number of seconds the export must
+                   be completed within; the languages completed by then
+                   are the partial result of the DeadlineExceededError.
+        """
+
+        results = {}
+        try:
+            for key, code in self.iterExportCeleds(model, language,
+                    processes, deadline):
+                results[key] = code
+        except DeadlineExceededError, e:
+            e.partial = results
+            raise
+        return results
+
+    def validateModels(self, items, loader=None, processes=None,
+            deadline=None):
+        """\
+        Load and validate a batch of models, yielding the results as
+        they are completed.
+
+        items - iterable of URLs or sources of the models.
+        loader - the opener to load the models with; it must be
+                 picklable if more than one process is used.
+        processes - the number of worker processes to use, defaulting
+                    to the number of processors.
+        deadline - a Deadline or the number of seconds the whole batch
+                   must be completed within, after which
+                   DeadlineExceededError is raised.
+
+        Yields tuples of the index of the item, its URL (None if the
+        item was a source), the list of messages from validateModel
+        (or the error that prevented the model from being loaded) and
+        a dictionary of the time spent on loading and on validation.
         """
 
-        result = {}
+        deadline = asDeadline(deadline)
+        jobs = ((index, item, loader, deadline)
+            for index, item in enumerate(items))
 
-        for key, exporter in self.celeds_exporter.iteritems():
-            if language and k not in language:
-                continue
-            code = exporter.generateCode(model)
-            result[key] = code
+        if processes is None:
+            processes = multiprocessing.cpu_count()
 
-        return result
+        if processes < 2:
+            for job in jobs:
+                if deadline is not None:
+                    deadline.check('validation of the models')
+                yield worker.validateModel(job, self)
+            return
 
-    def validateModel(self, model):
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.imap_unordered(worker.validateModel, jobs)
+            while True:
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline.remaining()
+                try:
+                    result = results.next(timeout)
+                except StopIteration:
+                    break
+                except multiprocessing.TimeoutError:
+                    raise deadline.error('validation of the models')
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def iterValidateModel(self, model, max_errors=None, errors_only=False,
+            deadline=None):
         """\
-        Validate model.
+        Validate model, yielding a ValidityError for each error.
+
+        The positions of the errors are only computed when they are
+        accessed, and no further errors are processed once the caller
+        stops iterating.
+
+        max_errors - the maximum number of errors to yield.
+        errors_only - skip the errors that are only warnings.
+        deadline - a Deadline or the number of seconds the validation
+                   must be completed within, checked before the model
+                   is validated and before every error, as the
+                   validation itself cannot be interrupted.
         """
 
-        def iterateResultSet(rs):
-            for i in xrange(rs.nValidityErrors):
-                yield rs.getValidityError(i)
+        if max_errors is not None and max_errors <= 0:
+            return
 
-        result = []  # list of error messages.
+        deadline = asDeadline(deadline)
+        if deadline is not None:
+            deadline.check('validation')
+
+        count = 0
+        started = instrument.start()
         vrset = self.vacs_service.validateModel(model)
-        for error in iterateResultSet(vrset): #listResultSet(vrset):
-            # have to manually cast things to get the type that will
-            # be able to compute the location... why can't these be
-            # computed properties...
-            errstr = error.description
-            errtype = error.isWarningOnly and 'Warning' or 'Error'
-            errnode = error.errorNode
-            # since offset appears to be specific to row and we don't
-            # calculate that, assume 1 to offset the xml header.
-            errrow, errcol = self.vacs_service.getPositionInXML(errnode, 1)
-
-            result.append('Line %d, Col %d: %s: %s' % 
-                (errrow, errcol, errtype, errstr))
+        instrument.record('validate', started)
+        for i in xrange(vrset.nValidityErrors):
+            if deadline is not None:
+                deadline.check('validation')
+            error = vrset.getValidityError(i)
+            if errors_only and error.isWarningOnly:
+                continue
+            yield ValidityError(self.vacs_service, error)
+            count += 1
+            if count == max_errors:
+                return
 
-        return result
+    def validateModel(self, model, max_errors=None, errors_only=False,
+            deadline=None):
+        """\
+        Validate model.
+
+        Returns the list of error messages, which are the partial result
+        of the DeadlineExceededError should the deadline be exceeded.
+        See iterValidateModel for the parameters.
+        """
+
+        messages = []
+        try:
+            for error in self.iterValidateModel(model, max_errors,
+                    errors_only, deadline):
+                messages.append(unicode(error))
+        except DeadlineExceededError, e:
+            e.partial = messages
+            raise
+        return messages
@@ -0,0 +1,218 @@
+"""\
+Functions that are run within the worker processes.
+
+As the CellML API is not reentrant, work that should be done in
+parallel is dispatched to separate processes, each of which holds its
+own instance of the utility.  Only picklable arguments (such as the
+serialised model trees) are passed to these functions.
+"""
+
+import cPickle
+import resource
+import time
+
+from cellml.api.pmr2.deadline import asDeadline
+from cellml.api.pmr2.interfaces import DeadlineExceededError
+from cellml.api.pmr2.interfaces import WorkerError
+from cellml.api.pmr2.ingest import boms
+
+_utility = None
+
+
+def getUtility():
+    """\
+    Return the utility of this worker process.
+    """
+
+    global _utility
+    if _utility is None:
+        from cellml.api.pmr2.utility import CellMLAPIUtility
+        _utility = CellMLAPIUtility()
+    return _utility
+
+
+def exportCeleds(job):
+    """\
+    Generate the code of a single language for a model tree.
+
+    job - tuple of the model tree, the language and the path to its
+          CeLEDS definition file.
+    """
+
+    tree, key, path = job
+    utility = getUtility()
+    if utility.celeds_definitions.get(key) != path:
+        utility.registerCeledsDefinition(key, path)
+    model = utility.loadModelTree(tree)
+    return key, utility.getCeledsExporter(key).generateCode(model)
+
+
+def isSource(item):
+    """\
+    Check whether the item is the source of a model rather than a URL.
+    """
+
+    if isinstance(item, str):
+        for bom, encoding in boms:
+            if item.startswith(bom):
+                return True
+    else:
+        # already decoded, so the byte order mark is a character.
+        item = item.lstrip(u'\ufeff')
+    return item.lstrip()[:1] == '<'
+
+
+def loadItem(utility, item, loader=None, deadline=None):
+    """\
+    Load the model from the item, which is either its URL or source.
+    """
+
+    if isSource(item):
+        return utility.loadModelFromText(item, loader=loader,
+            deadline=deadline)
+    return utility.loadModel(item, loader, deadline=deadline)
+
+
+def validateModel(job, utility=None):
+    """\
+    Load and validate a single model.
+
+    job - tuple of the index of the item, the item (either the URL or
+          the source of the model), the loader to use and the Deadline
+          of the whole batch, if any.
+
+    Returns a tuple of the index, the URL (None for sources), the list
+    of messages and a dictionary of the time taken by each stage.  Any
+    error that stops the model from being loaded or validated is the
+    last message, so it does not affect the other items of a batch.
+    """
+
+    index, item, loader, deadline = job
+    if utility is None:
+        utility = getUtility()
+    url = not isSource(item) and item or None
+    timings = {}
+
+    start = time.time()
+    try:
+        model = loadItem(utility, item, loader, deadline)
+    except Exception, e:
+        timings['load'] = time.time() - start
+        return index, url, ['Error: %s' % e], timings
+    timings['load'] = time.time() - start
+
+    start = time.time()
+    try:
+        messages = utility.validateModel(model, deadline=deadline)
+    except DeadlineExceededError, e:
+        messages = e.partial + ['Error: %s' % e]
+    except Exception, e:
+        messages = ['Error: %s' % e]
+    timings['validate'] = time.time() - start
+    return index, url, messages, timings
+
+
+# The jobs that can be run by serve, each taking the utility, the model
+# as a URL or source, and the loader as the first arguments.
+
+def loadJob(utility, item, loader=None, deadline=None):
+    return utility.dumpModelTree(loadItem(utility, item, loader, deadline))
+
+
+def validateJob(utility, item, loader=None, max_errors=None,
+        errors_only=False, deadline=None):
+    model = loadItem(utility, item, loader, deadline)
+    return utility.validateModel(model, max_errors, errors_only, deadline)
+
+
+def extractMathsJob(utility, item, loader=None, deadline=None):
+    model = loadItem(utility, item, loader, deadline)
+    return utility.extractMaths(model, deadline)
+
+
+def exportCeledsJob(utility, item, loader=None, language=None,
+        deadline=None):
+    model = loadItem(utility, item, loader, deadline)
+    return utility.exportCeleds(model, language, processes=1,
+        deadline=deadline)
+
+
+jobs = {
+    'loadModel': loadJob,
+    'validateModel': validateJob,
+    'extractMaths': extractMathsJob,
+    'exportCeleds': exportCeledsJob,
+}
+
+
+def picklableError(e):
+    """\
+    Return the exception, or a WorkerError with its type and message if
+    it cannot be pickled and unpickled again, such as HTTPError.
+    """
+
+    try:
+        cPickle.loads(cPickle.dumps(e, cPickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return WorkerError('%s: %s' % (type(e).__name__, e))
+    return e
+
+
+def rss():
+    """\
+    Return the peak resident set size of this process in bytes.
+    """
+
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def serve(conn, max_jobs=None, max_rss=None, settings=None):
+    """\
+    Serve the jobs received through the connection until it is closed,
+    or until this worker should be recycled.
+
+    settings - dictionary of the attributes to assign to the utility of
+               this worker, such as the resource limits of the loads.
+
+    Every job is a tuple of the name of the job, the arguments and the
+    keyword arguments.  Each is answered with a tuple of the status
+    ('ok' or 'error'), the result or the exception, and whether this
+    worker is exiting after this job.
+    """
+
+    utility = getUtility()
+    for name, value in (settings or {}).iteritems():
+        setattr(utility, name, value)
+    # warm up the services before any jobs arrive.
+    utility.model_loader
+    utility.vacs_service
+
+    count = 0
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        name, a, kw = job
+        if kw.get('deadline') is not None:
+            # shared by all the steps of the job.
+            kw['deadline'] = asDeadline(kw['deadline'])
+        try:
+            reply = ('ok', jobs[name](utility, *a, **kw))
+        except Exception, e:
+            reply = ('error', picklableError(e))
+
+        count += 1
+        recycle = bool((max_jobs and count >= max_jobs) or
+            (max_rss and rss() > max_rss))
+        try:
+            conn.send(reply + (recycle,))
+        except Exception, e:
+            # most likely the result or exception was not picklable.
+            conn.send(('error', WorkerError(repr(reply[1])), recycle))
+        if recycle:
+            return
@@ -27,8 +27,11 @@ setup(name='cellml.api.pmr2',
           # -*- Extra requirements: -*-
           'cgrspy',
           'lxml',
+          'zope.event',
       ],
       entry_points="""
       # -*- Entry points: -*-
+      [console_scripts]
+      cellml_api_benchmark = cellml.api.pmr2.benchmark:main
       """,
       )